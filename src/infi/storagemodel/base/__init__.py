@@ -28,6 +28,7 @@ class StorageModel(object):
 
     def __init__(self):
         super(StorageModel, self).__init__()
+        self._device_indexes = dict()
 
     @cached_method
     def get_scsi(self):
@@ -55,11 +56,40 @@ class StorageModel(object):
         """:returns: an instance of Mount Manager"""
         return self._create_mount_repository()
 
+    def get_device_index(self, index_class, devices):
+        """:returns: an instance of index_class, a :class:`.DeviceIdentityIndex` subclass, of the devices.
+        There is one index of every class per model; it is re-used as long as the model returns the same device
+        objects, and dropped on refresh()"""
+        index = self._device_indexes.get(index_class)
+        if index is None or not index.is_built_from(devices):
+            index = self._device_indexes[index_class] = index_class(devices)
+        return index
+
+    def get_identity_index(self):
+        """:returns: a :class:`.DeviceIdentityIndex` of the multipath and the non-multipath block devices,
+        see :meth:`get_device_index`"""
+        from .identity import DeviceIdentityIndex
+        block_devices = self.get_scsi().get_all_scsi_block_devices()
+        mp_devices = self.get_native_multipath().get_all_multipath_block_devices()
+        non_mp_devices = self.get_native_multipath().filter_non_multipath_scsi_block_devices(block_devices)
+        return self.get_device_index(DeviceIdentityIndex, mp_devices + non_mp_devices)
+
+    @cached_method
+    def get_device_snapshot(self):
+        """:returns: the identity keys of the multipath and the non-multipath block devices, for computing a
+        :class:`.DeviceDelta` between refreshes; see :func:`.build_device_snapshot`"""
+        from .delta import build_device_snapshot
+        block_devices = self.get_scsi().get_all_scsi_block_devices()
+        mp_devices = self.get_native_multipath().get_all_multipath_block_devices()
+        non_mp_devices = self.get_native_multipath().filter_non_multipath_scsi_block_devices(block_devices)
+        return build_device_snapshot(non_mp_devices, mp_devices)
+
     def refresh(self):
         """clears the model cache"""
         from ..connectivity import ConnectivityFactory
         clear_cache(self)
         clear_cache(ConnectivityFactory)
+        self._device_indexes.clear()
 
     def _try_predicate(self, predicate):
         """:returns: True/False if predicate returned, None on RescanIsNeeded exception"""
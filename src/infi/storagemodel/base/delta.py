@@ -0,0 +1,70 @@
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+SCSI_BLOCK_DEVICE = "scsi"
+MULTIPATH_BLOCK_DEVICE = "multipath"
+
+
+def get_scsi_block_device_identity(device):
+    """:returns: a tuple of the identity key (the HCTL) and the fingerprint (the block device path and the cached
+    WWID) of the device"""
+    return (SCSI_BLOCK_DEVICE, device.get_hctl()), (device.get_block_access_path(), device.get_cached_wwid())
+
+
+def get_multipath_block_device_identity(device):
+    """:returns: a tuple of the identity key (the block device path, e.g. the dm name) and the fingerprint (the path
+    ids and the cached WWID) of the device"""
+    return (MULTIPATH_BLOCK_DEVICE, device.get_block_access_path()), \
+        (tuple(sorted(path.get_path_id() for path in device.get_paths())), device.get_cached_wwid())
+
+
+def build_device_snapshot(scsi_block_devices, multipath_block_devices):
+    """:returns: a dict of identity key to a tuple of the fingerprint and the device.
+
+    The keys and the fingerprints are made of what the platform knows without SCSI I/O (HCTLs, device names, path
+    names and the WWIDs the platform cached, see :meth:`.InquiryInformationMixin.get_cached_wwid`), so building a
+    snapshot does not send any commands to the devices. On platforms that do not cache WWIDs, a volume that is
+    unmapped and another volume that is mapped at the same LUN number keep the same device, and are not in the delta"""
+    snapshot = dict()
+    for get_identity, devices in ((get_scsi_block_device_identity, scsi_block_devices),
+                                  (get_multipath_block_device_identity, multipath_block_devices)):
+        for device in devices:
+            key, fingerprint = get_identity(device)
+            snapshot[key] = (fingerprint, device)
+    return snapshot
+
+
+class DeviceDelta(object):
+    """The devices that were added, removed or changed between two snapshots.
+    Every attribute is a dict of identity key to device; removed devices are the devices of the previous snapshot"""
+
+    def __init__(self, added, removed, changed):
+        super(DeviceDelta, self).__init__()
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return "<DeviceDelta: {} added, {} removed, {} changed>".format(len(self.added), len(self.removed),
+                                                                         len(self.changed))
+
+
+def get_device_delta(previous, current):
+    """:param previous: a snapshot as returned by :func:`build_device_snapshot`, or None if there is no previous one
+    :returns: a :class:`DeviceDelta` from the previous snapshot to the current one"""
+    if previous is None:
+        return DeviceDelta(dict((key, device) for key, (_, device) in current.iteritems()), {}, {})
+    if previous is current:
+        return DeviceDelta({}, {}, {})
+    added, changed = dict(), dict()
+    for key, (fingerprint, device) in current.iteritems():
+        if key not in previous:
+            added[key] = device
+        elif previous[key][0] != fingerprint:
+            changed[key] = device
+    removed = dict((key, device) for key, (_, device) in previous.iteritems() if key not in current)
+    return DeviceDelta(added, removed, changed)
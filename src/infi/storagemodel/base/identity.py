@@ -0,0 +1,104 @@
+from infi.pyutils.lazy import cached_method
+from logging import getLogger
+from ..utils import get_pool
+
+logger = getLogger(__name__)
+
+INQUIRY_CONCURRENCY = 16
+NAA_DESIGNATOR_TYPE = 3
+# Linux prefixes NAA identifiers with the SCSI name string type 3 to make a WWID, e.g. 36742b0f000004e2b000000000000018c
+NAA_WWID_PREFIX = "3"
+
+
+def _get_designator_identifier(designator):
+    # infi.instruct buffers serialize with pack(), older structs with str(); both include the 4 bytes header
+    data = designator.pack() if hasattr(designator, "pack") else str(designator)
+    return str(data)[4:]
+
+
+def get_naa_identifiers(device):
+    """:returns: a list of the NAA identifiers of the device as hex strings, e.g. 6742b0f000004e2b000000000000018c"""
+    from infi.asi.cdb.inquiry.vpd_pages import INQUIRY_PAGE_DEVICE_IDENTIFICATION
+    pages = device.get_scsi_inquiry_pages()
+    if INQUIRY_PAGE_DEVICE_IDENTIFICATION not in pages:
+        return []
+    return [_get_designator_identifier(designator).encode("hex")
+            for designator in pages[INQUIRY_PAGE_DEVICE_IDENTIFICATION].designators_list
+            if designator.designator_type == NAA_DESIGNATOR_TYPE]
+
+
+class DeviceIdentityIndex(object):
+    """Maps SCSI serial numbers, NAA identifiers and WWIDs to the block devices that have them.
+
+    Every kind of identifier is collected on the first lookup of that kind, by sending the inquiries to all the
+    devices in parallel (at most `concurrency` at a time); later lookups are dict lookups. Errors raised by the
+    inquiries, such as :exc:`.RescanIsNeeded`, are raised from the lookup, so a predicate fails the same way as it
+    would when querying the devices one by one."""
+
+    def __init__(self, devices, concurrency=INQUIRY_CONCURRENCY):
+        super(DeviceIdentityIndex, self).__init__()
+        self._devices = devices
+        self._concurrency = concurrency
+
+    def is_built_from(self, devices):
+        """:returns: True if the index is of exactly these device objects"""
+        return len(devices) == len(self._devices) and all(a is b for a, b in zip(devices, self._devices))
+
+    def _inquire_all(self, func):
+        """:returns: a list of the results of func for every device, in the order of the devices"""
+        if len(self._devices) < 2:
+            return [func(device) for device in self._devices]
+        pool = get_pool(min(self._concurrency, len(self._devices)))
+        try:
+            return list(pool.imap(func, self._devices))
+        finally:
+            if hasattr(pool, "close"):
+                pool.close()
+
+    def _build(self, func):
+        index = dict()
+        for device, identifiers in zip(self._devices, self._inquire_all(func)):
+            for identifier in identifiers:
+                index.setdefault(identifier, []).append(device)
+        return index
+
+    @classmethod
+    def _get_serial_numbers(cls, device):
+        device.get_scsi_test_unit_ready()
+        return [device.get_scsi_serial_number()]
+
+    @classmethod
+    def _get_naa_identifiers(cls, device):
+        device.get_scsi_test_unit_ready()
+        return get_naa_identifiers(device)
+
+    @cached_method
+    def get_serial_number_index(self):
+        """:returns: a dict of SCSI serial number to the list of devices that have it"""
+        return self._build(self._get_serial_numbers)
+
+    @cached_method
+    def get_naa_index(self):
+        """:returns: a dict of NAA identifier (hex string) to the list of devices that have it"""
+        return self._build(self._get_naa_identifiers)
+
+    @cached_method
+    def get_wwid_index(self):
+        """:returns: a dict of WWID (the NAA identifier with the type 3 prefix) to the list of devices that have it"""
+        return dict((NAA_WWID_PREFIX + naa, devices) for naa, devices in self.get_naa_index().items())
+
+    def find_devices_by_serial_number(self, serial_number):
+        """:returns: the list of devices with the SCSI serial number, empty if there are none"""
+        return list(self.get_serial_number_index().get(serial_number, []))
+
+    def find_devices_by_naa(self, naa):
+        """:param naa: a hex string, optionally with a "naa." prefix like the string of :class:`.InfinidatNAA`
+        :returns: the list of devices with the NAA identifier, empty if there are none"""
+        naa = naa.lower()
+        if naa.startswith("naa."):
+            naa = naa[len("naa."):]
+        return list(self.get_naa_index().get(naa, []))
+
+    def find_devices_by_wwid(self, wwid):
+        """:returns: the list of devices with the WWID, empty if there are none"""
+        return list(self.get_wwid_index().get(wwid.lower(), []))
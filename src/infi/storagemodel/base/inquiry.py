@@ -23,6 +23,11 @@ class SupportedVPDPagesDict(LazyImmutableDict):
 
 
 class InquiryInformationMixin(object):
+    def get_cached_wwid(self):
+        """:returns: the WWID of the device as the operating system cached it when it discovered the device, without
+        sending any SCSI commands, or None if the platform does not cache it"""
+        return None
+
     @cached_method
     def get_scsi_vendor_id_or_unknown_on_error(self):
         """:returns: ('<unknown>', '<unknown>') on unexpected error instead of raising exception"""
@@ -1,43 +1,93 @@
-from itertools import chain
 from infi.pyutils.lazy import cached_method
 from contextlib import contextmanager
 from .inquiry import InquiryInformationMixin
 
 
 class MultipathFrameworkModel(object):
+    def _build_path_ownership_index(self, multipath_devices):
+        index = dict()
+        for multipath in multipath_devices:
+            for path in multipath.get_paths():
+                index[path.get_hctl()] = multipath
+        return index
+
+    @cached_method
+    def get_block_device_path_ownership_index(self):
+        """:returns: a dict of HCTL to the :class:`MultipathBlockDevice` that owns the path with that HCTL"""
+        return self._build_path_ownership_index(self.get_all_multipath_block_devices())
+
+    @cached_method
+    def get_storage_controller_path_ownership_index(self):
+        """:returns: a dict of HCTL to the :class:`MultipathStorageController` that owns the path with that HCTL"""
+        return self._build_path_ownership_index(self.get_all_multipath_storage_controller_devices())
+
+    def get_owner(self, scsi_device):
+        """:returns: the multipath device claimed by this framework that has the SCSI device as one of its paths,
+        or None if the SCSI device is not part of any multipath device"""
+        hctl = scsi_device.get_hctl()
+        return self.get_block_device_path_ownership_index().get(hctl) or \
+            self.get_storage_controller_path_ownership_index().get(hctl)
+
     def filter_non_multipath_scsi_block_devices(self, scsi_block_devices):
         """:returns: items from the list that are not part of multipath devices claimed by this framework"""
-        hctl_list = [path.get_hctl() for path in chain.from_iterable(multipath.get_paths()
-                                                                     for multipath in self.get_all_multipath_block_devices())]
-        return filter(lambda device: device.get_hctl() not in hctl_list, scsi_block_devices)
+        index = self.get_block_device_path_ownership_index()
+        return [device for device in scsi_block_devices if device.get_hctl() not in index]
 
     def filter_non_multipath_scsi_storage_controller_devices(self, scsi_controller_devices):
         """:returns: items from the list that are not part of multipath devices claimed by this framework"""
-        hctl_list = [path.get_hctl() for path in chain.from_iterable(multipath.get_paths()
-                                                                     for multipath in self.get_all_multipath_storage_controller_devices())]
-        return filter(lambda device: device.get_hctl() not in hctl_list, scsi_controller_devices)
+        index = self.get_storage_controller_path_ownership_index()
+        return [device for device in scsi_controller_devices if device.get_hctl() not in index]
 
     def filter_vendor_specific_devices(self, devices, vid_pid_tuple):
         """:returns: only the items from the devices list that are of the specific type"""
         return filter(lambda device: device.get_scsi_vendor_id_or_unknown_on_error() == vid_pid_tuple, devices)
 
+    @cached_method
+    def get_block_access_path_alias_index(self):
+        """:returns: a dict of every known path/alias to the :class:`MultipathBlockDevice` it refers to"""
+        index = dict()
+        for device in self.get_all_multipath_block_devices():
+            for alias in [device.get_block_access_path()] + device.get_block_access_path_aliases():
+                index.setdefault(alias, device)
+        return index
+
+    @cached_method
+    def _get_case_insensitive_block_access_path_alias_index(self):
+        index = dict()
+        for alias, device in self.get_block_access_path_alias_index().items():
+            index.setdefault(alias.lower(), device)
+        return index
+
+    def _clear_indexes(self):
+        """forgets the path ownership and alias indexes, for models that patch their devices instead of being
+        rebuilt"""
+        from infi.pyutils.lazy import clear_cached_entry
+        for method in (self.get_block_device_path_ownership_index, self.get_storage_controller_path_ownership_index,
+                       self.get_block_access_path_alias_index, self._get_case_insensitive_block_access_path_alias_index):
+            clear_cached_entry(method)
+
     def find_multipath_device_by_block_access_path(self, path):
         """:returns: :class:`MultipathBlockDevice` object that matches the given path.
         :raises: KeyError if no such device is found"""
-        from infi.storagemodel.linux.native_multipath import LinuxNativeMultipathBlockDevice
-        from infi.storagemodel.windows.native_multipath import WindowsNativeMultipathBlockDevice
-        devices_dict = dict([(device.get_block_access_path(), device) for device in self.get_all_multipath_block_devices()])
-        for value in devices_dict.values():
-            if isinstance(value, LinuxNativeMultipathBlockDevice):
-                devices_dict[value.get_device_mapper_access_path()] = value
-            if isinstance(value, WindowsNativeMultipathBlockDevice):
-                devices_dict[r"\\.\{}".format(value.get_display_name())] = value
-        if path in devices_dict:
-            return devices_dict[path]
-        if path.upper() in devices_dict:
-            return devices_dict[path.upper()]
+        index = self.get_block_access_path_alias_index()
+        if path in index:
+            return index[path]
+        case_insensitive_index = self._get_case_insensitive_block_access_path_alias_index()
+        if path.lower() in case_insensitive_index:
+            return case_insensitive_index[path.lower()]
         raise KeyError(path)
 
+    def find_multipath_devices_by_block_access_paths(self, paths):
+        """:returns: a dict of path to the :class:`MultipathBlockDevice` that matches it.
+        Paths that do not match any device are not in the dict"""
+        result = dict()
+        for path in paths:
+            try:
+                result[path] = self.find_multipath_device_by_block_access_path(path)
+            except KeyError:
+                pass
+        return result
+
     #############################
     # Platform Specific Methods #
     #############################
@@ -137,6 +187,12 @@ class MultipathBlockDevice(InquiryInformationMixin, MultipathDevice):
         # platform implementation
         raise NotImplementedError()
 
+    @cached_method
+    def get_block_access_path_aliases(self):
+        """:returns: a list of other paths and names that refer to this device"""
+        # platform implementation
+        return []
+
     @cached_method
     def get_display_name(self):  # pragma: no cover
         """:returns: a string represtation for the device"""
@@ -161,6 +217,14 @@ class MultipathBlockDevice(InquiryInformationMixin, MultipathDevice):
         # platform implementation
         raise NotImplementedError()
 
+    def get_active_path_group_path_ids(self):
+        """:returns: the ids of the paths in the active path group, if the device has more than one path group (e.g.
+        with ALUA, where the paths of the standby groups are up but carry no I/O), or None if it has a single path
+        group or the platform does not tell.
+        :raises: ValueError if there is not exactly one active path group"""
+        # platform implementation
+        return None
+
     def __repr__(self):
         return "<MultipathBlockDevice {} for {}>".format(self.get_block_access_path(), self.get_display_name())
 
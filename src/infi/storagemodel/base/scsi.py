@@ -13,7 +13,7 @@ logger = getLogger(__name__)
 class SCSIDevice(InquiryInformationMixin, object):
     @cached_method
     def get_connectivity(self):
-        """:returns: a :class:`.FCConnectivity` instance, for now."""
+        """:returns: a :class:`.FCConnectivity` or :class:`.ISCSIConnectivity` instance, or a `LocalConnectivity`"""
         from ..connectivity import ConnectivityFactory
         return ConnectivityFactory.get_by_device_with_hctl(self)
 
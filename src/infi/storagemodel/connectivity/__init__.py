@@ -1,15 +1,23 @@
 
-from infi.pyutils.lazy import cached_method
+from infi.pyutils.lazy import cached_method, clear_cache
 from infi.dtypes.wwn import WWN
 from infi.hbaapi import Port
 
+def get_wwn_key(wwn):
+    """:param wwn: a :class:`WWN`, a :class:`Port` or anything :class:`WWN` accepts
+    :returns: the normalized address of the WWN as an interned string, e.g. 0102030405060708"""
+    if isinstance(wwn, Port):
+        wwn = wwn.port_wwn
+    return intern(str(WWN(wwn)))
+
 class FCConnectivity(object):
     """Fibre Channel Connectivity Information """
-    def __init__(self, device, local_port, remote_port):
+    def __init__(self, device, local_port, remote_port, key=None):
         super(FCConnectivity, self).__init__()
         self._device = device
         self._local_port = local_port
         self._remote_port = remote_port
+        self._key = key
 
     @cached_method
     def get_initiator_wwn(self):
@@ -29,10 +37,18 @@ class FCConnectivity(object):
             return WWN(self._remote_port.port_wwn)
         return WWN(self._remote_port)
 
+    @cached_method
+    def get_key(self):
+        """:returns: a hashable (initiator, target) key of normalized WWN strings, equal for equal connectivities"""
+        if self._key is not None:
+            return self._key
+        return (get_wwn_key(self._local_port), get_wwn_key(self._remote_port))
+
+    def __hash__(self):
+        return hash(self.get_key())
+
     def __eq__(self, obj):
-        return isinstance(obj, FCConnectivity) and \
-             self.get_initiator_wwn() == obj.get_initiator_wwn() and \
-             self.get_target_wwn() == obj.get_target_wwn()
+        return isinstance(obj, FCConnectivity) and self.get_key() == obj.get_key()
 
     def __ne__(self, obj):
         return not self.__eq__(obj)
@@ -40,12 +56,194 @@ class FCConnectivity(object):
     def __repr__(self):
         return "<FCConnectivity: Initiator {} <--> Target {}>".format(self.get_initiator_wwn(), self.get_target_wwn())
 
+def get_iqn_key(iqn):
+    """:returns: the iSCSI name in lowercase as an interned string, or None if the name is unknown (None); iSCSI names
+    are not case sensitive"""
+    return None if iqn is None else intern(str(iqn).strip().lower())
+
+class ISCSIConnectivity(object):
+    """iSCSI Connectivity Information """
+    def __init__(self, device, initiator_iqn, target_iqn, target_portal=None, tpgt=None, key=None):
+        super(ISCSIConnectivity, self).__init__()
+        self._device = device
+        self._initiator_iqn = initiator_iqn
+        self._target_iqn = target_iqn
+        self._target_portal = target_portal
+        self._tpgt = tpgt
+        self._key = key
+
+    def get_initiator_iqn(self):
+        """:returns: the iSCSI name of the initiator"""
+        return self._initiator_iqn
+
+    def get_target_iqn(self):
+        """:returns: the iSCSI name of the target"""
+        return self._target_iqn
+
+    def get_target_portal(self):
+        """:returns: the (address, port) tuple of the portal the session is connected to, or None if unknown"""
+        return self._target_portal
+
+    def get_tpgt(self):
+        """:returns: the target portal group tag of the session, or None if unknown"""
+        return self._tpgt
+
+    @cached_method
+    def get_key(self):
+        """:returns: a hashable (initiator, target) key of normalized iSCSI names, equal for equal connectivities"""
+        if self._key is not None:
+            return self._key
+        return (get_iqn_key(self._initiator_iqn), get_iqn_key(self._target_iqn))
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def __eq__(self, obj):
+        return isinstance(obj, ISCSIConnectivity) and self.get_key() == obj.get_key()
+
+    def __ne__(self, obj):
+        return not self.__eq__(obj)
+
+    def __repr__(self):
+        return "<ISCSIConnectivity: Initiator {} <--> Target {} ({})>".format(self._initiator_iqn, self._target_iqn,
+                                                                              self._target_portal)
+
+def get_sas_address_key(sas_address):
+    """:returns: the SAS address as an interned lowercase hex string without the 0x prefix, e.g. 5000c50012345678"""
+    address = str(sas_address).strip().lower()
+    if address.startswith("0x"):
+        address = address[2:]
+    return intern(address)
+
+def _get_optional_sas_address_key(sas_address):
+    return None if sas_address is None else get_sas_address_key(sas_address)
+
+class SASConnectivity(object):
+    """Serial Attached SCSI Connectivity Information """
+    def __init__(self, device, initiator_sas_address, target_sas_address, expander_sas_address=None,
+                 enclosure_identifier=None, bay_identifier=None, key=None):
+        super(SASConnectivity, self).__init__()
+        self._device = device
+        self._initiator_sas_address = initiator_sas_address
+        self._target_sas_address = target_sas_address
+        self._expander_sas_address = expander_sas_address
+        self._enclosure_identifier = enclosure_identifier
+        self._bay_identifier = bay_identifier
+        self._key = key
+
+    def get_initiator_sas_address(self):
+        """:returns: the sas address of the host port the device is reached through, or None if unknown"""
+        return self._initiator_sas_address
+
+    def get_target_sas_address(self):
+        """:returns: the sas address of the end device"""
+        return self._target_sas_address
+
+    def get_expander_sas_address(self):
+        """:returns: the sas address of the expander the end device is attached to, or None if it is attached
+        directly to the host"""
+        return self._expander_sas_address
+
+    def get_enclosure_identifier(self):
+        return self._enclosure_identifier
+
+    def get_bay_identifier(self):
+        return self._bay_identifier
+
+    @cached_method
+    def get_key(self):
+        """:returns: a hashable (initiator, target) key of normalized SAS addresses, equal for equal connectivities"""
+        if self._key is not None:
+            return self._key
+        return (_get_optional_sas_address_key(self._initiator_sas_address),
+                _get_optional_sas_address_key(self._target_sas_address))
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def __eq__(self, obj):
+        return isinstance(obj, SASConnectivity) and self.get_key() == obj.get_key()
+
+    def __ne__(self, obj):
+        return not self.__eq__(obj)
+
+    def __repr__(self):
+        return "<SASConnectivity: Initiator {} <--> Target {} (expander {})>".format(
+            self._initiator_sas_address, self._target_sas_address, self._expander_sas_address)
+
 class LocalConnectivity(object):
     pass
 
+def group_by_connectivity(devices):
+    """:param devices: devices or paths, anything with a get_connectivity() method
+    :returns: a dict of connectivity to the list of devices that have an equal connectivity, i.e. the same initiator
+    and target; devices with a :class:`LocalConnectivity` are under None"""
+    groups = dict()
+    for device in devices:
+        connectivity = device.get_connectivity()
+        groups.setdefault(None if isinstance(connectivity, LocalConnectivity) else connectivity, []).append(device)
+    return groups
+
+def _get_fc_mapping_key(mapping):
+    local_port, remote_port = mapping
+    return (get_wwn_key(local_port), get_wwn_key(remote_port))
+
+def _get_iscsi_session_key(session):
+    return (get_iqn_key(session.initiator_iqn), get_iqn_key(session.target_iqn))
+
+def _get_sas_end_device_key(end_device):
+    return (_get_optional_sas_address_key(end_device.host_phys[0].sas_address if end_device.host_phys else None),
+            _get_optional_sas_address_key(end_device.sas_address))
+
 class ConnectivityFactoryImpl(object):
+    def __init__(self):
+        super(ConnectivityFactoryImpl, self).__init__()
+        # the provider keeps its own generation across refresh(), so it is not a cached_method
+        self.fc_hctl_provider = None
+        self.iscsi_hctl_provider = None
+        self.sas_hctl_provider = None
+        # the connectivity keys of every mappings dict, computed once per dict since the providers return the same
+        # dict while their generation does not change
+        self._hctl_keys = dict()
+
+    def set_fc_hctl_provider(self, provider):
+        """:param provider: an object with get_fc_hctl_mappings() and is_available(), such as
+        :class:`.linux.fc.SysfsFCHCTLProvider`, or None to get the mappings from :mod:`infi.hbaapi`"""
+        self.fc_hctl_provider = provider
+        clear_cache(self)
+
+    def set_iscsi_hctl_provider(self, provider):
+        """:param provider: an object with get_iscsi_hctl_mappings() and is_available(), such as
+        :class:`.linux.iscsi.SysfsISCSIProvider`, or None if there is no iSCSI support on this platform"""
+        self.iscsi_hctl_provider = provider
+        clear_cache(self)
+
+    @cached_method
+    def get_iscsi_hctl_mappings(self):
+        """:returns: a dict of (host, channel, target) to a session object with initiator_iqn, target_iqn,
+        target_portal and tpgt attributes"""
+        if self.iscsi_hctl_provider is None or not self.iscsi_hctl_provider.is_available():
+            return {}
+        return self.iscsi_hctl_provider.get_iscsi_hctl_mappings()
+
+    def set_sas_hctl_provider(self, provider):
+        """:param provider: an object with get_sas_hctl_mappings() and is_available(), such as
+        :class:`.linux.sas.SysfsSASTopology`, or None if there is no SAS support on this platform"""
+        self.sas_hctl_provider = provider
+        clear_cache(self)
+
+    @cached_method
+    def get_sas_hctl_mappings(self):
+        """:returns: a dict of (host, channel, target) to an end device object with sas_address, expander,
+        host_phys, enclosure_identifier and bay_identifier attributes"""
+        if self.sas_hctl_provider is None or not self.sas_hctl_provider.is_available():
+            return {}
+        return self.sas_hctl_provider.get_sas_hctl_mappings()
+
     @cached_method
     def get_fc_hctl_mappings(self):
+        if self.fc_hctl_provider is not None and self.fc_hctl_provider.is_available():
+            return self.fc_hctl_provider.get_fc_hctl_mappings()
         from infi.hbaapi import get_ports_generator
         result = {}
         for local_port in get_ports_generator().iter_ports():
@@ -53,15 +251,38 @@ class ConnectivityFactoryImpl(object):
                 result[remote_port.hct] = (local_port, remote_port,)
         return result
 
+    def _get_hctl_keys(self, name, mappings, get_key):
+        """:returns: a dict of (host, channel, target) to the connectivity key of the mapping"""
+        cached_mappings, keys = self._hctl_keys.get(name, (None, None))
+        if cached_mappings is not mappings:
+            keys = dict((hct, get_key(mapping)) for hct, mapping in mappings.iteritems())
+            self._hctl_keys[name] = (mappings, keys)
+        return keys
+
     def get_by_device_with_hctl(self, device):
         hct = (device.get_hctl().get_host(),
                device.get_hctl().get_channel(),
                device.get_hctl().get_target())
-        fc_mapping = self.get_fc_hctl_mappings().get(hct, None)
-        if fc_mapping is not None:
-            local_port, remote_port = fc_mapping
-            return FCConnectivity(device, local_port, remote_port)
-        # TODO add iSCSI support
+        fc_mappings = self.get_fc_hctl_mappings()
+        if hct in fc_mappings:
+            local_port, remote_port = fc_mappings[hct]
+            key = self._get_hctl_keys("fc", fc_mappings, _get_fc_mapping_key)[hct]
+            return FCConnectivity(device, local_port, remote_port, key)
+        iscsi_mappings = self.get_iscsi_hctl_mappings()
+        if hct in iscsi_mappings:
+            session = iscsi_mappings[hct]
+            key = self._get_hctl_keys("iscsi", iscsi_mappings, _get_iscsi_session_key)[hct]
+            return ISCSIConnectivity(device, session.initiator_iqn, session.target_iqn,
+                                     session.target_portal, session.tpgt, key)
+        sas_mappings = self.get_sas_hctl_mappings()
+        if hct in sas_mappings:
+            end_device = sas_mappings[hct]
+            key = self._get_hctl_keys("sas", sas_mappings, _get_sas_end_device_key)[hct]
+            return SASConnectivity(device,
+                                   end_device.host_phys[0].sas_address if end_device.host_phys else None,
+                                   end_device.sas_address,
+                                   end_device.expander.sas_address if end_device.expander is not None else None,
+                                   end_device.enclosure_identifier, end_device.bay_identifier, key)
         return LocalConnectivity()
 
 ConnectivityFactory = ConnectivityFactoryImpl()
@@ -1,6 +1,7 @@
 from unittest import TestCase
 
-from . import FCConnectivity, LocalConnectivity
+from infi.dtypes.wwn import WWN
+from . import FCConnectivity, ISCSIConnectivity, LocalConnectivity, ConnectivityFactoryImpl, group_by_connectivity
 
 SRC = "0x0102030405060708"
 DST = "0x0203040506070809"
@@ -22,3 +23,68 @@ class TestEquality(TestCase):
         a = FCConnectivity(None, SRC, SRC)
         b = FCConnectivity(None, SRC, SRC)
         self.assertEqual(a, b)
+
+    def test_keys(self):
+        a = FCConnectivity(None, SRC, DST)
+        b = FCConnectivity(None, "01:02:03:04:05:06:07:08", WWN(DST))
+        self.assertEqual(a.get_key(), ("0102030405060708", "0203040506070809"))
+        self.assertEqual(a.get_key(), b.get_key())
+        self.assertIs(a.get_key()[0], b.get_key()[0])
+        self.assertEqual(len(set([a, b])), 1)
+
+    def test_iscsi(self):
+        a = ISCSIConnectivity(None, "iqn.1994-05.com.redhat:host1", "iqn.2009-11.com.infinidat:storage:sn-1",
+                              ("10.0.0.1", 3260), 1)
+        b = ISCSIConnectivity(None, "IQN.1994-05.com.redhat:host1", "iqn.2009-11.com.infinidat:storage:sn-1")
+        self.assertEqual(a, b)
+        self.assertEqual(len(set([a, b])), 1)
+        self.assertNotEqual(a, FCConnectivity(None, SRC, DST))
+        self.assertNotEqual(a, ISCSIConnectivity(None, "iqn.1994-05.com.redhat:host1", "iqn.2009-11.com.other:sn-1"))
+
+    def test_iscsi_unknown_initiator(self):
+        target_iqn = "iqn.2009-11.com.infinidat:storage:sn-1"
+        unknown = ISCSIConnectivity(None, None, target_iqn)
+        self.assertEqual(unknown.get_key(), (None, target_iqn))
+        self.assertNotEqual(unknown, ISCSIConnectivity(None, "none", target_iqn))
+
+
+class Device(object):
+    def __init__(self, hctl):
+        self.hctl = hctl
+
+    def get_hctl(self):
+        return self.hctl
+
+    def get_connectivity(self):
+        return self.connectivity
+
+
+class TestKeys(TestCase):
+    def setUp(self):
+        from infi.hbaapi import Port
+        local_port, remote_port = Port(), Port()
+        local_port.port_wwn, remote_port.port_wwn = WWN(SRC), WWN(DST)
+        self.factory = ConnectivityFactoryImpl()
+        self.mappings = {(1, 0, 0): (local_port, remote_port), (1, 0, 1): (local_port, WWN(SRC))}
+        self.factory.get_fc_hctl_mappings = lambda: self.mappings
+
+    def _get_devices(self):
+        from infi.dtypes.hctl import HCTL
+        devices = [Device(HCTL(1, 0, target, lun)) for target in (0, 1, 2) for lun in range(3)]
+        for device in devices:
+            device.connectivity = self.factory.get_by_device_with_hctl(device)
+        return devices
+
+    def test_keys_are_computed_once_per_mappings(self):
+        first, second = [self.factory.get_by_device_with_hctl(device) for device in self._get_devices()[:2]]
+        self.assertIs(first.get_key(), second.get_key())
+        self.assertEqual(first, FCConnectivity(None, SRC, DST))
+        self.mappings = dict(self.mappings)
+        self.assertIsNot(self.factory.get_by_device_with_hctl(self._get_devices()[0]).get_key(), first.get_key())
+
+    def test_group_by_connectivity(self):
+        devices = self._get_devices()
+        groups = group_by_connectivity(devices)
+        self.assertEqual(sorted(len(group) for group in groups.values()), [3, 3, 3])
+        self.assertEqual(groups[FCConnectivity(None, SRC, DST)], devices[:3])
+        self.assertEqual(groups[None], devices[6:])
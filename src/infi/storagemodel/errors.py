@@ -1,6 +1,7 @@
 
 from infi.exceptools import InfiException, chain
 from infi.pyutils.decorators import wraps
+from .utils import sleep
 
 from logging import getLogger
 logger = getLogger(__name__)
@@ -87,38 +88,120 @@ def safe_repr(obj):
     except:
         return object.__repr__(obj)
 
+# check conditions that mean the cached model no longer describes the device, and only a rescan can fix that
+CHECK_CONDITIONS_THAT_INVALIDATE_THE_MODEL = [
+    ('UNIT_ATTENTION', 'REPORTED LUNS DATA HAS CHANGED'),
+    ('UNIT_ATTENTION', 'INQUIRY DATA HAS CHANGED'),
+    ('UNIT_ATTENTION', 'CAPACITY DATA HAS CHANGED'),
+    ('ILLEGAL_REQUEST', 'LOGICAL UNIT NOT SUPPORTED'),
+]
+
+# infi.asi reports a full request queue as an exception and not as a check condition
+QUEUE_FULL = ('QUEUE_FULL', None)
+
+DEFAULT_SCSI_RETRIES = {
+    ('UNIT_ATTENTION', 'POWER ON OCCURRED'): 3,
+    ('UNIT_ATTENTION', 'BUS DEVICE RESET FUNCTION OCCURRED'): 3,
+    ('UNIT_ATTENTION', 'ASYMMETRIC ACCESS STATE CHANGED'): 3,
+    ('ABORTED_COMMAND', 'COMMANDS CLEARED BY DEVICE SERVER'): 3,
+    QUEUE_FULL: 5,
+}
+
+
+class SCSIRetryPolicy(object):
+    """Decides how :func:`check_for_scsi_errors` handles the conditions in ``CHECK_CONDITIONS_TO_CHECK``.
+
+    Transient conditions (e.g. a unit attention after an ALUA transition) are retried in-place, with an exponential
+    backoff between the attempts. Conditions that invalidate the model, or transient conditions that did not clear
+    after all the retries, raise :exc:`RescanIsNeeded`.
+
+    :param retries: a dict of (sense_key, additional_sense_code) to the number of retries
+    :param invalidating_conditions: a list of (sense_key, additional_sense_code) that are never retried
+    """
+    def __init__(self, retries=None, invalidating_conditions=None,
+                 backoff_in_seconds=0.1, backoff_multiplier=2, max_backoff_in_seconds=2):
+        super(SCSIRetryPolicy, self).__init__()
+        self.retries = dict(DEFAULT_SCSI_RETRIES if retries is None else retries)
+        self.invalidating_conditions = list(CHECK_CONDITIONS_THAT_INVALIDATE_THE_MODEL
+                                            if invalidating_conditions is None else invalidating_conditions)
+        self.backoff_in_seconds = backoff_in_seconds
+        self.backoff_multiplier = backoff_multiplier
+        self.max_backoff_in_seconds = max_backoff_in_seconds
+
+    def is_invalidating_the_model(self, condition):
+        """:returns: True if the condition should escalate to a rescan without retrying"""
+        return condition in self.invalidating_conditions
+
+    def get_retry_count(self, condition):
+        """:returns: the number of times to retry a command that got the condition"""
+        if self.is_invalidating_the_model(condition):
+            return 0
+        return self.retries.get(condition, 0)
+
+    def get_backoff_in_seconds(self, attempt):
+        """:returns: the time to wait before the given retry attempt (starting from 1)"""
+        backoff = self.backoff_in_seconds * (self.backoff_multiplier ** (attempt - 1))
+        return min(backoff, self.max_backoff_in_seconds)
+
+    def __repr__(self):
+        return "<SCSIRetryPolicy: retries={!r}, invalidating_conditions={!r}>".format(self.retries,
+                                                                                    self.invalidating_conditions)
+
+__scsi_retry_policy = SCSIRetryPolicy()
+
+def get_scsi_retry_policy():
+    """:returns: the global :class:`SCSIRetryPolicy` instance"""
+    return __scsi_retry_policy
+
+def set_scsi_retry_policy(policy):
+    """replaces the global :class:`SCSIRetryPolicy` instance"""
+    # pylint: disable=W0603,C0103
+    global __scsi_retry_policy
+    __scsi_retry_policy = policy
+
 def check_for_scsi_errors(func):
     from infi.asi.errors import AsiOSError, AsiSCSIError, AsiCheckConditionError, AsiRequestQueueFullError
     from sys import exc_info
+
+    def _retry_or_raise_rescan_is_needed(condition, attempt, msg):
+        policy = get_scsi_retry_policy()
+        if attempt <= policy.get_retry_count(condition):
+            logger.debug("{}, retry {} of {}".format(msg, attempt, policy.get_retry_count(condition)))
+            sleep(policy.get_backoff_in_seconds(attempt))
+            return
+        logger.debug(msg)
+        raise chain(RescanIsNeeded(msg))
+
     @wraps(func)
     def callable(*args, **kwargs):
-        try:
-            device = args[0]
-            logger.debug("Sending SCSI command {!r} for device {!r}".format(func, safe_repr(device)))
-            response = func(*args, **kwargs)
-            logger.debug("Got response {!r}".format(response))
-            return response
-        except AsiCheckConditionError, e:
-            if not e.sense_obj:
-                msg = "got no sense from device {!r} during {!r}".format(safe_repr(device), func)
+        device = args[0]
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                logger.debug("Sending SCSI command {!r} for device {!r}".format(func, safe_repr(device)))
+                response = func(*args, **kwargs)
+                logger.debug("Got response {!r}".format(response))
+                return response
+            except AsiCheckConditionError, e:
+                if not e.sense_obj:
+                    msg = "got no sense from device {!r} during {!r}".format(safe_repr(device), func)
+                    logger.error(msg, exc_info=exc_info())
+                    raise chain(DeviceDisappeared(msg))
+                (key, code) = (e.sense_obj.sense_key, e.sense_obj.additional_sense_code.code_name)
+                if (key, code) not in CHECK_CONDITIONS_TO_CHECK:
+                    raise
+                msg = "device {!r} got {} {}".format(device, key, code)
+                _retry_or_raise_rescan_is_needed((key, code), attempt, msg)
+            except AsiRequestQueueFullError, e:
+                msg = "got queue full from device {!r} during {!r}".format(safe_repr(device), func)
+                _retry_or_raise_rescan_is_needed(QUEUE_FULL, attempt, msg)
+            except AsiSCSIError as error:
+                msg = "device {!r} disappeared during {!r}: {}".format(safe_repr(device), func, error)
+                logger.error(msg)
+                raise chain(DeviceDisappeared(msg))
+            except (IOError, OSError, AsiOSError), error:
+                msg = "device {!r} disappeared during {!r}".format(safe_repr(device), func)
                 logger.error(msg, exc_info=exc_info())
                 raise chain(DeviceDisappeared(msg))
-            (key, code) = (e.sense_obj.sense_key, e.sense_obj.additional_sense_code.code_name)
-            if (key, code) in CHECK_CONDITIONS_TO_CHECK:
-                msg = "device {!r} got {} {}".format(device, key, code)
-                logger.debug(msg)
-                raise chain(RescanIsNeeded(msg))
-            raise
-        except AsiRequestQueueFullError, e:
-            msg = "got queue full from device {!r} during {!r}".format(safe_repr(device), func)
-            logger.debug(msg)
-            raise chain(RescanIsNeeded(msg))
-        except AsiSCSIError as error:
-            msg = "device {!r} disappeared during {!r}: {}".format(safe_repr(device), func, error)
-            logger.error(msg)
-            raise chain(DeviceDisappeared(msg))
-        except (IOError, OSError, AsiOSError), error:
-            msg = "device {!r} disappeared during {!r}".format(safe_repr(device), func)
-            logger.error(msg, exc_info=exc_info())
-            raise chain(DeviceDisappeared(msg))
     return callable
@@ -10,12 +10,30 @@ logger = getLogger(__name__)
 
 class LinuxStorageModel(StorageModel):
     rescan_subprocess_timeout = 30
+    multipathd_timeout = 10
+    multipath_provider = "multipathd"  # or "sysfs", or "auto" to fall back to sysfs when multipathd is unavailable
+    fc_hctl_provider = "sysfs"  # or "hbaapi"
 
     def __init__(self):
         super(LinuxStorageModel, self).__init__()
         self.rescan_process = None
         self.rescan_process_start_time = None
+        self.multipath_client = None
         atexit.register(self.terminate_rescan_process, silent=True)
+        atexit.register(self.close_multipath_client)
+        self._set_hctl_providers()
+
+    def _set_hctl_providers(self):
+        from ..connectivity import ConnectivityFactory
+        from .iscsi import SysfsISCSIProvider
+        from .sas import SysfsSASTopology
+        if self.fc_hctl_provider == "sysfs":
+            from .fc import SysfsFCHCTLProvider
+            ConnectivityFactory.set_fc_hctl_provider(SysfsFCHCTLProvider())
+        else:
+            ConnectivityFactory.set_fc_hctl_provider(None)
+        ConnectivityFactory.set_iscsi_hctl_provider(SysfsISCSIProvider())
+        ConnectivityFactory.set_sas_hctl_provider(SysfsSASTopology())
 
     @cached_method
     def _get_sysfs(self):
@@ -26,9 +44,33 @@ class LinuxStorageModel(StorageModel):
         from .scsi import LinuxSCSIModel
         return LinuxSCSIModel(self._get_sysfs())
 
+    def _get_multipath_client(self):
+        # the client outlives refresh(), so it is not a cached_method
+        if self.multipath_client is None:
+            from .multipathd import PersistentMultipathClient
+            self.multipath_client = PersistentMultipathClient(timeout=self.multipathd_timeout)
+        return self.multipath_client
+
+    def close_multipath_client(self):
+        if self.multipath_client is not None:
+            self.multipath_client.close()
+
     def _create_native_multipath_model(self):
         from .native_multipath import LinuxNativeMultipathModel
-        return LinuxNativeMultipathModel(self._get_sysfs())
+        return LinuxNativeMultipathModel(self._get_sysfs(), self._get_multipath_client(), self.multipath_provider)
+
+    def create_path_monitor(self, interval=None, use_multipathd=True, use_sysfs=True, measure_latency=False):
+        """:returns: a :class:`.path_monitor.PathMonitor` that is not started yet"""
+        from .path_monitor import PathMonitor, MultipathdPathStateSource, SysfsPathStateSource, PathLatencySource
+        from .path_monitor import PATH_MONITOR_INTERVAL_IN_SEC
+        sources = []
+        if use_multipathd and self._get_multipath_client().is_running():
+            sources.append(MultipathdPathStateSource(self._get_multipath_client()))
+        if use_sysfs:
+            sources.append(SysfsPathStateSource())
+        if measure_latency:
+            sources = [PathLatencySource(source) for source in sources[-1:]] + sources[:-1]
+        return PathMonitor(sources, PATH_MONITOR_INTERVAL_IN_SEC if interval is None else interval)
 
     def _create_disk_model(self):
         from .disk import LinuxDiskModel
@@ -0,0 +1,114 @@
+import os
+from .sysfs import _sysfs_read_field, _sysfs_read_devno
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+DM_MULTIPATH_UUID_PREFIX = "mpath-"
+SCSI_DEVICE_RUNNING_STATE = "running"
+
+
+class DeviceMapperPath(object):
+    """A multipath path, with the same attributes as :class:`infi.multipathtools.dtypes.Path`"""
+    def __init__(self, device_name, major_minor, state, hctl):
+        super(DeviceMapperPath, self).__init__()
+        self.id = device_name
+        self.device_name = device_name
+        self.major_minor = major_minor
+        self.state = state
+        self.priority = 0
+        self.hctl = hctl
+
+    def __repr__(self):
+        return "<DeviceMapperPath {} {} {}>".format(self.device_name, ":".join(map(str, self.hctl)), self.state)
+
+
+class DeviceMapperPathGroup(object):
+    """A multipath path group, with the same attributes as :class:`infi.multipathtools.dtypes.PathGroup`"""
+    def __init__(self, paths):
+        super(DeviceMapperPathGroup, self).__init__()
+        self.paths = paths
+        self.state = "active"
+        self.priority = 0
+        self.load_balancing_policy = 'round-robin'
+
+
+class DeviceMapperMultipathDevice(object):
+    """A multipath device, with the same attributes as :class:`infi.multipathtools.dtypes.MultipathDevice`"""
+    def __init__(self, wwid, device_name, dm_name, major_minor, path_groups):
+        super(DeviceMapperMultipathDevice, self).__init__()
+        self.id = wwid
+        self.device_name = device_name
+        self.dm_name = dm_name
+        self.major_minor = major_minor
+        self.path_groups = path_groups
+
+    def __repr__(self):
+        return "<DeviceMapperMultipathDevice {} ({}) {}>".format(self.device_name, self.id, self.dm_name)
+
+
+class SysfsMultipathProvider(object):
+    """Discovers the device-mapper multipath devices from sysfs, without multipathd.
+
+    sysfs does not expose the path groups of a map (only the device-mapper table does), so all the paths of a
+    device are reported in a single path group. A path is 'active' if its SCSI device is running."""
+
+    def __init__(self, sysfs_root="/sys"):
+        super(SysfsMultipathProvider, self).__init__()
+        self.sysfs_block_path = os.path.join(sysfs_root, "block")
+        self.sysfs_class_scsi_device_path = os.path.join(sysfs_root, "class", "scsi_device")
+
+    def get_path_state_file(self, hctl):
+        """:returns: the sysfs attribute that holds the state of the SCSI device at the given hctl tuple"""
+        return os.path.join(self.sysfs_class_scsi_device_path, ":".join(map(str, hctl)), "device", "state")
+
+    def get_path_state(self, hctl):
+        """:returns: 'active' if the SCSI device at the given hctl tuple is running, 'failed' otherwise"""
+        with open(self.get_path_state_file(hctl), "rb") as fd:
+            state = fd.read().strip()
+        return "active" if state == SCSI_DEVICE_RUNNING_STATE else "failed"
+
+    def _get_path(self, device_name):
+        block_device_path = os.path.join(self.sysfs_block_path, device_name)
+        # /sys/block/sdb/device -> ../../../2:0:0:1
+        hctl_string = os.path.basename(os.readlink(os.path.join(block_device_path, "device")))
+        hctl = tuple(int(item) for item in hctl_string.split(":"))
+        return DeviceMapperPath(device_name, _sysfs_read_devno(block_device_path), self.get_path_state(hctl), hctl)
+
+    def _get_paths(self, dm_path):
+        paths = []
+        for device_name in sorted(os.listdir(os.path.join(dm_path, "slaves"))):
+            try:
+                paths.append(self._get_path(device_name))
+            except (IOError, OSError):
+                logger.debug("path {} of {} disappeared".format(device_name, dm_path))
+        return paths
+
+    def _get_multipath_device(self, dm_name):
+        dm_path = os.path.join(self.sysfs_block_path, dm_name)
+        uuid = _sysfs_read_field(os.path.join(dm_path, "dm"), "uuid").strip()
+        if not uuid.startswith(DM_MULTIPATH_UUID_PREFIX):
+            return None
+        name = _sysfs_read_field(os.path.join(dm_path, "dm"), "name").strip()
+        return DeviceMapperMultipathDevice(uuid[len(DM_MULTIPATH_UUID_PREFIX):], name, dm_name,
+                                           _sysfs_read_devno(dm_path),
+                                           [DeviceMapperPathGroup(self._get_paths(dm_path))])
+
+    def get_block_device_names(self):
+        """:returns: the names of all the block devices; this changes whenever a map or a path is added or removed"""
+        return os.listdir(self.sysfs_block_path)
+
+    def get_list_of_multipath_devices(self):
+        """:returns: a list of multipath devices, like :meth:`infi.multipathtools.MultipathClient.get_list_of_multipath_devices`"""
+        result = []
+        for dm_name in self.get_block_device_names():
+            if not dm_name.startswith("dm-"):
+                continue
+            try:
+                device = self._get_multipath_device(dm_name)
+            except (IOError, OSError):
+                logger.debug("device-mapper device {} disappeared".format(dm_name))
+                continue
+            if device is not None:
+                result.append(device)
+        return result
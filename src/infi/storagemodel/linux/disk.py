@@ -55,6 +55,8 @@ class LinuxDiskModel(disk.DiskModel):
         from infi.storagemodel import get_storage_model
         scsi = get_storage_model().get_scsi()
         multipath = get_storage_model().get_native_multipath()
-        storage_device = filter(lambda device: device.get_block_access_path() == path,
-                                scsi.get_all_scsi_block_devices() + multipath.get_all_multipath_block_devices())[0]
+        try:
+            storage_device = scsi.find_scsi_block_device_by_block_access_path(path)
+        except KeyError:
+            storage_device = multipath.find_multipath_device_by_block_access_path(path)
         return LinuxDiskDrive(storage_device, path)
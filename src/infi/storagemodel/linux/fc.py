@@ -0,0 +1,132 @@
+import os
+import re
+from .sysfs import _sysfs_read_field
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+# rport-<host>:<channel>-<index>, e.g. rport-5:0-3
+RPORT_PATTERN = re.compile(r"^rport-(?P<host>\d+):(?P<channel>\d+)-(?P<index>\d+)$")
+HOST_PATTERN = re.compile(r"^host(?P<host>\d+)$")
+# remote ports that are not SCSI targets (e.g. switch ports and initiators) have no target id
+NO_SCSI_TARGET_ID = -1
+
+
+def _read_wwn(path, field):
+    from infi.dtypes.wwn import WWN
+    # sysfs has the wwns in the form of 0x21000024ff3b1a2c
+    return WWN(_sysfs_read_field(path, field).strip())
+
+
+def _create_port(port_wwn, node_wwn, hct):
+    from infi.hbaapi import Port
+    port = Port()
+    port.port_wwn = port_wwn
+    port.node_wwn = node_wwn
+    port.hct = hct
+    return port
+
+
+class SysfsFCHCTLProvider(object):
+    """Builds the Fibre Channel (host, channel, target) mappings from the FC transport classes in sysfs.
+
+    Only the names and the target ids are read (from /sys/class/fc_host and /sys/class/fc_remote_ports), instead
+    of all the port attributes and statistics that :mod:`infi.hbaapi` collects. The mappings are kept until the
+    generation changes: the generation is the listing of both directories, which changes whenever an HBA or a remote
+    port is added or removed, and the target ids of the remote ports that had none. A remote port is created without
+    a target id and gets one when its target role is set, e.g. by lpfc; after that, its name and target id do not
+    change while it exists, so the remote ports are mapped regardless of their state, like the HCTLs of the SCSI
+    devices behind them. Mappings that were built while a remote port could not be read are not kept"""
+
+    def __init__(self, sysfs_root="/sys"):
+        super(SysfsFCHCTLProvider, self).__init__()
+        self.sysfs_fc_host_path = os.path.join(sysfs_root, "class", "fc_host")
+        self.sysfs_fc_remote_ports_path = os.path.join(sysfs_root, "class", "fc_remote_ports")
+        self._generation = None
+        self._mappings = None
+        self._pending_rport_names = ()
+
+    def is_available(self):
+        """:returns: True if the FC transport class is in sysfs, i.e. an FC driver is loaded"""
+        return os.path.isdir(self.sysfs_fc_host_path)
+
+    def _listdir(self, path):
+        try:
+            return os.listdir(path)
+        except OSError:
+            return []
+
+    def _read_target_id(self, rport_name):
+        path = os.path.join(self.sysfs_fc_remote_ports_path, rport_name)
+        try:
+            return _sysfs_read_field(path, "scsi_target_id").strip()
+        except (IOError, OSError):
+            return None
+
+    def get_generation(self):
+        """:returns: a token that changes whenever an FC host or a remote port is added or removed, or a remote port
+        that had no target id gets one"""
+        return (tuple(sorted(self._listdir(self.sysfs_fc_host_path))),
+                tuple(sorted(self._listdir(self.sysfs_fc_remote_ports_path))),
+                tuple(self._read_target_id(rport_name) for rport_name in self._pending_rport_names))
+
+    def invalidate(self):
+        """forgets the mappings, so they are rebuilt on the next call to :meth:`get_fc_hctl_mappings`"""
+        self._generation = None
+        self._mappings = None
+        self._pending_rport_names = ()
+
+    def _get_local_ports(self, host_names):
+        local_ports = dict()
+        for host_name in host_names:
+            match = HOST_PATTERN.match(host_name)
+            if match is None:
+                continue
+            host = int(match.group("host"))
+            path = os.path.join(self.sysfs_fc_host_path, host_name)
+            try:
+                local_ports[host] = _create_port(_read_wwn(path, "port_name"), _read_wwn(path, "node_name"),
+                                                 (host, -1, -1))
+            except (IOError, OSError):
+                logger.debug("fc host {} disappeared".format(host_name))
+        return local_ports
+
+    def _build(self, host_names, rport_names):
+        """:returns: the mappings, a dict of the names of the remote ports without a target id to their target id (as
+        read from sysfs), and False if a remote port could not be read"""
+        local_ports = self._get_local_ports(host_names)
+        result, pending_target_ids, complete = dict(), dict(), True
+        for rport_name in rport_names:
+            match = RPORT_PATTERN.match(rport_name)
+            if match is None or int(match.group("host")) not in local_ports:
+                continue
+            local_port = local_ports[int(match.group("host"))]
+            path = os.path.join(self.sysfs_fc_remote_ports_path, rport_name)
+            try:
+                target_id = _sysfs_read_field(path, "scsi_target_id").strip()
+                if int(target_id) == NO_SCSI_TARGET_ID:
+                    pending_target_ids[rport_name] = target_id
+                    continue
+                hct = (local_port.hct[0], int(match.group("channel")), int(target_id))
+                remote_port = _create_port(_read_wwn(path, "port_name"), _read_wwn(path, "node_name"), hct)
+            except (IOError, OSError):
+                logger.debug("fc remote port {} disappeared".format(rport_name))
+                complete = False
+                continue
+            local_port.discovered_ports.append(remote_port)
+            result[hct] = (local_port, remote_port,)
+        return result, pending_target_ids, complete
+
+    def get_fc_hctl_mappings(self):
+        """:returns: a dict of (host, channel, target) to a tuple of the local and remote :class:`infi.hbaapi.Port`,
+        like :meth:`.ConnectivityFactoryImpl.get_fc_hctl_mappings`"""
+        generation = self.get_generation()
+        if generation != self._generation:
+            host_names, rport_names, _ = generation
+            self._mappings, pending_target_ids, complete = self._build(host_names, rport_names)
+            self._pending_rport_names = tuple(sorted(pending_target_ids))
+            # the target ids the mappings were built with, so a remote port that gets one in the meantime is mapped
+            self._generation = (host_names, rport_names,
+                                tuple(pending_target_ids[name] for name in self._pending_rport_names)) \
+                if complete else None
+        return self._mappings
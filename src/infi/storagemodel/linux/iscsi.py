@@ -0,0 +1,135 @@
+import os
+import re
+from collections import namedtuple
+from .sysfs import _sysfs_read_field
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+SESSION_PATTERN = re.compile(r"^session(?P<session>\d+)$")
+# connection<session>:<connection>, e.g. connection1:0
+CONNECTION_PATTERN = re.compile(r"^connection(?P<session>\d+):(?P<connection>\d+)$")
+HOST_PATTERN = re.compile(r"^host(?P<host>\d+)$")
+TARGET_PATTERN = re.compile(r"^target(?P<host>\d+):(?P<channel>\d+):(?P<target>\d+)$")
+# the iSCSI transport class shows string attributes that were not set as (null)
+NULL_VALUES = ("", "(null)", "<NULL>")
+
+# target_portal is an (address, port) tuple, port is an int; tpgt is an int or None
+ISCSISession = namedtuple("ISCSISession", ["session_name", "initiator_iqn", "target_iqn", "target_portal", "tpgt"])
+
+
+def _read_optional_field(path, field):
+    """:returns: the stripped value of the sysfs attribute, or None if it does not exist or was not set"""
+    try:
+        value = _sysfs_read_field(path, field).strip()
+    except (IOError, OSError):
+        return None
+    return None if value in NULL_VALUES else value
+
+
+class SysfsISCSIProvider(object):
+    """Builds the iSCSI (host, channel, target) mappings from the iSCSI transport classes in sysfs.
+
+    The sessions, connections and hosts (/sys/class/iscsi_session, iscsi_connection and iscsi_host) are read in one
+    walk, and the mappings are kept until the generation changes: the listing of the sessions, the connections and
+    the targets of each session. The kernel removes the target of a session that has no LUNs and adds it back on
+    rescan, so a target can appear under an existing session"""
+
+    def __init__(self, sysfs_root="/sys"):
+        super(SysfsISCSIProvider, self).__init__()
+        self.sysfs_iscsi_session_path = os.path.join(sysfs_root, "class", "iscsi_session")
+        self.sysfs_iscsi_connection_path = os.path.join(sysfs_root, "class", "iscsi_connection")
+        self.sysfs_iscsi_host_path = os.path.join(sysfs_root, "class", "iscsi_host")
+        self._generation = None
+        self._mappings = None
+
+    def is_available(self):
+        """:returns: True if the iSCSI transport class is in sysfs, i.e. an iSCSI driver is loaded"""
+        return os.path.isdir(self.sysfs_iscsi_session_path)
+
+    def _listdir(self, path):
+        try:
+            return os.listdir(path)
+        except OSError:
+            return []
+
+    def _get_target_names(self, session_name):
+        device_path = os.path.join(self.sysfs_iscsi_session_path, session_name, "device")
+        return tuple(sorted(name for name in self._listdir(device_path) if TARGET_PATTERN.match(name)))
+
+    def get_generation(self):
+        """:returns: a token that changes whenever an iSCSI session, connection or target is added or removed"""
+        session_names = tuple(sorted(self._listdir(self.sysfs_iscsi_session_path)))
+        return (session_names,
+                tuple(sorted(self._listdir(self.sysfs_iscsi_connection_path))),
+                tuple(self._get_target_names(session_name) for session_name in session_names))
+
+    def invalidate(self):
+        """forgets the mappings, so they are rebuilt on the next call to :meth:`get_iscsi_hctl_mappings`"""
+        self._generation = None
+        self._mappings = None
+
+    def _get_portals(self, connection_names):
+        """:returns: a dict of session number to the portal of its first connection"""
+        portals = dict()
+        for connection_name in sorted(connection_names):
+            match = CONNECTION_PATTERN.match(connection_name)
+            if match is None or int(match.group("session")) in portals:
+                continue
+            path = os.path.join(self.sysfs_iscsi_connection_path, connection_name)
+            address = _read_optional_field(path, "persistent_address") or _read_optional_field(path, "address")
+            port = _read_optional_field(path, "persistent_port") or _read_optional_field(path, "port")
+            if address is not None:
+                portals[int(match.group("session"))] = (address, int(port) if port is not None else None)
+        return portals
+
+    def _get_host_initiator_iqn(self, host, cache):
+        if host not in cache:
+            path = os.path.join(self.sysfs_iscsi_host_path, "host{}".format(host))
+            cache[host] = _read_optional_field(path, "initiatorname")
+        return cache[host]
+
+    def _get_session_targets(self, session_path):
+        """:returns: the host number and the list of (host, channel, target) tuples of the session"""
+        # /sys/class/iscsi_session/session1/device -> ../../../devices/platform/host3/session1
+        device_path = os.path.join(session_path, "device")
+        host_match = HOST_PATTERN.match(os.path.basename(os.path.dirname(os.readlink(device_path))))
+        host = int(host_match.group("host")) if host_match is not None else None
+        targets = []
+        for name in os.listdir(device_path):
+            match = TARGET_PATTERN.match(name)
+            if match is not None:
+                targets.append((int(match.group("host")), int(match.group("channel")), int(match.group("target"))))
+        return host, targets
+
+    def _build(self, session_names, connection_names, target_names):
+        portals = self._get_portals(connection_names)
+        host_initiator_iqns = dict()
+        result = dict()
+        for session_name in session_names:
+            match = SESSION_PATTERN.match(session_name)
+            if match is None:
+                continue
+            path = os.path.join(self.sysfs_iscsi_session_path, session_name)
+            try:
+                host, targets = self._get_session_targets(path)
+            except (IOError, OSError):
+                logger.debug("iscsi session {} disappeared".format(session_name))
+                continue
+            # older kernels do not have the initiator name in the session, only in the host
+            initiator_iqn = _read_optional_field(path, "initiatorname") or \
+                self._get_host_initiator_iqn(host, host_initiator_iqns)
+            tpgt = _read_optional_field(path, "tpgt")
+            session = ISCSISession(session_name, initiator_iqn, _read_optional_field(path, "targetname"),
+                                   portals.get(int(match.group("session"))), int(tpgt) if tpgt is not None else None)
+            for hct in targets:
+                result[hct] = session
+        return result
+
+    def get_iscsi_hctl_mappings(self):
+        """:returns: a dict of (host, channel, target) to :class:`ISCSISession`"""
+        generation = self.get_generation()
+        if generation != self._generation:
+            self._mappings = self._build(*generation)
+            self._generation = generation
+        return self._mappings
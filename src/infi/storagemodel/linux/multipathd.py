@@ -0,0 +1,156 @@
+from infi.multipathtools import MultipathClient
+from infi.multipathtools.connection import UnixDomainSocket
+from infi.multipathtools.errors import ConnectionError, TimeoutExpired
+from ..utils import get_rlock
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+MULTIPATHD_TIMEOUT_IN_SEC = 10
+
+# the fields that change when a map is reloaded, loses/gains paths or switches path groups:
+# name, dm device, uuid, number of paths, dm state, path faults, path group switches and map loads
+SHOW_MAPS_COMMAND = 'show maps format "%n %d %w %N %t %0 %1 %2"'
+# multipathd has no per-path-group fields for maps, and a path group's priority and state can change without a switch
+# (e.g. on ALUA transitions), so the signature of a map also has the priorities and dm states of its paths
+SHOW_PATHS_SIGNATURE_COMMAND = 'show paths format "%m %i %p %t"'
+# a cheap command to check that multipathd is still there, at the other end of an open connection
+SHOW_DAEMON_COMMAND = "show daemon"
+SHOW_MAP_TOPOLOGY_COMMAND = "show map {} topology"
+SHOW_MULTIPATHS_TOPOLOGY_COMMAND = "show multipaths topology"
+SHOW_PATHS_COMMAND = "show paths"
+# map uuid, hctl, device name and dm state of every path
+SHOW_PATHS_FORMAT_COMMAND = 'show paths format "%w %i %d %t"'
+
+
+class PersistentUnixDomainSocket(UnixDomainSocket):
+    """A connection to multipathd that stays open between commands, until it is closed explicitly or fails"""
+
+    def connect(self):
+        if self._socket is None:
+            super(PersistentUnixDomainSocket, self).connect()
+
+    def disconnect(self):
+        # MultipathClient disconnects after every command; we keep the connection open instead
+        pass
+
+    def is_connected(self):
+        return self._socket is not None
+
+    def close(self):
+        super(PersistentUnixDomainSocket, self).disconnect()
+
+
+class PersistentMultipathClient(MultipathClient):
+    """A long-lived multipathd client that re-uses a single connection, and refreshes the multipath topology
+    incrementally: on every call to :meth:`get_list_of_multipath_devices` it lists the maps and fetches the
+    topology only for the maps that were added or changed since the previous call"""
+
+    def __init__(self, timeout=MULTIPATHD_TIMEOUT_IN_SEC, address=None):
+        super(PersistentMultipathClient, self).__init__(PersistentUnixDomainSocket(timeout=timeout, address=address))
+        self._lock = get_rlock()
+        self._topology_by_map_name = dict()  # map name -> (signature, topology)
+
+    def _send_and_receive(self, message):
+        with self._lock:
+            reused_connection = self._connection.is_connected()
+            try:
+                return super(PersistentMultipathClient, self)._send_and_receive(message)
+            except TimeoutExpired:
+                # the stream is out of sync now, and a wedged multipathd won't answer a retry either
+                self.close()
+                raise
+            except ConnectionError:
+                # a pooled connection may have been closed by multipathd (e.g. on restart),
+                # so we drop it, and retry once if it wasn't a fresh connection
+                self.close()
+                if not reused_connection:
+                    raise
+                logger.debug("multipathd connection was lost, reconnecting")
+            return super(PersistentMultipathClient, self)._send_and_receive(message)
+
+    def is_running(self):
+        """:returns: True if multipathd accepts a connection or, if one is already open, answers a command on it"""
+        with self._lock:
+            if not self._connection.is_connected():
+                return super(PersistentMultipathClient, self).is_running()
+            try:
+                # connect() does nothing while the connection is open, so we send a command instead
+                self._send_and_receive(SHOW_DAEMON_COMMAND)
+            except ConnectionError:
+                return False
+            return True
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def clear(self):
+        """forgets the cached topology, so the next refresh fetches all of it"""
+        self._topology_by_map_name.clear()
+
+    def _get_map_signatures(self):
+        """:returns: a dict of map name to its signature, or None if multipathd does not support this command"""
+        response = self._send_and_receive(SHOW_MAPS_COMMAND)
+        lines = [line.strip() for line in response.splitlines() if line.strip()]
+        if not lines or not lines[0].startswith("name"):
+            logger.debug("unexpected response for {!r}: {!r}".format(SHOW_MAPS_COMMAND, response))
+            return None
+        return dict((line.split()[0], line) for line in lines[1:])
+
+    def _get_path_signatures(self):
+        """:returns: a dict of map name to the hctls, priorities and dm states of its paths,
+        or None if multipathd does not support this command"""
+        response = self._send_and_receive(SHOW_PATHS_SIGNATURE_COMMAND)
+        lines = [line.split() for line in response.splitlines() if line.strip()]
+        if not lines or lines[0][0] != "multipath":
+            logger.debug("unexpected response for {!r}: {!r}".format(SHOW_PATHS_SIGNATURE_COMMAND, response))
+            return None
+        result = dict()
+        for line in lines[1:]:
+            if len(line) >= 4:
+                result.setdefault(line[0], []).append(tuple(line[1:4]))
+        return dict((name, tuple(sorted(paths))) for name, paths in result.items())
+
+    def _get_changed_maps(self, signatures):
+        return [name for name, signature in signatures.items()
+                if self._topology_by_map_name.get(name, (None, None))[0] != signature]
+
+    def get_multipaths_topology(self):
+        """:returns: the output of 'show multipaths topology', re-using the cached topology of unchanged maps"""
+        signatures = self._get_map_signatures()
+        path_signatures = self._get_path_signatures() if signatures is not None else None
+        if path_signatures is None:
+            self.clear()
+            return self._send_and_receive(SHOW_MULTIPATHS_TOPOLOGY_COMMAND)
+        signatures = dict((name, (signature, path_signatures.get(name, ())))
+                          for name, signature in signatures.items())
+        for name in set(self._topology_by_map_name).difference(signatures):
+            del self._topology_by_map_name[name]
+        changed_maps = self._get_changed_maps(signatures)
+        logger.debug("fetching topology for {} out of {} maps".format(len(changed_maps), len(signatures)))
+        for name in changed_maps:
+            topology = self._send_and_receive(SHOW_MAP_TOPOLOGY_COMMAND.format(name))
+            self._topology_by_map_name[name] = (signatures[name], topology)
+        return "\n".join(topology for _, topology in self._topology_by_map_name.values())
+
+    def get_path_states(self):
+        """:returns: a list of (map uuid, hctl tuple, device name, dm state) for every path that belongs to a map,
+        or None if multipathd does not support this command"""
+        response = self._send_and_receive(SHOW_PATHS_FORMAT_COMMAND)
+        lines = [line.split() for line in response.splitlines() if line.strip()]
+        if not lines or lines[0][0] != "uuid":
+            logger.debug("unexpected response for {!r}: {!r}".format(SHOW_PATHS_FORMAT_COMMAND, response))
+            return None
+        return [(uuid, tuple(int(item) for item in hctl.split(":")), device_name, dm_state)
+                for uuid, hctl, device_name, dm_state in (line[:4] for line in lines[1:] if len(line) >= 4)
+                if dm_state in ("active", "failed")]
+
+    def get_list_of_multipath_devices(self):
+        from infi.multipathtools.model import get_list_of_multipath_devices_from_multipathd_output
+        maps_topology = self.get_multipaths_topology()
+        paths_table = self._send_and_receive(SHOW_PATHS_COMMAND)
+        return get_list_of_multipath_devices_from_multipathd_output(maps_topology, paths_table)
+
+    def __repr__(self):
+        return "<PersistentMultipathClient({!r})>".format(self._connection)
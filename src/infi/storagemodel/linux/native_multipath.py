@@ -8,6 +8,12 @@ import itertools
 from logging import getLogger
 logger = getLogger(__name__)
 
+# where the multipath devices are discovered from: multipathd only, sysfs only (faster, but without path groups),
+# or multipathd with a fallback to sysfs when multipathd is not running or does not respond in time
+MULTIPATH_PROVIDER_MULTIPATHD = "multipathd"
+MULTIPATH_PROVIDER_SYSFS = "sysfs"
+MULTIPATH_PROVIDER_AUTO = "auto"
+
 class LinuxNativeMultipathBlockDevice(LinuxBlockDeviceMixin, multipath.MultipathBlockDevice):
     def __init__(self, sysfs, sysfs_device, multipath_object):
         super(LinuxNativeMultipathBlockDevice, self).__init__()
@@ -29,12 +35,16 @@ class LinuxNativeMultipathBlockDevice(LinuxBlockDeviceMixin, multipath.Multipath
             handle.close()
 
     def _is_there_atleast_one_path_up(self):
-        return bool(filter(lambda path: path.get_state() == "up", self.get_paths()))
+        # multipathd already gave us the path states, so there is no need to build the paths for this
+        return any(path.state == "active" for group in self.multipath_object.path_groups for path in group.paths)
 
     @cached_method
     def get_display_name(self):
         return self.multipath_object.dm_name
 
+    def get_cached_wwid(self):
+        return self.multipath_object.id
+
     @cached_method
     def get_block_access_path(self):
         return "/dev/mapper/{}".format(self.multipath_object.device_name)
@@ -43,29 +53,63 @@ class LinuxNativeMultipathBlockDevice(LinuxBlockDeviceMixin, multipath.Multipath
     def get_device_mapper_access_path(self):
         return "/dev/{}".format(self.multipath_object.dm_name)
 
+    @cached_method
+    def get_block_access_path_aliases(self):
+        wwid = self.multipath_object.id
+        aliases = [self.get_device_mapper_access_path(),
+                   self.multipath_object.dm_name,
+                   self.multipath_object.device_name,
+                   "{}:{}".format(*self.multipath_object.major_minor),
+                   wwid,
+                   "/dev/disk/by-id/dm-name-{}".format(self.multipath_object.device_name),
+                   "/dev/disk/by-id/dm-uuid-mpath-{}".format(wwid),
+                   "/dev/disk/by-id/scsi-{}".format(wwid)]
+        if wwid.startswith('3'):
+            # SCSI name string type 3 is an NAA designator
+            aliases.append("naa.{}".format(wwid[1:]))
+        return aliases
+
     @cached_method
     def get_paths(self):
-        paths = list()
-        for path in itertools.chain.from_iterable(group.paths for group in self.multipath_object.path_groups):
-            try:
-                paths.append(LinuxPath(self.sysfs, path))
-            except ValueError:
-                logger.debug("LinuxPath sysfs device disappeared for {}".format(path))
-        return paths
+        return [LinuxPath(self.sysfs, path)
+                for path in itertools.chain.from_iterable(group.paths for group in self.multipath_object.path_groups)]
 
     @cached_method
     def get_policy(self):
         return LinuxRoundRobin()
 
+    def get_active_path_group_path_ids(self):
+        # multipathd round-robins only within the active path group
+        path_groups = self.multipath_object.path_groups
+        if len(path_groups) < 2:
+            return None
+        active_path_groups = [group for group in path_groups if group.state == "active"]
+        if len(active_path_groups) != 1:
+            raise ValueError("{!r} has {} active path groups".format(self, len(active_path_groups)))
+        return set(path.device_name for path in active_path_groups[0].paths)
+
 class LinuxRoundRobin(multipath.RoundRobin):
     pass
 
 class LinuxPath(multipath.Path):
+    """A view of a path multipathd reported; it is bound to its sysfs device only when SCSI access is needed"""
+
     def __init__(self, sysfs, multipath_object_path):
-        from infi.dtypes.hctl import HCTL
+        self.sysfs = sysfs
         self.multipath_object_path = multipath_object_path
-        self.hctl = HCTL(*self.multipath_object_path.hctl)
-        self.sysfs_device = sysfs.find_scsi_disk_by_hctl(self.hctl)
+
+    @property
+    def sysfs_device(self):
+        return self._get_sysfs_device()
+
+    @cached_method
+    def _get_sysfs_device(self):
+        from infi.exceptools import chain
+        try:
+            return self.sysfs.find_scsi_disk_by_hctl(self.get_hctl())
+        except ValueError:
+            logger.debug("LinuxPath sysfs device disappeared for {}".format(self.multipath_object_path))
+            raise chain(DeviceDisappeared())
 
     @contextmanager
     def asi_context(self):
@@ -84,8 +128,10 @@ class LinuxPath(multipath.Path):
     def get_path_id(self):
         return self.multipath_object_path.device_name
 
+    @cached_method
     def get_hctl(self):
-        return self.hctl
+        from infi.dtypes.hctl import HCTL
+        return HCTL(*self.multipath_object_path.hctl)
 
     @cached_method
     def get_state(self):
@@ -104,9 +150,17 @@ class LinuxPath(multipath.Path):
             return multipath.PathStatistics(bytes_read, bytes_written, read_ios, write_ios)
 
 class LinuxNativeMultipathModel(multipath.NativeMultipathModel):
-    def __init__(self, sysfs):
+    def __init__(self, sysfs, multipath_client=None, multipath_provider=MULTIPATH_PROVIDER_MULTIPATHD):
         super(LinuxNativeMultipathModel, self).__init__()
         self.sysfs = sysfs
+        self.multipath_client = multipath_client
+        self.multipath_provider = multipath_provider
+
+    def _get_multipath_client(self):
+        if self.multipath_client is None:
+            from .multipathd import PersistentMultipathClient
+            self.multipath_client = PersistentMultipathClient()
+        return self.multipath_client
 
     def _is_device_active(self, multipath_device):
         return any([any([path.state == 'active' for path in group.paths]) for group in multipath_device.path_groups])
@@ -122,21 +176,37 @@ class LinuxNativeMultipathModel(multipath.NativeMultipathModel):
             raise chain(StorageModelFindError())
         return devices
 
-    @cached_method
-    def get_all_multipath_block_devices(self):
-        from infi.multipathtools import MultipathClient
-        from infi.multipathtools.connection import UnixDomainSocket
-        client = MultipathClient(UnixDomainSocket(timeout=120))
+    def _get_list_of_active_devices_from_sysfs(self):
+        from .device_mapper import SysfsMultipathProvider
+        provider = SysfsMultipathProvider()
+        return [device for device in provider.get_list_of_multipath_devices() if self._is_device_active(device)]
+
+    def _get_list_of_active_devices_from_multipathd(self):
+        client = self._get_multipath_client()
         if not client.is_running():
             logger.debug("MultipathD is not running")
+            if self.multipath_provider == MULTIPATH_PROVIDER_AUTO:
+                return self._get_list_of_active_devices_from_sysfs()
             return []
+        try:
+            return self._get_list_of_active_devices(client)
+        except MultipathDaemonTimeoutError:
+            if self.multipath_provider != MULTIPATH_PROVIDER_AUTO:
+                raise
+            logger.debug("MultipathD did not respond in time, falling back to sysfs")
+            return self._get_list_of_active_devices_from_sysfs()
 
+    @cached_method
+    def get_all_multipath_block_devices(self):
         try:
-            devices = self._get_list_of_active_devices(client)
+            if self.multipath_provider == MULTIPATH_PROVIDER_SYSFS:
+                devices = self._get_list_of_active_devices_from_sysfs()
+            else:
+                devices = self._get_list_of_active_devices_from_multipathd()
         except IOError:
             raise DeviceDisappeared()
         result = []
-        logger.debug("Got {} devices from multipath client".format(len(devices)))
+        logger.debug("Got {} devices from multipath {}".format(len(devices), self.multipath_provider))
         for mpath_device in devices:
             block_dev = self.sysfs.find_block_device_by_devno(mpath_device.major_minor)
             if block_dev is not None:
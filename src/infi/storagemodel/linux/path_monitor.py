@@ -0,0 +1,247 @@
+from collections import namedtuple
+from time import time
+from .device_mapper import SysfsMultipathProvider, SCSI_DEVICE_RUNNING_STATE
+from ..utils import get_event, spawn
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+PATH_MONITOR_INTERVAL_IN_SEC = 5
+TOPOLOGY_REFRESH_INTERVAL_IN_TICKS = 60
+
+# state is "up" or "down", like Path.get_state(); latency is the test unit ready time in seconds, if it was measured
+PathState = namedtuple("PathState", ["lu_id", "path_id", "hctl", "state", "latency"])
+
+
+class PathEvent(object):
+    """Base class for the events a :class:`PathMonitor` sends to its subscribers"""
+    def __init__(self, lu_id, path_id=None, hctl=None, latency=None):
+        super(PathEvent, self).__init__()
+        self.lu_id = lu_id
+        self.path_id = path_id
+        self.hctl = hctl
+        self.latency = latency
+
+    def __eq__(self, other):
+        return type(self) == type(other) and (self.lu_id, self.path_id) == (other.lu_id, other.path_id)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<{} {} {}>".format(type(self).__name__, self.lu_id, self.path_id)
+
+
+class PathDown(PathEvent):
+    """A path that was up is now down, or has disappeared"""
+    pass
+
+
+class PathUp(PathEvent):
+    """A path that was down, or did not exist, is now up"""
+    pass
+
+
+class LogicalUnitLostAllPaths(PathEvent):
+    """A logical unit that had at least one path up has none now"""
+    pass
+
+
+class MultipathdPathStateSource(object):
+    """Path states as multipathd sees them, over a persistent multipathd connection"""
+
+    def __init__(self, multipath_client):
+        super(MultipathdPathStateSource, self).__init__()
+        self.multipath_client = multipath_client
+
+    def _get_path_states_from_topology(self):
+        for device in self.multipath_client.get_list_of_multipath_devices():
+            for group in device.path_groups:
+                for path in group.paths:
+                    yield device.id, path.hctl, path.device_name, path.state
+
+    def get_path_states(self):
+        """:returns: a list of :class:`PathState`"""
+        path_states = self.multipath_client.get_path_states()
+        if path_states is None:
+            path_states = self._get_path_states_from_topology()
+        return [PathState(lu_id, device_name, hctl, "up" if state == "active" else "down", None)
+                for lu_id, hctl, device_name, state in path_states]
+
+
+class SysfsPathStateSource(object):
+    """Path states from the SCSI device states in sysfs.
+
+    The map-to-path topology is walked only when block devices are added or removed, or every
+    `topology_refresh_interval` ticks; other ticks read just one state attribute per path."""
+
+    def __init__(self, sysfs_root="/sys", topology_refresh_interval=TOPOLOGY_REFRESH_INTERVAL_IN_TICKS):
+        super(SysfsPathStateSource, self).__init__()
+        self.provider = SysfsMultipathProvider(sysfs_root)
+        self.topology_refresh_interval = topology_refresh_interval
+        self._topology = None
+        self._block_device_names = None
+        self._ticks_since_refresh = 0
+
+    def _get_topology(self):
+        block_device_names = sorted(self.provider.get_block_device_names())
+        self._ticks_since_refresh += 1
+        if self._topology is None or block_device_names != self._block_device_names or \
+                self._ticks_since_refresh >= self.topology_refresh_interval:
+            self._topology = [(device.id, path.device_name, path.hctl, self.provider.get_path_state_file(path.hctl))
+                              for device in self.provider.get_list_of_multipath_devices()
+                              for group in device.path_groups for path in group.paths]
+            self._block_device_names = block_device_names
+            self._ticks_since_refresh = 0
+        return self._topology
+
+    def get_path_states(self):
+        """:returns: a list of :class:`PathState`"""
+        result = []
+        for lu_id, path_id, hctl, state_file in self._get_topology():
+            try:
+                with open(state_file, "rb") as fd:
+                    state = fd.read().strip()
+            except (IOError, OSError):
+                continue
+            result.append(PathState(lu_id, path_id, hctl, "up" if state == SCSI_DEVICE_RUNNING_STATE else "down", None))
+        return result
+
+
+class PathLatencySource(object):
+    """Wraps another source, and sends a test unit ready on every path it reports as up.
+    Paths that fail the command are reported as down; the command time is reported as the path latency."""
+
+    def __init__(self, source):
+        super(PathLatencySource, self).__init__()
+        self.source = source
+
+    def _test_unit_ready(self, hctl):
+        import os
+        from infi.asi.unix import OSFile
+        from infi.asi import create_platform_command_executer
+        from infi.asi.cdb.tur import TestUnitReadyCommand
+        from infi.asi.coroutines.sync_adapter import sync_wait
+        from .scsi import SG_TIMEOUT_IN_MS
+        scsi_generic_path = "/sys/class/scsi_device/{}/device/scsi_generic".format(":".join(map(str, hctl)))
+        [sg_device_name] = os.listdir(scsi_generic_path)
+        handle = OSFile(os.open(os.path.join("/dev", sg_device_name), os.O_RDWR))
+        try:
+            executer = create_platform_command_executer(handle, timeout=SG_TIMEOUT_IN_MS)
+            sync_wait(TestUnitReadyCommand().execute(executer))
+        finally:
+            handle.close()
+
+    def get_path_states(self):
+        """:returns: a list of :class:`PathState`"""
+        result = []
+        for path_state in self.source.get_path_states():
+            if path_state.state == "up":
+                start = time()
+                try:
+                    self._test_unit_ready(path_state.hctl)
+                except Exception:
+                    logger.debug("test unit ready failed on {}".format(path_state.path_id), exc_info=True)
+                    path_state = path_state._replace(state="down")
+                else:
+                    path_state = path_state._replace(latency=time() - start)
+            result.append(path_state)
+        return result
+
+
+class PathMonitor(object):
+    """Tracks the states of the multipath paths and notifies subscribers on changes.
+
+    Every tick collects the path states from all the sources; a path is up only if all the sources that report it
+    agree it is up. The states are compared with those of the previous tick, and each subscriber is called with
+    every :class:`PathEvent`. The first tick only records the states."""
+
+    def __init__(self, sources, interval=PATH_MONITOR_INTERVAL_IN_SEC):
+        super(PathMonitor, self).__init__()
+        self.sources = sources
+        self.interval = interval
+        self._subscribers = []
+        self._path_states = None
+        self._stop_event = None
+        self._worker = None
+
+    def subscribe(self, callback):
+        """:param callback: a callable that receives a :class:`PathEvent`"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def get_path_states(self):
+        """:returns: a dict of (lu_id, path_id) to :class:`PathState`, as of the last tick"""
+        return dict(self._path_states or {})
+
+    def _collect(self):
+        path_states = dict()
+        for source in self.sources:
+            for path_state in source.get_path_states():
+                key = (path_state.lu_id, path_state.path_id)
+                previous = path_states.get(key)
+                if previous is not None:
+                    state = "down" if "down" in (path_state.state, previous.state) else "up"
+                    latency = previous.latency if path_state.latency is None else path_state.latency
+                    path_state = path_state._replace(state=state, latency=latency)
+                path_states[key] = path_state
+        return path_states
+
+    def _get_lu_ids_with_paths_up(self, path_states):
+        return set(path_state.lu_id for path_state in path_states.itervalues() if path_state.state == "up")
+
+    def _diff(self, before, after):
+        events = []
+        for key, path_state in after.iteritems():
+            was_up = key in before and before[key].state == "up"
+            if path_state.state == "up" and not was_up:
+                events.append(PathUp(path_state.lu_id, path_state.path_id, path_state.hctl, path_state.latency))
+            elif path_state.state == "down" and was_up:
+                events.append(PathDown(path_state.lu_id, path_state.path_id, path_state.hctl))
+        for key, path_state in before.iteritems():
+            if key not in after and path_state.state == "up":
+                events.append(PathDown(path_state.lu_id, path_state.path_id, path_state.hctl))
+        lost = self._get_lu_ids_with_paths_up(before).difference(self._get_lu_ids_with_paths_up(after))
+        events.extend(LogicalUnitLostAllPaths(lu_id) for lu_id in sorted(lost))
+        return events
+
+    def _notify(self, event):
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("path monitor subscriber {!r} failed on {!r}".format(callback, event))
+
+    def tick(self):
+        """collects the path states once, and notifies the subscribers of the changes since the previous tick
+        :returns: the list of events"""
+        path_states = self._collect()
+        events = [] if self._path_states is None else self._diff(self._path_states, path_states)
+        self._path_states = path_states
+        for event in events:
+            self._notify(event)
+        return events
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("path monitor tick failed")
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """starts ticking in the background (in a greenlet if gevent is available, otherwise in a thread)"""
+        if self._worker is not None:
+            return
+        self._stop_event = get_event()
+        self._worker = spawn(self._run, name="PathMonitor")
+
+    def stop(self):
+        if self._worker is None:
+            return
+        self._stop_event.set()
+        self._worker.join()
+        self._worker = None
@@ -1,20 +1,135 @@
+import re
 from logging import getLogger
 from os import path, getpid
 from glob import glob
+from threading import Lock
+from infi.pyutils.contexts import contextmanager
 from .utils import func_logger
 
 logger = getLogger(__name__)
 
 PROC_SCSI_SCSI_LINE_TEMPLATE = "Host: scsi{} Channel: {:02d} Id: {:02d} Lun: {:02d}"
+PROC_SCSI_SCSI_LINE_PATTERN = re.compile(r"Host: scsi(\d+) Channel: (\d+) Id: (\d+) Lun: (\d+)")
+PROC_SCSI_SCSI_PATH = "/proc/scsi/scsi"
+SYSFS_CLASS_SCSI_DEVICE_PATH = "/sys/class/scsi_device"
+SYSFS_CLASS_SCSI_GENERIC_PATH = "/sys/class/scsi_generic"
+HCTL_PATTERN = re.compile(r"^\d+:\d+:\d+:\d+$")
+
+# the snapshot of the rescan that is running in this process, see scsi_topology_snapshot
+_current_snapshot = None
 
 @func_logger
 def get_scsi_device_names_from_sysfs():
-    base = "/sys/class/scsi_device/*"
-    return [path.basename(item) for item in glob(base)]
+    from os import listdir
+    try:
+        return listdir(SYSFS_CLASS_SCSI_DEVICE_PATH)
+    except OSError:
+        return []
+
+def build_scsi_topology_tree(device_names):
+    """:param device_names: names of SCSI devices, e.g. 1:0:2:3
+    :returns: a dict of host to a dict of channel to a dict of target to the set of luns"""
+    tree = dict()
+    for device_name in device_names:
+        try:
+            host, channel, target, lun = [int(item) for item in device_name.split(":")]
+        except ValueError:
+            continue
+        tree.setdefault(host, {}).setdefault(channel, {}).setdefault(target, set()).add(lun)
+    return tree
+
+def parse_proc_scsi_scsi(content):
+    """:returns: the set of (host, channel, target, lun) tuples of the devices listed in /proc/scsi/scsi"""
+    return set(tuple(int(item) for item in match) for match in PROC_SCSI_SCSI_LINE_PATTERN.findall(content))
+
+def _get_hctl_from_scsi_generic_link(link):
+    """:returns: the hctl string in the link of a scsi generic device, e.g. 1:0:2:3 in
+    ../../devices/pci0000:00/0000:00:10.0/host1/target1:0:2/1:0:2:3/scsi_generic/sg4, or None"""
+    for part in link.split(path.sep):
+        if HCTL_PATTERN.match(part):
+            return part
+    return None
+
+def build_scsi_generic_index():
+    """:returns: a dict of hctl string to the name of its scsi generic device, from one pass over
+    /sys/class/scsi_generic"""
+    from os import listdir
+    index = dict()
+    try:
+        sg_names = listdir(SYSFS_CLASS_SCSI_GENERIC_PATH)
+    except OSError:
+        return index
+    for sg_name in sg_names:
+        hctl = _get_hctl_from_scsi_generic_link(try_readlink(path.join(SYSFS_CLASS_SCSI_GENERIC_PATH, sg_name)))
+        if hctl is not None:
+            index[hctl] = sg_name
+    return index
+
+class ScsiTopologySnapshot(object):
+    """The SCSI devices in sysfs as a host -> channel -> target -> luns tree, built from a single listing of
+    /sys/class/scsi_device, along with the parsed /proc/scsi/scsi and an index of the scsi generic devices.
+    Each of them is built on its first query, and built again on the first query after :meth:`refresh`"""
+
+    def __init__(self):
+        super(ScsiTopologySnapshot, self).__init__()
+        self._lock = Lock()
+        self._tree = None
+        self._proc_scsi_scsi_hctls = None
+        self._scsi_generic_index = None
+
+    def refresh(self):
+        """forgets everything, e.g. after a host scan added devices or after a device was removed"""
+        with self._lock:
+            self._tree = None
+            self._proc_scsi_scsi_hctls = None
+            self._scsi_generic_index = None
+
+    def get_tree(self):
+        with self._lock:
+            if self._tree is None:
+                self._tree = build_scsi_topology_tree(get_scsi_device_names_from_sysfs())
+            return self._tree
+
+    def get_proc_scsi_scsi_hctls(self):
+        """:returns: the set of (host, channel, target, lun) tuples in /proc/scsi/scsi"""
+        with self._lock:
+            if self._proc_scsi_scsi_hctls is None:
+                self._proc_scsi_scsi_hctls = parse_proc_scsi_scsi(get_proc_scsi_scsi())
+            return self._proc_scsi_scsi_hctls
+
+    def get_scsi_generic_index(self):
+        """:returns: a dict of hctl string to the name of its scsi generic device"""
+        with self._lock:
+            if self._scsi_generic_index is None:
+                self._scsi_generic_index = build_scsi_generic_index()
+            return self._scsi_generic_index
+
+@contextmanager
+def scsi_topology_snapshot():
+    """answers the topology getters from a single snapshot of sysfs, until the context exits"""
+    global _current_snapshot
+    snapshot = ScsiTopologySnapshot()
+    previous, _current_snapshot = _current_snapshot, snapshot
+    try:
+        yield snapshot
+    finally:
+        _current_snapshot = previous
+
+def refresh_scsi_topology_snapshot():
+    """makes the next topology query of the running rescan read sysfs again"""
+    if _current_snapshot is not None:
+        _current_snapshot.refresh()
+
+def _get_scsi_topology_tree(host):
+    """:returns: the topology tree of the running rescan, or a tree of just the given host if there is none"""
+    if _current_snapshot is not None:
+        return _current_snapshot.get_tree()
+    prefix = "{}:".format(host)
+    return build_scsi_topology_tree(item for item in get_scsi_device_names_from_sysfs() if item.startswith(prefix))
 
 @func_logger
 def get_proc_scsi_scsi():
-    with open("/proc/scsi/scsi") as fd:
+    with open(PROC_SCSI_SCSI_PATH) as fd:
         return fd.read()
 
 @func_logger
@@ -24,30 +139,20 @@ def get_hosts():
 
 @func_logger
 def get_channels(host):
-    matching_host = [item for item in get_scsi_device_names_from_sysfs()
-                     if item.startswith("{}:".format(host))]
-    channels = set([int(device.split(":")[1])
-                    for device in matching_host])
-    return channels
+    return set(_get_scsi_topology_tree(host).get(int(host), {}))
 
 @func_logger
 def get_targets(host, channel):
-    matching_host_and_channel = [item for item in get_scsi_device_names_from_sysfs()
-                                 if item.startswith("{}:{}:".format(host, channel))]
-    targets = set([int(device.split(":")[2])
-                    for device in matching_host_and_channel])
-    return targets
+    return set(_get_scsi_topology_tree(host).get(int(host), {}).get(int(channel), {}))
 
 @func_logger
 def get_luns(host, channel, target):
-    matching_host_channel_and_target = [item for item in get_scsi_device_names_from_sysfs()
-                                        if item.startswith("{}:{}:{}:".format(host, channel, target))]
-    luns = set([int(device.split(":")[3])
-                for device in matching_host_channel_and_target])
-    return luns
+    return set(_get_scsi_topology_tree(host).get(int(host), {}).get(int(channel), {}).get(int(target), ()))
 
 @func_logger
 def is_hctl_written_in_proc_scsi_scsi(host, channel, target, lun):
+    if _current_snapshot is not None:
+        return (int(host), int(channel), int(target), int(lun)) in _current_snapshot.get_proc_scsi_scsi_hctls()
     expression = PROC_SCSI_SCSI_LINE_TEMPLATE.format(host, channel, target, lun)
     return expression in get_proc_scsi_scsi()
 
@@ -68,11 +173,13 @@ def try_readlink(src):
 def get_scsi_generic_device(host, channel, target, lun):
     from os import readlink
     hctl = "{}:{}:{}:{}".format(host, channel, target, lun)
-    guess = "/sys/class/scsi_device/{}/device/generic".format(hctl)
+    guess = path.join(SYSFS_CLASS_SCSI_DEVICE_PATH, hctl, "device", "generic")
     if path.exists(guess):
         return path.basename(readlink(guess))
-    [sg_x] = [path.basename(sg_x) for sg_x in glob("/sys/class/scsi_generic/sg*")
-             if hctl in try_readlink(sg_x)] or [None]
+    if _current_snapshot is not None:
+        return _current_snapshot.get_scsi_generic_index().get(hctl)
+    [sg_x] = [path.basename(sg_x) for sg_x in glob(path.join(SYSFS_CLASS_SCSI_GENERIC_PATH, "sg*"))
+             if _get_hctl_from_scsi_generic_link(try_readlink(sg_x)) == hctl] or [None]
     return sg_x
 
 def is_there_a_bug_in_target_removal():
@@ -3,13 +3,16 @@ from logging import getLogger
 from .utils import func_logger, format_hctl, ScsiCommandFailed
 from .scsi import scsi_host_scan, scsi_add_single_device, remove_device_via_sysfs
 from .scsi import do_report_luns, do_standard_inquiry, do_test_unit_ready
-from .scsi import ensure_subprocess_dead, Process
+from .workers import scsi_command_worker_pool
 from .getters import get_scsi_generic_device
 from .getters import get_hosts, get_channels, get_targets, get_luns
+from .getters import scsi_topology_snapshot, refresh_scsi_topology_snapshot
 from .getters import is_there_a_bug_in_target_removal, is_there_a_bug_in_sysfs_async_scanning
 
 logger = getLogger(__name__)
 
+TARGET_SCAN_CONCURRENCY = 32
+
 @func_logger
 def get_luns_from_report_luns(host, channel, target):
     device_exists = lun_scan(host, channel, target, 0)
@@ -48,15 +51,20 @@ def lun_scan(host, channel, target, lun):
 
 @func_logger
 def handle_add_devices(host, channel, target, missing_luns):
-    if is_there_a_bug_in_sysfs_async_scanning():
-        return all([scsi_add_single_device(host, channel, target, lun) for lun in missing_luns])
-    return scsi_host_scan(host)
+    try:
+        if is_there_a_bug_in_sysfs_async_scanning():
+            return all([scsi_add_single_device(host, channel, target, lun) for lun in missing_luns])
+        return scsi_host_scan(host)
+    finally:
+        refresh_scsi_topology_snapshot()
 
 @func_logger
 def handle_device_removal(host, channel, target, lun):
     first = remove_device_via_sysfs
     args = (host, channel, target, lun)
-    if not first(*args):
+    result = first(*args)
+    refresh_scsi_topology_snapshot()
+    if not result:
         logger.error("{} failed to remove device {}".format(getpid(), format_hctl(host, channel, target, lun)))
         return False
     return True
@@ -97,23 +105,39 @@ def try_target_scan(host, channel, target):
 
 @func_logger
 def rescan_scsi_host(host):
+    """:returns: a list of the (host, channel, target) tuples to scan"""
     channels = get_channels(host)
-    subprocesses = []
+    targets = []
     if not channels and not is_there_a_bug_in_sysfs_async_scanning():
         # no devices from this scsi host, yet
         scsi_host_scan(host)
+        refresh_scsi_topology_snapshot()
         channels = get_channels(host)
     for channel in channels:
-        targets = get_targets(host, channel)
-        for target in targets:
-            subprocesses.extend([Process(target=try_target_scan, args=(host, channel, target))])
-    return subprocesses
+        for target in get_targets(host, channel):
+            targets.append((host, channel, target))
+    return targets
+
+def _try_target_scan(args):
+    try_target_scan(*args)
 
 @func_logger
 def rescan_scsi_hosts():
-    subprocesses = []
-    for host_number in get_hosts():
-        subprocesses.extend(rescan_scsi_host(host_number))
-    for subprocess in subprocesses:
-        subprocess.join()
+    from multiprocessing.pool import ThreadPool
+    # the scsi commands of all the targets are executed by a bounded pool of long-lived worker processes, and the
+    # targets are scanned by threads since the rest of a target scan is sysfs and /proc/scsi/scsi I/O;
+    # the topology getters, the /proc/scsi/scsi checks and the scsi generic lookups are answered from one snapshot,
+    # that is refreshed after devices are added or removed
+    with scsi_command_worker_pool(), scsi_topology_snapshot():
+        targets = []
+        for host_number in get_hosts():
+            targets.extend(rescan_scsi_host(host_number))
+        if not targets:
+            return
+        pool = ThreadPool(min(TARGET_SCAN_CONCURRENCY, len(targets)))
+        try:
+            pool.map(_try_target_scan, targets)
+        finally:
+            pool.close()
+            pool.join()
 
@@ -53,17 +53,17 @@ def remove_device_via_sysfs(host, channel, target, lun):
         return False
     return True
 
-def do_scsi_cdb_with_in_process(queue, sg_device, cdb):
-    """:param queue: either a gipc pipe or a multiprocessing queue"""
+@check_for_scsi_errors
+def execute_cdb(sg_device, cdb):
+    """executes the cdb on the sg device in this process, without a timeout of its own"""
     from infi.asi.coroutines.sync_adapter import sync_wait
+    with asi_context(sg_device) as executer:
+        return sync_wait(cdb.execute(executer))
 
-    @check_for_scsi_errors
-    def func(sg_device, cdb):
-        with asi_context(sg_device) as executer:
-            queue.put(sync_wait(cdb.execute(executer)))
-
+def do_scsi_cdb_with_in_process(queue, sg_device, cdb):
+    """:param queue: either a gipc pipe or a multiprocessing queue"""
     try:
-        func(sg_device, cdb)
+        queue.put(execute_cdb(sg_device, cdb))
     except:  # HIP-672 can't use logger in the child process
         try:  # HIP-673 in case we failed to contact the parent process
             queue.put(ScsiCommandFailed())
@@ -141,8 +141,7 @@ def ensure_subprocess_dead(subprocess):
             logger.debug("{} failed to terminate multiprocessing {}".format(getpid(), pid))
     subprocess.join()
 
-@func_logger
-def do_scsi_cdb(sg_device, cdb):
+def do_scsi_cdb_in_subprocess(sg_device, cdb):
     pipe_context = get_pipe_context()
     with pipe_context as (reader, writer):
         logger.debug("{} issuing cdb {!r} on {} with multiprocessing".format(getpid(), cdb, sg_device))
@@ -151,6 +150,17 @@ def do_scsi_cdb(sg_device, cdb):
         return_value = read_from_queue(reader, subprocess)
         logger.debug("{} multiprocessing {} returned {!r}".format(getpid(), subprocess.pid, return_value))
         ensure_subprocess_dead(subprocess)
+    return return_value
+
+@func_logger
+def do_scsi_cdb(sg_device, cdb):
+    from .workers import get_current_pool
+    pool = get_current_pool()
+    if pool is not None:
+        logger.debug("{} issuing cdb {!r} on {} with the worker pool".format(getpid(), cdb, sg_device))
+        return_value = pool.execute(sg_device, cdb)
+    else:
+        return_value = do_scsi_cdb_in_subprocess(sg_device, cdb)
     if isinstance(return_value, ScsiCheckConditionError):
         raise ScsiCheckConditionError(return_value.sense_key, return_value.code_name)
     if isinstance(return_value, ScsiCommandFailed):
@@ -0,0 +1,180 @@
+from logging import getLogger
+from os import getpid
+from threading import Lock, BoundedSemaphore
+from infi.pyutils.contexts import contextmanager
+from .utils import ScsiCommandFailed, ScsiCheckConditionError, TIMEOUT_IN_SEC
+
+logger = getLogger(__name__)
+
+SCSI_COMMAND_WORKER_COUNT = 16
+
+# the pool of the rescan that is running in this process, see scsi_command_worker_pool
+_current_pool = None
+
+
+def get_current_pool():
+    """:returns: the :class:`ScsiCommandWorkerPool` of the running rescan, or None"""
+    return _current_pool
+
+
+@contextmanager
+def _logging_locks_held():
+    """holds the lock of the logging module and the locks of all the handlers.
+
+    A process that is forked meanwhile does not inherit a lock that another thread (e.g. a scanning thread that is
+    logging) holds, which would deadlock the process when it logs. In the forked process, the locks are held by the
+    thread that forked it, and since they are re-entrant, that thread can still log"""
+    import logging
+    logging._acquireLock()
+    try:
+        loggers = [logging.getLogger()] + [item for item in logging.Logger.manager.loggerDict.values()
+                                           if isinstance(item, logging.Logger)]
+        handlers = list(set(handler for item in loggers for handler in item.handlers))
+        for index, handler in enumerate(handlers):
+            try:
+                handler.acquire()
+            except:
+                for acquired_handler in reversed(handlers[:index]):
+                    acquired_handler.release()
+                raise
+        try:
+            yield
+        finally:
+            for handler in reversed(handlers):
+                handler.release()
+    finally:
+        logging._releaseLock()
+
+
+def _worker_main(connection):
+    """the loop of a worker process: executes every (sg_device, cdb) it receives and sends back the result"""
+    from .scsi import execute_cdb
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, IOError):
+            return
+        if request is None:
+            return
+        sg_device, cdb = request
+        try:
+            result = execute_cdb(sg_device, cdb)
+        except ScsiCheckConditionError, error:
+            result = ScsiCheckConditionError(error.sense_key, error.code_name)
+        except:  # the parent logs the failure, see HIP-672
+            result = ScsiCommandFailed()
+        try:
+            connection.send(result)
+        except:  # the parent is gone, or the result can't be pickled
+            try:
+                connection.send(ScsiCommandFailed())
+            except:
+                return
+
+
+class ScsiCommandWorker(object):
+    """A long-lived process that executes SCSI commands one at a time, over a pipe"""
+
+    def __init__(self):
+        from multiprocessing import Pipe, Process
+        super(ScsiCommandWorker, self).__init__()
+        self.connection, child_connection = Pipe()
+        self.process = Process(target=_worker_main, args=(child_connection,))
+        self.process.daemon = True
+        # workers that replace hung ones are forked while the scanning threads are running and logging
+        with _logging_locks_held():
+            self.process.start()
+        child_connection.close()
+
+    def execute(self, sg_device, cdb, timeout):
+        """:returns: the result of the command, or an instance of :exc:`ScsiCommandFailed` if it failed.
+        :raises: :exc:`ScsiCommandFailed` if the worker did not respond within the timeout (in seconds)"""
+        self.connection.send((sg_device, cdb))
+        if not self.connection.poll(timeout):
+            msg = "{} scsi command worker {} did not return within {} seconds timeout"
+            logger.error(msg.format(getpid(), self.process.pid, timeout))
+            raise ScsiCommandFailed()
+        return self.connection.recv()
+
+    def kill(self):
+        from .scsi import ensure_subprocess_dead
+        ensure_subprocess_dead(self.process)
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join(TIMEOUT_IN_SEC)
+        self.kill()
+
+
+class ScsiCommandWorkerPool(object):
+    """A bounded pool of :class:`ScsiCommandWorker` processes.
+
+    Every command gets its own deadline; a worker that misses it is killed and replaced by a new one, so a hung
+    device costs one process instead of every command forking a process of its own"""
+
+    def __init__(self, size=SCSI_COMMAND_WORKER_COUNT, timeout=TIMEOUT_IN_SEC):
+        super(ScsiCommandWorkerPool, self).__init__()
+        self._timeout = timeout
+        self._semaphore = BoundedSemaphore(size)
+        self._lock = Lock()
+        # the workers are forked before the scanning threads start; replacements are forked while holding the
+        # logging locks, see _logging_locks_held
+        self._idle_workers = [ScsiCommandWorker() for _ in range(size)]
+        self.replaced_worker_count = 0
+
+    def _acquire(self):
+        self._semaphore.acquire()
+        with self._lock:
+            if self._idle_workers:
+                return self._idle_workers.pop()
+        try:
+            return ScsiCommandWorker()
+        except:
+            self._semaphore.release()
+            raise
+
+    def _release(self, worker):
+        if worker is not None:
+            with self._lock:
+                self._idle_workers.append(worker)
+        self._semaphore.release()
+
+    def execute(self, sg_device, cdb):
+        """:returns: the result of the command, or an instance of :exc:`ScsiCommandFailed` if it failed,
+        like the values :func:`.scsi.do_scsi_cdb_with_in_process` puts in its queue"""
+        worker = self._acquire()
+        try:
+            return worker.execute(sg_device, cdb, self._timeout)
+        except:
+            logger.exception("{} scsi command {!r} on {} failed, replacing the worker".format(getpid(), cdb, sg_device))
+            worker.kill()
+            worker = None
+            with self._lock:
+                self.replaced_worker_count += 1
+            return ScsiCommandFailed()
+        finally:
+            self._release(worker)
+
+    def close(self):
+        with self._lock:
+            workers, self._idle_workers = self._idle_workers, []
+        for worker in workers:
+            worker.stop()
+
+
+@contextmanager
+def scsi_command_worker_pool(size=SCSI_COMMAND_WORKER_COUNT, timeout=TIMEOUT_IN_SEC):
+    """executes the SCSI commands of the rescan in this process on a pool of workers, instead of a process per
+    command, until the context exits"""
+    global _current_pool
+    pool = ScsiCommandWorkerPool(size, timeout)
+    previous, _current_pool = _current_pool, pool
+    try:
+        yield pool
+    finally:
+        _current_pool = previous
+        pool.close()
@@ -0,0 +1,192 @@
+import os
+import re
+from collections import namedtuple
+from .sysfs import _sysfs_read_field
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+END_DEVICE_PREFIX = "end_device-"
+EXPANDER_PREFIX = "expander-"
+PORT_PREFIX = "port-"
+HOST_PATTERN = re.compile(r"^host(?P<host>\d+)$")
+TARGET_PATTERN = re.compile(r"^target(?P<host>\d+):(?P<channel>\d+):(?P<target>\d+)$")
+
+SASPhy = namedtuple("SASPhy", ["name", "sas_address", "phy_identifier"])
+SASExpander = namedtuple("SASExpander", ["name", "sas_address", "phys"])
+# expander is None for end devices that are attached directly to the host; host_phys are the phys of the host port
+# the device (or its expander) is attached to; enclosure_identifier and bay_identifier are None if unknown
+SASEndDevice = namedtuple("SASEndDevice", ["name", "sas_address", "hct", "expander", "host_phys",
+                                           "enclosure_identifier", "bay_identifier"])
+
+
+def _read_optional_field(path, field):
+    try:
+        return _sysfs_read_field(path, field).strip()
+    except (IOError, OSError):
+        return None
+
+
+class SysfsSASTopology(object):
+    """Relates the SAS end devices to their expanders and host phys, from the SAS transport classes in sysfs.
+
+    /sys/class/sas_device, sas_expander, sas_phy and sas_end_device are each listed once; the relations are taken
+    from the device paths the class entries link to, e.g.
+    /sys/devices/.../host6/port-6:0/expander-6:0/port-6:0:3/end_device-6:0:3/target6:0:3.
+    The topology is kept until the generation changes: the listing of the devices and the phys, and the targets of the
+    end devices that had none, since the target of an end device is added after its sas_device entry. A topology that
+    was built while an end device could not be read is not kept"""
+
+    def __init__(self, sysfs_root="/sys"):
+        super(SysfsSASTopology, self).__init__()
+        self.sysfs_sas_device_path = os.path.join(sysfs_root, "class", "sas_device")
+        self.sysfs_sas_expander_path = os.path.join(sysfs_root, "class", "sas_expander")
+        self.sysfs_sas_phy_path = os.path.join(sysfs_root, "class", "sas_phy")
+        self.sysfs_sas_end_device_path = os.path.join(sysfs_root, "class", "sas_end_device")
+        self._generation = None
+        self._end_devices = None
+        self._pending_end_device_names = ()
+
+    def is_available(self):
+        """:returns: True if the SAS transport class is in sysfs, i.e. a SAS driver is loaded"""
+        return os.path.isdir(self.sysfs_sas_device_path)
+
+    def _listdir(self, path):
+        try:
+            return os.listdir(path)
+        except OSError:
+            return []
+
+    def _get_target_names(self, end_device_name):
+        device_path = self._get_device_path(self.sysfs_sas_device_path, end_device_name)
+        return tuple(sorted(name for name in self._listdir(device_path) if TARGET_PATTERN.match(name)))
+
+    def get_generation(self):
+        """:returns: a token that changes whenever a SAS device or phy is added or removed, or an end device that had
+        no target gets one"""
+        return (tuple(sorted(self._listdir(self.sysfs_sas_device_path))),
+                tuple(sorted(self._listdir(self.sysfs_sas_phy_path))),
+                tuple(self._get_target_names(name) for name in self._pending_end_device_names))
+
+    def invalidate(self):
+        """forgets the topology, so it is rebuilt on the next call to :meth:`get_sas_hctl_mappings`"""
+        self._generation = None
+        self._end_devices = None
+        self._pending_end_device_names = ()
+
+    def _get_device_path(self, class_path, name):
+        return os.path.realpath(os.path.join(class_path, name, "device"))
+
+    def _get_phys(self, phy_names):
+        """:returns: a dict of the device path of the phy's parent (a host or an expander) to its list of phys,
+        and a dict of phy name to phy"""
+        phys_by_parent, phys_by_name = dict(), dict()
+        for name in phy_names:
+            path = os.path.join(self.sysfs_sas_phy_path, name)
+            try:
+                device_path = self._get_device_path(self.sysfs_sas_phy_path, name)
+                phy_identifier = _read_optional_field(path, "phy_identifier")
+                phy = SASPhy(name, _read_optional_field(path, "sas_address"),
+                             int(phy_identifier) if phy_identifier is not None else None)
+            except (IOError, OSError):
+                logger.debug("sas phy {} disappeared".format(name))
+                continue
+            phys_by_parent.setdefault(os.path.dirname(device_path), []).append(phy)
+            phys_by_name[name] = phy
+        return phys_by_parent, phys_by_name
+
+    def _get_expanders(self, phys_by_parent):
+        """:returns: a dict of the device path of the expander to the expander"""
+        expanders = dict()
+        for name in self._listdir(self.sysfs_sas_expander_path):
+            try:
+                device_path = self._get_device_path(self.sysfs_sas_expander_path, name)
+            except (IOError, OSError):
+                logger.debug("sas expander {} disappeared".format(name))
+                continue
+            # the sas address of an expander is in its sas_device entry, the sas_expander entry has the inquiry data
+            sas_address = _read_optional_field(os.path.join(self.sysfs_sas_device_path, name), "sas_address")
+            expanders[device_path] = SASExpander(name, sas_address, phys_by_parent.get(device_path, []))
+        return expanders
+
+    def _get_host_phys(self, device_path, phys_by_name, cache):
+        """:returns: the host phys of the port right under the host, in the device path of an end device"""
+        parts = device_path.split(os.sep)
+        for index, part in enumerate(parts[:-1]):
+            if HOST_PATTERN.match(part) and parts[index + 1].startswith(PORT_PREFIX):
+                port_path = os.sep.join(parts[:index + 2])
+                if port_path not in cache:
+                    # the port has links to the phys that are its members
+                    cache[port_path] = [phys_by_name[name] for name in sorted(self._listdir(port_path))
+                                        if name in phys_by_name]
+                return cache[port_path]
+        return []
+
+    def _get_expander(self, device_path, expanders):
+        """:returns: the nearest expander above the device path, or None"""
+        path = os.path.dirname(device_path)
+        while path != os.path.dirname(path):
+            if os.path.basename(path).startswith(EXPANDER_PREFIX):
+                return expanders.get(path)
+            if HOST_PATTERN.match(os.path.basename(path)):
+                return None
+            path = os.path.dirname(path)
+        return None
+
+    def _get_targets(self, device_path):
+        targets = []
+        for name in self._listdir(device_path):
+            match = TARGET_PATTERN.match(name)
+            if match is not None:
+                targets.append((int(match.group("host")), int(match.group("channel")), int(match.group("target"))))
+        return targets
+
+    def _build(self, device_names, phy_names):
+        """:returns: the mappings, the names of the end devices without targets, and False if an end device could not
+        be read"""
+        phys_by_parent, phys_by_name = self._get_phys(phy_names)
+        expanders = self._get_expanders(phys_by_parent)
+        host_phys_by_port = dict()
+        result, pending_end_device_names, complete = dict(), [], True
+        for name in device_names:
+            if not name.startswith(END_DEVICE_PREFIX):
+                continue
+            try:
+                device_path = self._get_device_path(self.sysfs_sas_device_path, name)
+                sas_address = _read_optional_field(os.path.join(self.sysfs_sas_device_path, name), "sas_address")
+                end_device_path = os.path.join(self.sysfs_sas_end_device_path, name)
+                enclosure_identifier = _read_optional_field(end_device_path, "enclosure_identifier")
+                bay_identifier = _read_optional_field(end_device_path, "bay_identifier")
+                targets = self._get_targets(device_path)
+            except (IOError, OSError):
+                logger.debug("sas end device {} disappeared".format(name))
+                complete = False
+                continue
+            if not targets:
+                pending_end_device_names.append(name)
+            expander = self._get_expander(device_path, expanders)
+            host_phys = self._get_host_phys(device_path, phys_by_name, host_phys_by_port)
+            for hct in targets:
+                result[hct] = SASEndDevice(name, sas_address, hct, expander, host_phys, enclosure_identifier,
+                                           int(bay_identifier) if bay_identifier not in (None, "-1") else None)
+        return result, pending_end_device_names, complete
+
+    def get_sas_hctl_mappings(self):
+        """:returns: a dict of (host, channel, target) to :class:`SASEndDevice`"""
+        generation = self.get_generation()
+        if generation != self._generation:
+            device_names, phy_names, _ = generation
+            self._end_devices, pending_end_device_names, complete = self._build(device_names, phy_names)
+            self._pending_end_device_names = tuple(sorted(pending_end_device_names))
+            # the end devices without targets had none when they were read, so a target added since is mapped
+            self._generation = (device_names, phy_names, ((),) * len(self._pending_end_device_names)) \
+                if complete else None
+        return self._end_devices
+
+    def get_expanders(self):
+        """:returns: a dict of expander sas address to the list of end devices behind it"""
+        result = dict()
+        for end_device in self.get_sas_hctl_mappings().values():
+            if end_device.expander is not None:
+                result.setdefault(end_device.expander.sas_address, []).append(end_device)
+        return result
@@ -32,8 +32,16 @@ class LinuxSCSIDeviceMixin(object):
 
     @cached_method
     def get_sas_address(self):
+        from ..connectivity import SASConnectivity
+        connectivity = self.get_connectivity()
+        if isinstance(connectivity, SASConnectivity):
+            return connectivity.get_target_sas_address()
         return self.sysfs_device.get_sas_address()
 
+    @cached_method
+    def get_cached_wwid(self):
+        return self.sysfs_device.get_wwid()
+
     @cached_method
     def get_scsi_access_path(self):
         return "/dev/%s" % self.sysfs_device.get_scsi_generic_device_name()
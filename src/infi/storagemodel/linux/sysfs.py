@@ -92,6 +92,14 @@ class SysfsSCSIDevice(object):
         else:
             return None
 
+    def get_wwid(self):
+        """:returns: the WWID the kernel read from VPD page 0x83 when it scanned the device (e.g.
+        naa.6742b0f000004e2b000000000000018c), or None on kernels that do not have it"""
+        try:
+            return _sysfs_read_field(self.sysfs_dev_path, "wwid").strip()
+        except (IOError, OSError):
+            return None
+
     def get_scsi_generic_devno(self):
         return _sysfs_read_devno(self.sysfs_scsi_generic_device_path)
 
@@ -160,6 +168,7 @@ class Sysfs(object):
         self.enclosures = []
         self.block_devices = []
         self.block_devno_to_device = dict()
+        self.hctl_to_sd_disk = dict()
 
     @cached_method
     def _populate(self):
@@ -208,6 +217,7 @@ class Sysfs(object):
                 self.sg_disks.append(sd_disk)
                 self.block_devices.append(sd_disk)
                 self.block_devno_to_device[sd_disk.get_block_devno()] = sd_disk
+                self.hctl_to_sd_disk[sd_disk.get_hctl()] = sd_disk
         
 
     def _get_sysfs_block_devices_pathnames(self):
@@ -253,10 +263,9 @@ class Sysfs(object):
 
     def find_scsi_disk_by_hctl(self, hctl):
         self._populate()
-        disk = [disk for disk in self.sd_disks if disk.get_hctl() == hctl]
-        if len(disk) != 1:
+        if hctl not in self.hctl_to_sd_disk:
             raise ValueError("cannot find a disk with HCTL %s" % (str(hctl),))
-        return disk[0]
+        return self.hctl_to_sd_disk[hctl]
 
     def __repr__(self):
         _repr = ("<Sysfs: sg_disks={!r}, sd_disks={!r}, controllers={!r}, block_devices={!r}, " +
@@ -0,0 +1,168 @@
+from ..utils import sleep
+
+from logging import getLogger
+logger = getLogger(__name__)
+
+SAMPLING_INTERVAL_IN_SEC = 10
+SKEW_THRESHOLD = 0.25           # the largest difference between the actual and expected share of a path
+MINIMUM_IO_COUNT = 100          # devices with less I/O during the interval are considered idle
+
+
+class PathLoad(object):
+    """The load a single path carried during the sampling interval"""
+    def __init__(self, path_id, expected_share, io_count, byte_count, io_share, byte_share):
+        super(PathLoad, self).__init__()
+        self.path_id = path_id
+        self.expected_share = expected_share
+        self.io_count = io_count
+        self.byte_count = byte_count
+        self.io_share = io_share
+        self.byte_share = byte_share
+
+    def get_skew(self):
+        """:returns: the largest difference between the expected share and the actual share of IOPS or bytes"""
+        return max(abs(self.io_share - self.expected_share), abs(self.byte_share - self.expected_share))
+
+    def __repr__(self):
+        return "<PathLoad {}: expected {:.2f}, iops {:.2f}, bytes {:.2f}>".format(self.path_id, self.expected_share,
+                                                                              self.io_share, self.byte_share)
+
+
+class DeviceLoadReport(object):
+    """The load of the paths of a multipath device during the sampling interval"""
+    def __init__(self, device, policy_name, path_loads, interval):
+        super(DeviceLoadReport, self).__init__()
+        self.device = device
+        self.policy_name = policy_name
+        self.path_loads = path_loads
+        self.interval = interval
+
+    def get_io_count(self):
+        return sum(path_load.io_count for path_load in self.path_loads)
+
+    def get_iops(self):
+        return self.get_io_count() / float(self.interval)
+
+    def is_idle(self, minimum_io_count=MINIMUM_IO_COUNT):
+        return self.get_io_count() < minimum_io_count
+
+    def get_skew(self):
+        """:returns: the skew of the most skewed path, or 0 if the device had no I/O"""
+        return max([path_load.get_skew() for path_load in self.path_loads] or [0])
+
+    def is_skewed(self, threshold=SKEW_THRESHOLD, minimum_io_count=MINIMUM_IO_COUNT):
+        return not self.is_idle(minimum_io_count) and self.get_skew() > threshold
+
+    def __repr__(self):
+        return "<DeviceLoadReport {!r} ({}): skew {:.2f}, {:.1f} iops>".format(self.device, self.policy_name,
+                                                                           self.get_skew(), self.get_iops())
+
+
+def get_expected_shares(policy, paths, path_group_path_ids=None):
+    """:returns: a dict of path id to the share of the I/O it should carry under the policy, considering only paths
+    that are up, or None if the policy does not imply a distribution (e.g. Least Queue Depth).
+    :param path_group_path_ids: if not None, the ids of the paths in the active path group; the policy applies only
+    within that group, and the paths of the other groups should carry no I/O"""
+    from ..base import multipath
+    path_ids = [path.get_path_id() for path in paths if path.get_state() == "up"]
+    candidate_path_ids = path_ids if path_group_path_ids is None else \
+        [path_id for path_id in path_ids if path_id in path_group_path_ids]
+    if isinstance(policy, multipath.FailoverOnly):
+        if policy.active_path_id not in candidate_path_ids:
+            # the active path is down, so any of the others may have taken over
+            return None
+        active_path_ids = [policy.active_path_id]
+    elif isinstance(policy, multipath.RoundRobinWithSubset):
+        active_path_ids = [path_id for path_id in candidate_path_ids if path_id in policy.active_path_ids]
+    elif isinstance(policy, multipath.WeightedPaths):
+        # I/O goes to the path with the least weight; paths with the same weight share it
+        least_weight = min([policy.weights[path_id] for path_id in candidate_path_ids if path_id in policy.weights] or
+                           [None])
+        active_path_ids = [path_id for path_id in candidate_path_ids if policy.weights.get(path_id) == least_weight]
+    elif isinstance(policy, multipath.RoundRobin):
+        active_path_ids = candidate_path_ids
+    else:
+        return None
+    if not active_path_ids:
+        # none of the paths that should carry the I/O is up, so the device is failing over
+        return None
+    return dict((path_id, 1.0 / len(active_path_ids) if path_id in active_path_ids else 0.)
+                for path_id in path_ids)
+
+
+class LoadImbalanceAnalyzer(object):
+    """Finds multipath devices whose paths do not share the I/O the way their load balance policy says they should.
+
+    The per-path I/O counters of all the devices are read in one pass, and read again in a second pass after the
+    sampling interval, so analyzing the whole host takes a single interval."""
+
+    def __init__(self, interval=SAMPLING_INTERVAL_IN_SEC, threshold=SKEW_THRESHOLD, minimum_io_count=MINIMUM_IO_COUNT):
+        super(LoadImbalanceAnalyzer, self).__init__()
+        self.interval = interval
+        self.threshold = threshold
+        self.minimum_io_count = minimum_io_count
+
+    def _sample(self, devices_and_paths):
+        """:returns: a list, for every device, of a dict of path id to its `PathStatistics`"""
+        result = []
+        for device, paths in devices_and_paths:
+            statistics = dict()
+            for path in paths:
+                try:
+                    statistics[path.get_path_id()] = path.get_io_statistics()
+                except (IOError, OSError, NotImplementedError):
+                    logger.debug("cannot get the I/O statistics of {!r} of {!r}".format(path, device))
+            result.append(statistics)
+        return result
+
+    def _get_report(self, device, expected_shares, before, after):
+        deltas = [(path_id,
+                   (after[path_id].read_io_count + after[path_id].write_io_count) -
+                   (before[path_id].read_io_count + before[path_id].write_io_count),
+                   (after[path_id].bytes_read + after[path_id].bytes_written) -
+                   (before[path_id].bytes_read + before[path_id].bytes_written))
+                  for path_id in sorted(expected_shares) if path_id in before and path_id in after]
+        total_ios = sum(io_count for _, io_count, _ in deltas)
+        total_bytes = sum(byte_count for _, _, byte_count in deltas)
+        path_loads = [PathLoad(path_id, expected_shares[path_id], io_count, byte_count,
+                               io_count / float(total_ios) if total_ios else 0.,
+                               byte_count / float(total_bytes) if total_bytes else 0.)
+                      for path_id, io_count, byte_count in deltas]
+        return DeviceLoadReport(device, device.get_policy().get_display_name(), path_loads, self.interval)
+
+    def analyze(self, devices):
+        """:param devices: a list of :class:`.base.multipath.MultipathBlockDevice`
+        :returns: a list of :class:`DeviceLoadReport` for the devices whose policy implies a distribution,
+        most skewed first"""
+        devices_and_paths = []
+        expected_shares = []
+        for device in devices:
+            paths = device.get_paths()
+            try:
+                path_group_path_ids = device.get_active_path_group_path_ids()
+            except ValueError:
+                logger.debug("cannot tell the active path group of {!r}, skipping it".format(device))
+                continue
+            shares = get_expected_shares(device.get_policy(), paths, path_group_path_ids)
+            if shares is None:
+                logger.debug("{!r} has policy {!r}, skipping it".format(device, device.get_policy()))
+                continue
+            devices_and_paths.append((device, paths))
+            expected_shares.append(shares)
+        before = self._sample(devices_and_paths)
+        sleep(self.interval)
+        after = self._sample(devices_and_paths)
+        reports = [self._get_report(device, shares, first, second) for (device, _), shares, first, second
+                   in zip(devices_and_paths, expected_shares, before, after)]
+        return sorted(reports, key=lambda report: report.get_skew(), reverse=True)
+
+    def get_skewed_devices(self, devices):
+        """:returns: a list of :class:`DeviceLoadReport` only for the devices that are skewed"""
+        return [report for report in self.analyze(devices) if report.is_skewed(self.threshold, self.minimum_io_count)]
+
+
+def get_skewed_multipath_devices(interval=SAMPLING_INTERVAL_IN_SEC, threshold=SKEW_THRESHOLD):
+    """:returns: a list of :class:`DeviceLoadReport` for the skewed native multipath devices on this host"""
+    from .. import get_storage_model
+    devices = get_storage_model().get_native_multipath().get_all_multipath_block_devices()
+    return LoadImbalanceAnalyzer(interval, threshold).get_skewed_devices(devices)
@@ -0,0 +1,107 @@
+from unittest import TestCase
+from mock import patch
+from ..base import multipath
+from . import LoadImbalanceAnalyzer, get_expected_shares
+
+# pylint: disable=R0904
+
+
+class Path(multipath.Path):
+    def __init__(self, path_id, state="up"):
+        super(Path, self).__init__()
+        self.path_id = path_id
+        self.state = state
+        self.ios = 0
+
+    def get_path_id(self):
+        return self.path_id
+
+    def get_state(self):
+        return self.state
+
+    def get_io_statistics(self):
+        return multipath.PathStatistics(self.ios * 4096, 0, self.ios, 0)
+
+
+class Device(object):
+    def __init__(self, paths, policy, active_path_group_path_ids=None):
+        self.paths = paths
+        self.policy = policy
+        self.active_path_group_path_ids = active_path_group_path_ids
+
+    def get_paths(self):
+        return self.paths
+
+    def get_policy(self):
+        return self.policy
+
+    def get_active_path_group_path_ids(self):
+        if isinstance(self.active_path_group_path_ids, Exception):
+            raise self.active_path_group_path_ids
+        return self.active_path_group_path_ids
+
+
+class ExpectedSharesTestCase(TestCase):
+    def setUp(self):
+        self.paths = [Path("sdb"), Path("sdc"), Path("sdd", "down")]
+
+    def test_round_robin(self):
+        self.assertEqual(get_expected_shares(multipath.RoundRobin(), self.paths), {"sdb": 0.5, "sdc": 0.5})
+
+    def test_failover_only(self):
+        self.assertEqual(get_expected_shares(multipath.FailoverOnly("sdc"), self.paths), {"sdb": 0., "sdc": 1.})
+        self.assertEqual(get_expected_shares(multipath.FailoverOnly("sdd"), self.paths), None)
+
+    def test_subset(self):
+        policy = multipath.RoundRobinWithExplicitSubset(["sdb", "sdd"])
+        self.assertEqual(get_expected_shares(policy, self.paths), {"sdb": 1., "sdc": 0.})
+
+    def test_weighted_paths(self):
+        policy = multipath.WeightedPaths({"sdb": 2, "sdc": 1, "sdd": 0})
+        self.assertEqual(get_expected_shares(policy, self.paths), {"sdb": 0., "sdc": 1.})
+
+    def test_active_path_group(self):
+        self.assertEqual(get_expected_shares(multipath.RoundRobin(), self.paths, set(["sdc", "sdd"])),
+                         {"sdb": 0., "sdc": 1.})
+        self.assertEqual(get_expected_shares(multipath.RoundRobin(), self.paths, set(["sdd"])), None)
+
+    def test_no_distribution(self):
+        self.assertEqual(get_expected_shares(multipath.LeastQueueDepth(), self.paths), None)
+
+
+class LoadImbalanceAnalyzerTestCase(TestCase):
+    def _analyze(self, devices, load):
+        def sleep(interval):
+            for path, ios in load.items():
+                path.ios += ios
+        with patch("infi.storagemodel.load_balance.sleep", sleep):
+            return LoadImbalanceAnalyzer(interval=1).get_skewed_devices(devices)
+
+    def test_skewed_device(self):
+        balanced = Device([Path("sdb"), Path("sdc")], multipath.RoundRobin())
+        skewed = Device([Path("sdd"), Path("sde")], multipath.RoundRobin())
+        idle = Device([Path("sdf"), Path("sdg")], multipath.RoundRobin())
+        load = {balanced.paths[0]: 500, balanced.paths[1]: 520, skewed.paths[0]: 1000, idle.paths[0]: 10}
+        [report] = self._analyze([balanced, skewed, idle], load)
+        self.assertIs(report.device, skewed)
+        self.assertEqual([(path_load.path_id, path_load.io_share) for path_load in report.path_loads],
+                         [("sdd", 1.), ("sde", 0.)])
+        self.assertEqual(report.get_skew(), 0.5)
+
+    def test_failover_only_is_not_skewed(self):
+        device = Device([Path("sdb"), Path("sdc")], multipath.FailoverOnly("sdc"))
+        self.assertEqual(self._analyze([device], {device.paths[1]: 1000}), [])
+
+    def test_standby_path_group_is_not_skewed(self):
+        # with ALUA, multipathd round-robins only within the active path group; the paths of the standby group are up
+        paths = [Path("sdb"), Path("sdc"), Path("sdd"), Path("sde")]
+        device = Device(paths, multipath.RoundRobin(), set(["sdb", "sdc"]))
+        self.assertEqual(self._analyze([device], {paths[0]: 500, paths[1]: 500}), [])
+        [report] = self._analyze([device], {paths[2]: 1000})
+        self.assertEqual([(path_load.path_id, path_load.expected_share) for path_load in report.path_loads],
+                         [("sdb", 0.5), ("sdc", 0.5), ("sdd", 0.), ("sde", 0.)])
+
+    def test_unknown_active_path_group_is_skipped(self):
+        paths = [Path("sdb"), Path("sdc")]
+        device = Device(paths, multipath.RoundRobin(), ValueError())
+        self.assertEqual(self._analyze([device], {paths[0]: 1000}), [])
@@ -1,31 +1,154 @@
 
 from logging import getLogger
-from itertools import product
+from collections import namedtuple
 
 logger = getLogger(__name__)
 
 
-class PredicateList(object):
+# the layers a predicate may need, and the relative cost of querying them
+LAYER_SYSFS = "sysfs"
+LAYER_HBAAPI = "hbaapi"
+LAYER_MULTIPATH = "multipath"
+LAYER_SCSI_IO = "scsi_io"
+LAYER_COSTS = {LAYER_SYSFS: 1, LAYER_HBAAPI: 2, LAYER_MULTIPATH: 4, LAYER_SCSI_IO: 8}
+# predicates that do not declare their layers are assumed to need all of them
+ALL_LAYERS = frozenset(LAYER_COSTS)
+
+# elapsed is in seconds; result and elapsed are None if the predicate was skipped
+PredicateEvaluation = namedtuple("PredicateEvaluation", ["predicate", "result", "elapsed"])
+
+
+def get_predicate_layers(predicate):
+    """:returns: the layers the predicate declares in its `layers` attribute, or all the layers if it does not"""
+    layers = getattr(predicate, "layers", None)
+    return ALL_LAYERS if layers is None else frozenset(layers)
+
+
+def get_predicate_cost(predicate):
+    return sum(LAYER_COSTS.get(layer, max(LAYER_COSTS.values())) for layer in get_predicate_layers(predicate))
+
+
+class CompositePredicate(object):
+    """Base class for predicates made of other predicates.
+
+    The predicates are evaluated cheapest first (by the layers they need, ties keep their order), and the evaluation
+    stops as soon as the result is decided. The evaluations of the last call are kept for :meth:`get_evaluations`"""
+
+    def __init__(self, predicates):
+        super(CompositePredicate, self).__init__()
+        self._predicates = list(predicates)
+        self._evaluations = []
+
+    @property
+    def layers(self):
+        return frozenset().union(*[get_predicate_layers(predicate) for predicate in self._predicates])
+
+    def get_ordered_predicates(self):
+        return sorted(self._predicates, key=get_predicate_cost)
+
+    def get_evaluations(self):
+        """:returns: a list of :class:`PredicateEvaluation` of the last call, in evaluation order, skipped last"""
+        return list(self._evaluations)
+
+    def _is_decided(self, true_count, false_count, remaining_count):
+        """:returns: the result if it can be decided from the counts, None otherwise"""
+        raise NotImplementedError()  # pragma: no cover
+
+    def __call__(self):
+        from time import time
+        self._evaluations = []
+        ordered_predicates = self.get_ordered_predicates()
+        true_count, false_count = 0, 0
+        result = self._is_decided(0, 0, len(ordered_predicates))
+        for index, predicate in enumerate(ordered_predicates):
+            if result is not None:
+                self._evaluations.extend(PredicateEvaluation(skipped, None, None)
+                                         for skipped in ordered_predicates[index:])
+                break
+            start = time()
+            predicate_result = bool(predicate())
+            elapsed = time() - start
+            logger.debug("Predicate {!r} returned {} in {:.3f} seconds".format(predicate, predicate_result, elapsed))
+            self._evaluations.append(PredicateEvaluation(predicate, predicate_result, elapsed))
+            if predicate_result:
+                true_count += 1
+            else:
+                false_count += 1
+            result = self._is_decided(true_count, false_count, len(ordered_predicates) - index - 1)
+        logger.debug("{!r} returning {}".format(self, result))
+        return result
+
+    def __repr__(self):
+        return "<{}: {!r}>".format(self.__class__.__name__, self._predicates)
+
+
+class And(CompositePredicate):
+    """:returns: True if all the predicates return True"""
+    def __init__(self, *predicates):
+        super(And, self).__init__(predicates)
+
+    def _is_decided(self, true_count, false_count, remaining_count):
+        if false_count:
+            return False
+        return True if remaining_count == 0 else None
+
+
+class Or(CompositePredicate):
+    """:returns: True if any of the predicates returns True"""
+    def __init__(self, *predicates):
+        super(Or, self).__init__(predicates)
+
+    def _is_decided(self, true_count, false_count, remaining_count):
+        if true_count:
+            return True
+        return False if remaining_count == 0 else None
+
+
+class AtLeast(CompositePredicate):
+    """:returns: True if at least `count` of the predicates return True"""
+    def __init__(self, count, *predicates):
+        super(AtLeast, self).__init__(predicates)
+        self._count = count
+
+    def _is_decided(self, true_count, false_count, remaining_count):
+        if true_count >= self._count:
+            return True
+        return False if true_count + remaining_count < self._count else None
+
+    def __repr__(self):
+        return "<AtLeast {}: {!r}>".format(self._count, self._predicates)
+
+
+class Not(object):
+    """:returns: the negation of the predicate"""
+    def __init__(self, predicate):
+        super(Not, self).__init__()
+        self._predicate = predicate
+
+    @property
+    def layers(self):
+        return get_predicate_layers(self._predicate)
+
+    def __call__(self):
+        return not self._predicate()
+
+    def __repr__(self):
+        return "<Not: {!r}>".format(self._predicate)
+
+
+class PredicateList(And):
     """:returns: True if all predicates in a given list return True"""
     def __init__(self, list_of_predicates):
-        super(PredicateList, self).__init__()
+        super(PredicateList, self).__init__(*list_of_predicates)
         self._list_of_predicates = list_of_predicates
 
-    def __call__(self):
-        results = []
-        for predicate in self._list_of_predicates:
-            result = predicate()
-            logger.debug("Predicate {!r} returned {}".format(predicate, result))
-            results.append(result)
-        logger.debug("Returning {}".format(all(results)))
-        return all(results)
-
     def __repr__(self):
         return "<PredicateList: {!r}>".format(self._list_of_predicates)
 
 
 class DiskExists(object):
     """:returns: True if a disk was discovered with scsi_serial_number"""
+    layers = frozenset([LAYER_SYSFS, LAYER_MULTIPATH, LAYER_SCSI_IO])
 
     def __init__(self, scsi_serial_number):
         super(DiskExists, self).__init__()
@@ -33,15 +156,8 @@ class DiskExists(object):
 
     def __call__(self):
         from .. import get_storage_model
-        model = get_storage_model()
-        block_devices = model.get_scsi().get_all_scsi_block_devices()
-        mp_devices = model.get_native_multipath().get_all_multipath_block_devices()
-        non_mp_devices = model.get_native_multipath().filter_non_multipath_scsi_block_devices(block_devices)
-        devices = mp_devices + non_mp_devices
-        for device in devices:
-            device.get_scsi_test_unit_ready()
-        return any([device.get_scsi_serial_number() == self.scsi_serial_number
-                    for device in devices])
+        index = get_storage_model().get_identity_index()
+        return len(index.find_devices_by_serial_number(self.scsi_serial_number)) > 0
 
     def __repr__(self):
         return "<DiskExists: {}>".format(self.scsi_serial_number)
@@ -57,6 +173,82 @@ class DiskNotExists(DiskExists):
         return "<DiskNotExists: {}>".format(self.scsi_serial_number)
 
 
+class IncrementalPredicate(object):
+    """Base class for predicates that keep their state between calls, and inspect only the devices that were added,
+    removed or changed since the previous call (see :class:`.DeviceDelta`).
+
+    Subclasses implement `update`, which receives the delta, and `is_satisfied`. If `update` raises, the delta is
+    offered again on the next call, so `update` should handle seeing the same device twice.
+
+    A device whose LUN number is re-used by another volume is seen as changed only on platforms that cache the WWID
+    of the devices (e.g. Linux, see :func:`.build_device_snapshot`); elsewhere, use :class:`DiskExists` and
+    :class:`DiskNotExists` when LUN numbers are re-used"""
+    layers = frozenset([LAYER_SYSFS, LAYER_MULTIPATH, LAYER_SCSI_IO])
+
+    def __init__(self):
+        super(IncrementalPredicate, self).__init__()
+        self._snapshot = None
+
+    def reset(self):
+        """forgets the state, so the next call inspects all the devices"""
+        self._snapshot = None
+
+    def update(self, delta):  # pragma: no cover
+        raise NotImplementedError()
+
+    def is_satisfied(self):  # pragma: no cover
+        raise NotImplementedError()
+
+    def __call__(self):
+        from .. import get_storage_model
+        from ..base.delta import get_device_delta
+        snapshot = get_storage_model().get_device_snapshot()
+        delta = get_device_delta(self._snapshot, snapshot)
+        logger.debug("{!r} got {!r}".format(self, delta))
+        if not delta.is_empty():
+            self.update(delta)
+        self._snapshot = snapshot
+        return self.is_satisfied()
+
+
+class IncrementalDiskExists(IncrementalPredicate):
+    """:returns: True if a disk was discovered with scsi_serial_number; only new or changed devices are queried"""
+
+    def __init__(self, scsi_serial_number):
+        super(IncrementalDiskExists, self).__init__()
+        self.scsi_serial_number = scsi_serial_number
+        self._matching_keys = set()
+
+    def reset(self):
+        super(IncrementalDiskExists, self).reset()
+        self._matching_keys = set()
+
+    def update(self, delta):
+        for key in delta.removed.keys() + delta.changed.keys():
+            self._matching_keys.discard(key)
+        from ..base.identity import DeviceIdentityIndex
+        keys_and_devices = delta.added.items() + delta.changed.items()
+        index = DeviceIdentityIndex([device for _, device in keys_and_devices])
+        matching_devices = index.find_devices_by_serial_number(self.scsi_serial_number)
+        self._matching_keys.update(key for key, device in keys_and_devices if device in matching_devices)
+
+    def is_satisfied(self):
+        return len(self._matching_keys) > 0
+
+    def __repr__(self):
+        return "<IncrementalDiskExists: {}>".format(self.scsi_serial_number)
+
+
+class IncrementalDiskNotExists(IncrementalDiskExists):
+    """:returns: True if a disk with scsi_serial_number has gone away; only new or changed devices are queried"""
+
+    def is_satisfied(self):
+        return not super(IncrementalDiskNotExists, self).is_satisfied()
+
+    def __repr__(self):
+        return "<IncrementalDiskNotExists: {}>".format(self.scsi_serial_number)
+
+
 def build_connectivity_object_from_wwn(initiator_wwn, target_wwn):
     from infi.hbaapi import Port
     from ..connectivity import FCConnectivity
@@ -67,15 +259,66 @@ def build_connectivity_object_from_wwn(initiator_wwn, target_wwn):
     return FCConnectivity(None, local_port, remote_port)
 
 
+class FiberChannelMappingMatcher(object):
+    """Matches devices and paths against every (initiator, target, lun) combination of the given lists.
+    The combinations are not enumerated; every device is matched with a few set lookups"""
+
+    def __init__(self, initiators, targets, lun_numbers):
+        super(FiberChannelMappingMatcher, self).__init__()
+        self._initiators = frozenset(self._get_address_key(address) for address in initiators)
+        self._targets = frozenset(self._get_address_key(address) for address in targets)
+        self._lun_numbers = frozenset(lun_numbers)
+        self._matched = set()
+
+    def _get_address_key(self, wwn):
+        from ..connectivity import get_wwn_key
+        return get_wwn_key(wwn)
+
+    def _get_connectivity_class(self):
+        from ..connectivity import FCConnectivity
+        return FCConnectivity
+
+    def get_expected_count(self):
+        return len(self._initiators) * len(self._targets) * len(self._lun_numbers)
+
+    def get_missing_count(self):
+        return self.get_expected_count() - len(self._matched)
+
+    def is_complete(self):
+        return self.get_missing_count() == 0
+
+    def get_key(self, device):
+        """:returns: the (initiator, target, lun) key of the device if it is one of the combinations, or None"""
+        connectivity = device.get_connectivity()
+        if not isinstance(connectivity, self._get_connectivity_class()):
+            return None
+        initiator, target = connectivity.get_key()
+        if initiator not in self._initiators or target not in self._targets:
+            return None
+        lun_number = device.get_hctl().get_lun()
+        return (initiator, target, lun_number) if lun_number in self._lun_numbers else None
+
+    def match(self, device):
+        """:returns: True if the device is one of the combinations, and no device matched that combination before"""
+        key = self.get_key(device)
+        if key is None or key in self._matched:
+            return False
+        device.get_scsi_test_unit_ready()
+        self._matched.add(key)
+        return True
+
+
 class MultipleFiberChannelMappingExist(object):
     """:returns: True if a lun mapping was discovered"""
+    layers = frozenset([LAYER_SYSFS, LAYER_HBAAPI, LAYER_MULTIPATH, LAYER_SCSI_IO])
+
     def __init__(self, initiators, targets, lun_numbers):
 
         super(MultipleFiberChannelMappingExist, self).__init__()
         self._initiators = initiators
         self._targets = targets
         self._lun_numbers = lun_numbers
-        self._expected_mappings = []
+        self._matcher = None
         self._assert_on_rpyc_netref()
 
     def _assert_on_rpyc_netref(self):
@@ -86,43 +329,38 @@ class MultipleFiberChannelMappingExist(object):
         for item in suspects:
             assert type(item).__name__.lower() != 'netref'
 
-    def _build_product(self):
-        self._expected_mappings = [(build_connectivity_object_from_wwn(initiator_wwn, target_wwn), lun_number)
-                                   for initiator_wwn, target_wwn, lun_number in
-                                   product(self._initiators, self._targets, self._lun_numbers)]
+    def _build_matcher(self):
+        self._matcher = FiberChannelMappingMatcher(self._initiators, self._targets, self._lun_numbers)
 
     def _is_fc_connectivity_a_match(self, device):
-        logger.debug("Connectivity details: {!r}, Lun {}".format(device.get_connectivity(), device.get_hctl().get_lun()))
-        for connectivity, lun_number in self._expected_mappings:
-            if device.get_connectivity() == connectivity and device.get_hctl().get_lun() == lun_number:
-                device.get_scsi_test_unit_ready()
-                self._expected_mappings.remove((connectivity, lun_number))
-                return True
-        return False
+        return self._matcher.match(device)
 
     def _get_chain_of_devices(self, model):
         from itertools import chain
         return chain(model.get_scsi().get_all_scsi_block_devices(),
                      model.get_scsi().get_all_storage_controller_devices())
 
+    def _iter_devices_and_paths(self, model):
+        for device in self._get_chain_of_devices(model):
+            yield device
+        for device in model.get_native_multipath().get_all_multipath_block_devices():
+            for path in device.get_paths():
+                yield path
+
     def __call__(self):
         from .. import get_storage_model
         model = get_storage_model()
-        self._build_product()
+        self._build_matcher()
         logger.debug("Working on: {!r}".format(self))
-        logger.debug("Looking for all scsi block devices")
-        logger.debug("Expecting to find {} matches".format(len(self._expected_mappings)))
-        for device in self._get_chain_of_devices(model):
-            logger.debug("Found device: {!r}".format(device))
-            if self._is_fc_connectivity_a_match(device):
-                logger.debug("Connectivity matches, only {} more to go".format(self._expected_mappings))
-        for device in model.get_native_multipath().get_all_multipath_block_devices():
-            logger.debug("Found device: {!r}".format(device))
-            for path in device.get_paths():
-                if self._is_fc_connectivity_a_match(path):
-                    logger.debug("Connectivity matches, only {} more to go".format(self._expected_mappings))
-        if self._expected_mappings:
-            logger.debug("Did not find all the mappings, {} missing".format(len(self._expected_mappings)))
+        logger.debug("Expecting to find {} matches".format(self._matcher.get_expected_count()))
+        for item in self._iter_devices_and_paths(model):
+            if self._is_fc_connectivity_a_match(item):
+                logger.debug("Connectivity of {!r} matches, only {} more to go".format(item,
+                                                                                     self._matcher.get_missing_count()))
+                if self._matcher.is_complete():
+                    break
+        if not self._matcher.is_complete():
+            logger.debug("Did not find all the mappings, {} missing".format(self._matcher.get_missing_count()))
             return False
         logger.debug("Found all expected mappings")
         return True
@@ -145,22 +383,13 @@ class MultipleFiberChannelMappingNotExist(MultipleFiberChannelMappingExist):
     def __call__(self):
         from .. import get_storage_model
         model = get_storage_model()
-        self._build_product()
-        initial_count = len(self._expected_mappings)
+        self._build_matcher()
         logger.debug("Working on: {!r}".format(self))
-        logger.debug("Looking for all scsi block devices")
-        logger.debug("Expecting to not find {} matches".format(initial_count))
-        for device in self._get_chain_of_devices(model):
-            logger.debug("Found device: {!r}".format(device))
-            if self._is_fc_connectivity_a_match(device):
-                logger.debug("Found a connectivity match I wasn't supposed to find")
+        logger.debug("Expecting to not find {} matches".format(self._matcher.get_expected_count()))
+        for item in self._iter_devices_and_paths(model):
+            if self._is_fc_connectivity_a_match(item):
+                logger.debug("Found a connectivity match I wasn't supposed to find: {!r}".format(item))
                 return False
-        for device in model.get_native_multipath().get_all_multipath_block_devices():
-            logger.debug("Found device: {!r}".format(device))
-            for path in device.get_paths():
-                if self._is_fc_connectivity_a_match(path):
-                    logger.debug("Found a connectivity match I wasn't supposed to find")
-                    return False
         logger.debug("Did not find any of the expected mappings")
         return True
 
@@ -172,7 +401,51 @@ class FiberChannelMappingNotExists(MultipleFiberChannelMappingNotExist):
         super(FiberChannelMappingNotExists, self).__init__([initiator_wwn], [target_wwn], [lun_number])
 
 
+class ISCSIMappingMatcher(FiberChannelMappingMatcher):
+    """Matches devices and paths against every (initiator iqn, target iqn, lun) combination of the given lists"""
+
+    def _get_address_key(self, iqn):
+        from ..connectivity import get_iqn_key
+        return get_iqn_key(iqn)
+
+    def _get_connectivity_class(self):
+        from ..connectivity import ISCSIConnectivity
+        return ISCSIConnectivity
+
+
+class MultipleISCSIMappingExist(MultipleFiberChannelMappingExist):
+    """:returns: True if all the lun mappings were discovered over iSCSI"""
+    layers = frozenset([LAYER_SYSFS, LAYER_MULTIPATH, LAYER_SCSI_IO])
+
+    def _build_matcher(self):
+        self._matcher = ISCSIMappingMatcher(self._initiators, self._targets, self._lun_numbers)
+
+
+class ISCSIMappingExists(MultipleISCSIMappingExist):
+    """:returns: True if a lun mapping was discovered over iSCSI"""
+
+    def __init__(self, initiator_iqn, target_iqn, lun_number):
+        super(ISCSIMappingExists, self).__init__([initiator_iqn], [target_iqn], [lun_number])
+
+
+class MultipleISCSIMappingNotExist(MultipleFiberChannelMappingNotExist):
+    """:returns: True if none of the lun mappings is seen over iSCSI"""
+    layers = MultipleISCSIMappingExist.layers
+
+    def _build_matcher(self):
+        self._matcher = ISCSIMappingMatcher(self._initiators, self._targets, self._lun_numbers)
+
+
+class ISCSIMappingNotExists(MultipleISCSIMappingNotExist):
+    """:returns: True if a lun un-mapping was discovered over iSCSI"""
+
+    def __init__(self, initiator_iqn, target_iqn, lun_number):
+        super(ISCSIMappingNotExists, self).__init__([initiator_iqn], [target_iqn], [lun_number])
+
+
 class WaitForNothing(object):
+    layers = frozenset()
+
     def __call__(self):
         return True
 
@@ -181,6 +454,8 @@ class WaitForNothing(object):
 
 
 class ScsiDevicesAreReady(object):
+    layers = frozenset([LAYER_SYSFS, LAYER_SCSI_IO])
+
     def __call__(self):
         from infi.storagemodel import get_storage_model
         model = get_storage_model()
@@ -194,6 +469,8 @@ class ScsiDevicesAreReady(object):
 
 
 class MultipathDevicesAreReady(object):
+    layers = frozenset([LAYER_MULTIPATH, LAYER_SCSI_IO])
+
     def __call__(self):
         from infi.storagemodel import get_storage_model
         model = get_storage_model()
@@ -166,4 +166,102 @@ class PredicateTestCase(unittest.TestCase):
         self.assertTrue(FiberChannelMappingNotExists(i_wwn, t_wwn, 1)())
         self.assertTrue(MultipleFiberChannelMappingNotExist([i_wwn], [t_wwn], [1, 2]))
 
+    def test_fc_mapping_matcher(self):
+        from . import FiberChannelMappingMatcher
+        i_wwn = ":".join(["01"] * 8)
+        t_wwns = [":".join(["02"] * 8), "0x0303030303030303"]
+        matcher = FiberChannelMappingMatcher([i_wwn], t_wwns, [1, 2])
+        self.assertEqual(matcher.get_expected_count(), 4)
+        disks = []
+        for t_wwn, lun in [(t_wwns[0], 1), (t_wwns[0], 1), ("0303030303030303", 2), (t_wwns[0], 3)]:
+            disk = Disk("1")
+            disk.connectivity = FCConectivityMock(i_wwn, t_wwn)
+            disk.hctl = HCTL(1, 0, 0, lun)
+            disks.append(disk)
+        local_disk = Disk("2")
+        local_disk.connectivity = connectivity.LocalConnectivity()
+        self.assertEqual([matcher.match(disk) for disk in disks + [local_disk]], [True, False, True, False, False])
+        self.assertEqual(matcher.get_missing_count(), 2)
+        self.assertFalse(matcher.is_complete())
+
+    @mock.patch("infi.storagemodel.get_storage_model")
+    def test_iscsi_mapping(self, get_storage_model):
+        from . import ISCSIMappingExists, ISCSIMappingNotExists, MultipleISCSIMappingExist
+        i_iqn = "iqn.1994-05.com.redhat:host1"
+        t_iqn = "iqn.2009-11.com.infinidat:storage:infinibox-sn-1"
+        get_storage_model.return_value = MockModel()
+        self.assertFalse(ISCSIMappingExists(i_iqn, t_iqn, 1)())
+        self.assertTrue(ISCSIMappingNotExists(i_iqn, t_iqn, 1)())
+        SCSIModel._devices = [Disk("1"), Disk("2")]
+        SCSIModel._devices[0].connectivity = connectivity.ISCSIConnectivity(None, i_iqn.upper(), t_iqn)
+        SCSIModel._devices[0].hctl = HCTL(1, 0, 0, 1)
+        SCSIModel._devices[1].connectivity = FCConectivityMock(":".join(["01"] * 8), ":".join(["02"] * 8))
+        SCSIModel._devices[1].hctl = HCTL(2, 0, 0, 2)
+        self.assertTrue(ISCSIMappingExists(i_iqn, t_iqn, 1)())
+        self.assertFalse(ISCSIMappingNotExists(i_iqn, t_iqn, 1)())
+        self.assertFalse(MultipleISCSIMappingExist([i_iqn], [t_iqn], [1, 2])())
+        SCSIModel._devices = []
+
+
+class RecordingPredicate(object):
+    def __init__(self, name, result, layers, calls):
+        self.name = name
+        self.result = result
+        self.layers = frozenset(layers)
+        self.calls = calls
+
+    def __call__(self):
+        self.calls.append(self.name)
+        return self.result
+
+    def __repr__(self):
+        return "<{}>".format(self.name)
+
+
+class PredicateAlgebraTestCase(unittest.TestCase):
+    def setUp(self):
+        from . import LAYER_SYSFS, LAYER_SCSI_IO
+        self.calls = []
+        self.cheap_true = RecordingPredicate("cheap_true", True, [LAYER_SYSFS], self.calls)
+        self.cheap_false = RecordingPredicate("cheap_false", False, [LAYER_SYSFS], self.calls)
+        self.expensive_true = RecordingPredicate("expensive_true", True, [LAYER_SYSFS, LAYER_SCSI_IO], self.calls)
+        self.expensive_false = RecordingPredicate("expensive_false", False, [LAYER_SCSI_IO], self.calls)
+
+    def test_and(self):
+        from . import And
+        predicate = And(self.expensive_true, self.cheap_false)
+        self.assertFalse(predicate())
+        self.assertEqual(self.calls, ["cheap_false"])
+        self.assertEqual([(evaluation.predicate, evaluation.result) for evaluation in predicate.get_evaluations()],
+                         [(self.cheap_false, False), (self.expensive_true, None)])
+        self.assertTrue(And(self.expensive_true, self.cheap_true)())
+        self.assertTrue(And()())
+
+    def test_or(self):
+        from . import Or
+        self.assertTrue(Or(self.expensive_false, self.cheap_true)())
+        self.assertEqual(self.calls, ["cheap_true"])
+        self.assertFalse(Or(self.expensive_false, self.cheap_false)())
+        self.assertEqual(self.calls, ["cheap_true", "cheap_false", "expensive_false"])
+
+    def test_not_and_at_least(self):
+        from . import Not, AtLeast, LAYER_SCSI_IO
+        self.assertTrue(Not(self.cheap_false)())
+        self.assertEqual(Not(self.expensive_false).layers, frozenset([LAYER_SCSI_IO]))
+        del self.calls[:]
+        self.assertTrue(AtLeast(2, self.expensive_true, self.cheap_true, self.cheap_false, self.expensive_false)())
+        self.assertEqual(self.calls, ["cheap_true", "cheap_false", "expensive_false", "expensive_true"])
+        del self.calls[:]
+        self.assertFalse(AtLeast(3, self.cheap_false, self.cheap_false, self.cheap_true, self.expensive_true)())
+        self.assertEqual(self.calls, ["cheap_false", "cheap_false"])
+
+    def test_nesting_and_undeclared_layers(self):
+        from . import And, Or, get_predicate_cost
+        nested = Or(self.cheap_false, self.expensive_true)
+        undeclared = lambda: self.calls.append("undeclared") or True
+        self.assertTrue(get_predicate_cost(self.cheap_true) < get_predicate_cost(nested) < get_predicate_cost(undeclared))
+        self.assertTrue(And(undeclared, nested, self.cheap_true)())
+        self.assertEqual(self.calls, ["cheap_true", "cheap_false", "expensive_true", "undeclared"])
+        self.assertTrue(all(evaluation.elapsed >= 0 for evaluation in nested.get_evaluations()))
+
 # TODO add rescan tests on real host with the predicates
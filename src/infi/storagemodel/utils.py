@@ -0,0 +1,49 @@
+"""greenlet or thread primitives: gevent's when it is available, otherwise the ones of the standard library"""
+
+
+def get_pool(size):
+    """:returns: a pool of the given size, with the :meth:`map` and :meth:`imap_unordered` of a gevent pool or
+    of a :class:`multiprocessing.pool.ThreadPool`"""
+    try:
+        from gevent.pool import Pool
+    except ImportError:
+        from multiprocessing.pool import ThreadPool
+        return ThreadPool(size)
+    return Pool(size)
+
+
+def get_event():
+    try:
+        from gevent.event import Event
+    except ImportError:
+        from threading import Event
+    return Event()
+
+
+def get_rlock():
+    try:
+        from gevent.lock import RLock
+    except ImportError:
+        from threading import RLock
+    return RLock()
+
+
+def sleep(seconds):
+    try:
+        from gevent import sleep
+    except ImportError:
+        from time import sleep
+    sleep(seconds)
+
+
+def spawn(target, name=None):
+    """runs the target in the background, in a greenlet or in a daemon thread of the given name"""
+    try:
+        from gevent import spawn
+    except ImportError:
+        from threading import Thread
+        thread = Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        return thread
+    return spawn(target)
@@ -53,6 +53,11 @@ class HostSystemPortGenerator(Generator):
     def _get_all_scsi_topologies(self):
         return self._get_properties()[TOPOLOGY_PROPERTY_PATH]
 
+    @cached_method
+    def _get_scsi_topology_index(self):
+        """:returns: a dict of adapter key to its SCSI topology"""
+        return dict((topology.adapter, topology) for topology in reversed(self._get_all_scsi_topologies()))
+
     def _get_target_transport_properties(self, fc_hba, target):
         return target.transport
 
@@ -67,10 +72,9 @@ class HostSystemPortGenerator(Generator):
         return port
 
     def _populate_remote_ports(self, fc_hba):
-        all_adapter_topologies = self._get_all_scsi_topologies()
-        adapter_topology = filter(lambda topology: topology.adapter == fc_hba.key, all_adapter_topologies)
+        adapter_topology = self._get_scsi_topology_index()[fc_hba.key]
         remote_ports = []
-        for target in adapter_topology[0].target:
+        for target in adapter_topology.target:
             if target.transport.portWorldWideName:  # If target in "dead or error" state, then portWorldWideName is 0
                 remote_ports.append(self._populate_remote_port(fc_hba, target))
         return remote_ports
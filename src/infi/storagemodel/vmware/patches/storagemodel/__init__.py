@@ -1,9 +1,15 @@
 from infi.storagemodel.base import StorageModel, scsi, multipath, inquiry
-from infi.pyutils.lazy import cached_method, LazyImmutableDict
+from infi.storagemodel.utils import get_pool, get_event, spawn
+from infi.pyutils.lazy import cached_method, clear_cache, clear_cached_entry, LazyImmutableDict
 from infi.pyutils.contexts import contextmanager
 from infi.pyutils.patch import monkey_patch
 from infi.asi.cdb.inquiry.vpd_pages import get_vpd_page_data
 from infi.dtypes.hctl import HCTL
+from collections import OrderedDict, namedtuple
+from array import array
+from struct import Struct
+from threading import RLock
+import re
 from logging import getLogger
 import infi.storagemodel
 
@@ -14,6 +20,13 @@ SCSI_TOPOLOGY_PROPERTY_PATH = 'config.storageDevice.scsiTopology'
 SCSI_LUNS_PROPERTY_PATH = "config.storageDevice.scsiLun"
 MULTIPATH_TOPOLOGY_PROPERTY_PATH = 'config.storageDevice.multipathInfo'
 
+UBINT16 = Struct(">H")
+RUNTIME_NAME_PATTERN = re.compile(r"\bvmhba\d+:C(?P<channel>\d+):T(?P<target>\d+):L(?P<lun>\d+)\b")
+TARGET_NUMBER_KEY = "target"
+# the attribute of suds objects that refers to their type in the WSDL schema, which is shared by all the objects
+SUDS_METADATA_ATTRIBUTE = "__metadata__"
+MEASURE_MAX_DEPTH = 64
+
 
 def install_property_collectors_on_client(client):
     from pyvisdk.facade.property_collector import HostSystemCachedPropertyCollector
@@ -25,23 +38,183 @@ def install_property_collectors_on_client(client):
     client.facades[PROPERTY_COLLECTOR_KEY] = collector
 
 
+def release_host_properties(client, moref):
+    """drops the properties of the host from the cache of the property collector of the client, the same cache the
+    models of the host read and patch (see :meth:`VMwareNativeMultipathModel.apply_property_changes`)"""
+    collector = client.facades.get(PROPERTY_COLLECTOR_KEY)
+    if collector is None:
+        return
+    try:
+        collector.getProperties().pop(moref, None)
+    except Exception:
+        logger.exception("failed to release the cached properties of {}".format(moref))
+
+
 
 def byte_array_to_string(byte_array):
-    from infi.instruct import FixedSizeArray, Struct
-    from infi import instruct
-    class MyStruct(Struct):
-        _fields_ = [FixedSizeArray("byte_array", len(byte_array), getattr(instruct, 'SBInt8')), ]
-    struct = MyStruct(byte_array=byte_array)
-    return struct.write_to_string(struct)
+    # vSphere returns the raw bytes as a list of signed 8-bit integers
+    return array("b", byte_array).tostring()
 
 
 def number_to_ubint16_buffer(number):
-    from infi.instruct import Struct
-    from infi import instruct
-    class MyStruct(Struct):
-        _fields_ = [getattr(instruct, 'UBInt16')('number'), ]
-    struct = MyStruct(number=number)
-    return struct.write_to_string(struct)
+    return UBINT16.pack(number)
+
+
+def build_raw_vpd_pages(scsi_lun_data_object):
+    """:returns: a dict of VPD page code to its raw buffer, built from the durable names of the SCSI LUN"""
+    # http://vijava.sourceforge.net/vSphereAPIDoc/ver5/ReferenceGuide/
+    durable_names = scsi_lun_data_object.alternateName
+    peripheral_device = None
+    for durable_name in durable_names:
+        if durable_name.namespace == 'GENERIC_VPD':
+            peripheral_device = byte_array_to_string([durable_name.data[0]])
+            break
+    vpd_dict = {}
+    designators_list = []
+    for durable_name in durable_names:
+        if durable_name.namespace == 'GENERIC_VPD':
+            vpd = durable_name.data[1]
+            vpd = vpd if vpd >= 0 else vpd + 256
+            vpd_dict[vpd] = byte_array_to_string(durable_name.data)
+        elif durable_name.namespace == 'SERIALNUM':
+            buffer = byte_array_to_string(durable_name.data).rstrip('\x00')
+            vpd_dict[0x80] = "{}\x80{}{}".format(peripheral_device, number_to_ubint16_buffer(len(buffer)), buffer)
+        else:
+            designators_list.insert(-1, byte_array_to_string(durable_name.data))
+    size = sum(map(len, designators_list))
+    vpd_dict[0x83] = "{}\x83{}{}".format(peripheral_device, number_to_ubint16_buffer(size), ''.join(designators_list))
+    return vpd_dict
+
+
+def get_lun_key_suffix(key):
+    # lun.scsiLun = "key-vim.host.ScsiLun-020c0000006742b0f000004e2b0000000000000000496e66696e69"
+    # scsi_lun.key = 'key-vim.host.ScsiDisk-02000200006742b0f000004e2b0000000000000069496e66696e69'
+    return key.rsplit('-', 1)[-1]
+
+
+def get_vmhba(key):
+    # adapter.key is key-vim.host.ScsiTopology.Interface-vmhba0
+    # path_data_object.adapter is key-vim.host.FibreChannelHba-vmhba2
+    return key.split('-')[-1]
+
+
+def get_target_transport_key(transport):
+    """:returns: what identifies a target on its adapter: the port WWN of an FC target, the iSCSI name of an iSCSI
+    target, or None for transports that carry no identity (e.g. SAS, parallel SCSI and block adapters)"""
+    port_wwn = getattr(transport, "portWorldWideName", None)
+    if port_wwn is not None:
+        return port_wwn
+    return getattr(transport, "iScsiName", None)
+
+
+def get_runtime_target(path_data_object):
+    """:returns: the target number in the runtime name of a path (e.g. vmhba33:C0:T1:L0), or None"""
+    for name in (getattr(path_data_object, "name", None), getattr(path_data_object, "key", None)):
+        match = RUNTIME_NAME_PATTERN.search(name or '')
+        if match is not None:
+            return int(match.group("target"))
+    return None
+
+
+def build_scsi_topology_index(adapters):
+    """:param adapters: the adapters of config.storageDevice.scsiTopology
+    :returns: a dict of (vmhba, target transport key, lun key suffix) and of (vmhba, (TARGET_NUMBER_KEY, target
+    number), lun key suffix) to the HCTL of the path. A transport key that more than one target of the adapter has
+    maps to None, so the path is looked up by the target number in its runtime name instead"""
+    index = dict()
+    for adapter in adapters:
+        vmhba = get_vmhba(adapter.key)
+        for target in adapter.target:
+            transport_key = get_target_transport_key(target.transport)
+            for lun in target.lun:
+                hctl = HCTL(vmhba, 0, target.target, lun.lun)
+                lun_key_suffix = get_lun_key_suffix(lun.scsiLun)
+                index.setdefault((vmhba, (TARGET_NUMBER_KEY, target.target), lun_key_suffix), hctl)
+                if transport_key is None:
+                    continue
+                key = (vmhba, transport_key, lun_key_suffix)
+                index[key] = hctl if index.get(key, hctl) == hctl else None
+    return index
+
+
+def build_logical_unit_index(logical_units):
+    """:param logical_units: the logical units of config.storageDevice.multipathInfo
+    :returns: a dict of scsiLun key to its multipath logical unit"""
+    index = dict()
+    for logical_unit in logical_units or []:
+        # scsiLun.key == HostMultipathInfoLogicalUnit.lun
+        index.setdefault(logical_unit.lun, logical_unit)
+    return index
+
+
+def get_host_property_changes(update_set, moref):
+    """:param update_set: an UpdateSet, as returned by WaitForUpdatesEx
+    :returns: the list of PropertyChange objects in the update set that belong to the given host"""
+    changes = []
+    for filter_update in update_set.filterSet or []:
+        for object_update in filter_update.objectSet or []:
+            obj = object_update.obj
+            obj_moref = obj if isinstance(obj, basestring) else "{}:{}".format(obj._type, obj.value)
+            if obj_moref == moref:
+                changes.extend(object_update.changeSet or [])
+    return changes
+
+
+def _split_property_change_name(name, property_paths):
+    """splits a name such as 'config.storageDevice.multipathInfo.lun["key-vim..."]' to the property path it belongs to
+    and a list of (attribute name, None) and (None, key) selectors"""
+    import re
+    for property_path in sorted(property_paths, key=len, reverse=True):
+        if name == property_path or name.startswith(property_path + '.') or name.startswith(property_path + '['):
+            selectors = re.findall(r'\.(\w+)|\["([^"]*)"\]', name[len(property_path):])
+            return property_path, [(attribute or None, key or None) for attribute, key in selectors]
+    return None, None
+
+
+def _find_by_key(items, key):
+    for index, item in enumerate(items):
+        if item.key == key:
+            return index
+    return None
+
+
+def apply_property_change(properties, change):
+    """patches a dict of property path to value, as returned by the property collector, with a PropertyChange
+    (name, op and val) in place. If an element the change is nested in is missing, the property is dropped from the
+    dict, since it can't be patched anymore.
+    :returns: the property path and the selectors of the change, (None, None) if it is not of these properties, or
+    the property path and None if the property was dropped"""
+    property_path, selectors = _split_property_change_name(change.name, properties.keys())
+    if property_path is None:
+        return None, None
+    if not selectors:
+        properties[property_path] = None if change.op == "remove" else change.val
+        return property_path, selectors
+    parent = properties[property_path]
+    for attribute, key in selectors[:-1]:
+        if attribute:
+            parent = getattr(parent, attribute)
+            continue
+        index = _find_by_key(parent or [], key)
+        if index is None:
+            logger.warning("{} of property change {} {} is missing, dropping {}".format(key, change.op, change.name,
+                                                                                     property_path))
+            del properties[property_path]
+            return property_path, None
+        parent = parent[index]
+    attribute, key = selectors[-1]
+    if attribute:
+        setattr(parent, attribute, None if change.op == "remove" else change.val)
+        return property_path, selectors
+    index = _find_by_key(parent, key)
+    if change.op in ("remove", "indirectRemove"):
+        if index is not None:
+            del parent[index]
+    elif index is None:
+        parent.append(change.val)
+    else:
+        parent[index] = change.val
+    return property_path, selectors
 
 
 def get_stack_trace():
@@ -72,6 +245,7 @@ def with_host(host):
     stack_trace = get_stack_trace()
     caller = extract_stack(stack_trace, 6)[1][2]
     moref = host.core.getReferenceToManagedObject(host)
+    current = None
     try:
         current = StorageModelFactory.set(StorageModelFactory.create(host))
         if previous is current:
@@ -83,6 +257,34 @@ def with_host(host):
     finally:
         logger.debug("exited context for host {} as part of {}".format(moref, caller))
         StorageModelFactory.set(previous)
+        if current is not None and current is not previous:
+            StorageModelFactory.measure_if_needed(current)
+
+
+# value is what the collector returned for the host, error is the exception it raised instead (or None)
+HostCollectionResult = namedtuple("HostCollectionResult", ["hostsystem", "value", "error"])
+
+
+def _collect_from_host(hostsystem, collector):
+    try:
+        with with_host(hostsystem):
+            return HostCollectionResult(hostsystem, collector(StorageModelFactory.get()), None)
+    except Exception, error:
+        logger.exception("collection from host {} failed".format(hostsystem.ref.value))
+        return HostCollectionResult(hostsystem, None, error)
+
+
+def collect_from_hosts(hostsystems, collector, concurrency=None):
+    """calls `collector` with the storage model of every host, at most `concurrency` (by default,
+    `StorageModelFactory.max_concurrent_builds`) hosts at a time.
+    :returns: a generator of :class:`HostCollectionResult`, in the order the hosts complete"""
+    pool = get_pool(concurrency or StorageModelFactory.max_concurrent_builds)
+    try:
+        for result in pool.imap_unordered(lambda hostsystem: _collect_from_host(hostsystem, collector), hostsystems):
+            yield result
+    finally:
+        if hasattr(pool, "close"):
+            pool.close()
 
 
 class VMwareHostStorageModel(StorageModel):
@@ -128,6 +330,10 @@ class VMwareHostStorageModel(StorageModel):
     def _install_property_collector(self):
         install_property_collectors_on_client(self._client)
 
+    def apply_property_updates(self, update_set):
+        """patches the model with the changes of this host in an UpdateSet, as returned by WaitForUpdatesEx"""
+        self.get_native_multipath().apply_property_changes(get_host_property_changes(update_set, self._moref))
+
     def _attach_detached_luns(self, storage_system):
         # sometimes new luns will be automatically detached if they were previously detached (the host remembers
         # that setting). If we still see a detached lun after rescan, we probably mapped it and want it attached.
@@ -140,41 +346,15 @@ class VMwareHostStorageModel(StorageModel):
 
 
 class VMwareInquiryPagesDict(LazyImmutableDict):
-    def __init__(self, dict, scsi_lun_data_object):
+    def __init__(self, dict, scsi_lun_data_object, raw_vpd_pages=None):
         super(VMwareInquiryPagesDict, self).__init__(dict)
         self._scsi_lun_data_object = scsi_lun_data_object
+        self._raw_vpd_pages = raw_vpd_pages
 
-    @cached_method
-    def _get_peripheral_device(self):
-        for durable_name in self._scsi_lun_data_object.alternateName:
-            if durable_name.namespace == 'GENERIC_VPD':
-                return byte_array_to_string([durable_name.data[0], ])
-
-    def _build_device_identification_buffer(self, designators_list):
-        size = sum(map(len, designators_list))
-        return "{}\x83{}{}".format(self._get_peripheral_device(),
-                                   number_to_ubint16_buffer(size),
-                                   ''.join(designators_list))
-
-    @cached_method
     def _get_dict_of_vpd_pages_and_their_raw_buffer(self):
-        # http://vijava.sourceforge.net/vSphereAPIDoc/ver5/ReferenceGuide/
-        vpd_dict = {}
-        designators_list = []
-        for durable_name in self._scsi_lun_data_object.alternateName:
-            if durable_name.namespace == 'GENERIC_VPD':
-                vpd = durable_name.data[1]
-                vpd = vpd if vpd >= 0 else vpd + 256
-                vpd_dict[vpd] = byte_array_to_string(durable_name.data)
-            elif durable_name.namespace == 'SERIALNUM':
-                buffer = byte_array_to_string(durable_name.data).rstrip('\x00')
-                vpd_dict[0x80] = "{}\x80{}{}".format(self._get_peripheral_device(),
-                                                     number_to_ubint16_buffer(len(buffer)),
-                                                     buffer)
-            else:
-                designators_list.insert(-1, byte_array_to_string(durable_name.data))
-        vpd_dict[0x83] = self._build_device_identification_buffer(designators_list)
-        return vpd_dict
+        if self._raw_vpd_pages is None:
+            self._raw_vpd_pages = build_raw_vpd_pages(self._scsi_lun_data_object)
+        return self._raw_vpd_pages
 
     def _create_value(self, key):
         buffer = self._get_dict_of_vpd_pages_and_their_raw_buffer()[key]
@@ -209,21 +389,27 @@ class VMwareInquiryInformationMixin(inquiry.InquiryInformationMixin):
         byte_array = filter(_filter, self._scsi_lun_data_object.alternateName)[0].data
         return SupportedVPDPagesData.create_from_string(byte_array_to_string(byte_array))
 
+    @cached_method
+    def _get_raw_vpd_pages(self):
+        return build_raw_vpd_pages(self._scsi_lun_data_object)
+
+    @cached_method
     def get_scsi_inquiry_pages(self):
         supported_pages = self._get_supported_vpd_pages()
         pages_dict = {}
         for vpd_page in supported_pages.vpd_parameters[1:]:
             pages_dict[vpd_page] = None
-        return VMwareInquiryPagesDict(pages_dict, self._scsi_lun_data_object)
+        return VMwareInquiryPagesDict(pages_dict, self._scsi_lun_data_object, self._get_raw_vpd_pages())
 
 
 class VMwarePath(multipath.Path):
-    def __init__(self, pyvisdk_client, host_moref, lun_key, path_data_object):
+    def __init__(self, pyvisdk_client, host_moref, lun_key, path_data_object, multipath_model=None):
         super(VMwarePath, self).__init__()
         self._client = pyvisdk_client
         self._host_moref = host_moref
         self._lun_key = lun_key
         self._path_data_object = path_data_object
+        self._multipath_model = multipath_model
 
     @cached_method
     def get_path_id(self):
@@ -235,24 +421,28 @@ class VMwarePath(multipath.Path):
         properties = self._client.facades[PROPERTY_COLLECTOR_KEY].getProperties()[self._host_moref]
         return properties
 
+    def _get_scsi_topology_index(self):
+        if self._multipath_model is not None:
+            return self._multipath_model.get_scsi_topology_index()
+        return build_scsi_topology_index(self._get_properties()[SCSI_TOPOLOGY_PROPERTY_PATH].adapter)
+
     @cached_method
     def get_hctl(self):
         from infi.storagemodel.errors import RescanIsNeeded
-        scsi_topology = self._get_properties()[SCSI_TOPOLOGY_PROPERTY_PATH]
-        expected_vmhba = self._path_data_object.adapter.split('-')[-1]
-        # adapter.key is key-vim.host.ScsiTopology.Interface-vmhba0
-        # path_data_object.adapter is key-vim.host.FibreChannelHba-vmhba2
-        for adapter in filter(lambda adapter: adapter.key.split('-')[-1] == expected_vmhba,
-                              scsi_topology.adapter):
-            for target in adapter.target:
-                if self._path_data_object.transport.portWorldWideName == target.transport.portWorldWideName:
-                    for lun in target.lun:
-                        # lun.scsiLun = "key-vim.host.ScsiLun-020c0000006742b0f000004e2b0000000000000000496e66696e69"
-                        # self._lun_key = 'key-vim.host.ScsiDisk-02000200006742b0f000004e2b0000000000000069496e66696e69'
-                        if lun.scsiLun.rsplit('-', 1)[-1] == self._lun_key.rsplit('-', 1)[-1]:
-                            return HCTL(expected_vmhba, 0, target.target, lun.lun)
-        logger.exception("failed to find SCSI target for path object {}".format(self._path_data_object))
-        raise RescanIsNeeded()
+        index = self._get_scsi_topology_index()
+        vmhba = get_vmhba(self._path_data_object.adapter)
+        lun_key_suffix = get_lun_key_suffix(self._lun_key)
+        transport_key = get_target_transport_key(self._path_data_object.transport)
+        key = (vmhba, transport_key, lun_key_suffix)
+        hctl = index.get(key) if transport_key is not None else None
+        if hctl is None and (transport_key is None or key in index):
+            # the transport does not tell the targets of this adapter apart, so we go by the runtime name of the path
+            target_key = (TARGET_NUMBER_KEY, get_runtime_target(self._path_data_object))
+            hctl = index.get((vmhba, target_key, lun_key_suffix))
+        if hctl is None:
+            logger.exception("failed to find SCSI target for path object {}".format(self._path_data_object))
+            raise RescanIsNeeded()
+        return hctl
 
     @cached_method
     def get_state(self):
@@ -260,11 +450,12 @@ class VMwarePath(multipath.Path):
 
 
 class VMwareMultipathDevice(VMwareInquiryInformationMixin):
-    def __init__(self, pyvisdk_client, host_moref, scsi_lun_data_object):
+    def __init__(self, pyvisdk_client, host_moref, scsi_lun_data_object, multipath_model=None):
         super(VMwareMultipathDevice, self).__init__()
         self._client = pyvisdk_client
         self._host_moref = host_moref
         self._scsi_lun_data_object = scsi_lun_data_object
+        self._multipath_model = multipath_model
         logger.debug("Created {!r}".format(self))
 
     @cached_method
@@ -281,22 +472,25 @@ class VMwareMultipathDevice(VMwareInquiryInformationMixin):
         properties = self._client.facades[PROPERTY_COLLECTOR_KEY].getProperties()[self._host_moref]
         return properties
 
+    def _get_logical_unit_index(self):
+        if self._multipath_model is not None:
+            return self._multipath_model.get_logical_unit_index()
+        return build_logical_unit_index(self._get_properties()[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun)
+
     def _get_multipath_logical_unit(self):
-        # scsiLun.key == HostMultipathInfoLogicalUnit.lun
-        host_luns = self._get_properties()[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun
-        try:
-            return [lun for lun in host_luns if lun.lun == self._scsi_lun_data_object.key][0]
-        except IndexError:
+        logical_unit = self._get_logical_unit_index().get(self._scsi_lun_data_object.key)
+        if logical_unit is None:
             msg = "No paths were found for device {}, returning an empty list"
             logger.error(msg.format(self._scsi_lun_data_object.key))
-            return None
+        return logical_unit
 
     @cached_method
     def get_paths(self):
         logical_unit = self._get_multipath_logical_unit()
         if logical_unit is None:
             return []
-        return [VMwarePath(self._client, self._host_moref, self._scsi_lun_data_object.key, path_data_object)
+        return [VMwarePath(self._client, self._host_moref, self._scsi_lun_data_object.key, path_data_object,
+                           self._multipath_model)
                 for path_data_object in logical_unit.path]
 
     @cached_method
@@ -337,6 +531,7 @@ class VMwareNativeMultipathModel(multipath.NativeMultipathModel):
         super(VMwareNativeMultipathModel, self).__init__()
         self._client = pyvisdk_client
         self._moref = moref
+        self._devices_by_lun_key = dict()
 
     @cached_method
     def _get_properties(self):
@@ -346,6 +541,16 @@ class VMwareNativeMultipathModel(multipath.NativeMultipathModel):
     def _get_luns(self):
         return self._get_properties()[SCSI_LUNS_PROPERTY_PATH]
 
+    @cached_method
+    def get_scsi_topology_index(self):
+        """:returns: a dict of (vmhba, target port WWN, lun key suffix) to HCTL, for resolving the HCTL of paths"""
+        return build_scsi_topology_index(self._get_properties()[SCSI_TOPOLOGY_PROPERTY_PATH].adapter)
+
+    @cached_method
+    def get_logical_unit_index(self):
+        """:returns: a dict of scsiLun key to its multipath logical unit"""
+        return build_logical_unit_index(self._get_properties()[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun)
+
     @cached_method
     def _filter_operating_luns(self):
         luns = self._get_luns()
@@ -362,18 +567,111 @@ class VMwareNativeMultipathModel(multipath.NativeMultipathModel):
         return filter(lambda lun: lun.deviceType == 'disk',
                       self._filter_operating_luns())
 
+    def _get_device(self, device_class, scsi_lun_data_object):
+        # devices of luns that did not change since the previous property update are re-used
+        device = self._devices_by_lun_key.get(scsi_lun_data_object.key)
+        if type(device) is not device_class or device._scsi_lun_data_object is not scsi_lun_data_object:
+            device = device_class(self._client, self._moref, scsi_lun_data_object, self)
+            self._devices_by_lun_key[scsi_lun_data_object.key] = device
+        return device
+
     @cached_method
     def get_all_multipath_storage_controller_devices(self):
-        return [VMwareMultipathStorageController(self._client, self._moref, scsi_lun_data_object)
+        return [self._get_device(VMwareMultipathStorageController, scsi_lun_data_object)
                 for scsi_lun_data_object in self._filter_array_controller_luns()
                 if scsi_lun_data_object.alternateName]
 
     @cached_method
     def get_all_multipath_block_devices(self):
-        return [VMwareMultipathBlockDevice(self._client, self._moref, scsi_lun_data_object)
+        return [self._get_device(VMwareMultipathBlockDevice, scsi_lun_data_object)
                 for scsi_lun_data_object in self._filter_disk_luns()
                 if scsi_lun_data_object.alternateName]
 
+    def _clear_paths(self, lun_keys=None):
+        for lun_key, device in self._devices_by_lun_key.items():
+            if lun_keys is None or lun_key in lun_keys:
+                clear_cached_entry(device.get_paths)
+
+    def _get_lun_keys_of_logical_unit_change(self, selectors, change):
+        # multipathInfo.lun["key-vim.host.MultipathInfo.LogicalUnit-..."] -> the scsiLun key of that logical unit
+        if len(selectors) < 2 or selectors[0] != ("lun", None) or selectors[1][1] is None:
+            return None
+        lun_keys = set()
+        logical_units = self._get_properties()[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun
+        index = _find_by_key(logical_units, selectors[1][1])
+        if index is not None:
+            lun_keys.add(logical_units[index].lun)
+        if len(selectors) == 2 and getattr(change.val, "lun", None):
+            lun_keys.add(change.val.lun)
+        return lun_keys
+
+    def _clear_hctls(self, vmhba=None):
+        for device in self._devices_by_lun_key.values():
+            for path in device.get_paths():
+                if vmhba is None or get_vmhba(path._path_data_object.adapter) == vmhba:
+                    clear_cached_entry(path.get_hctl)
+
+    def _patch_scsi_topology_index(self, selectors):
+        """:returns: the vmhba of the adapter that changed, or None if the whole topology was re-indexed"""
+        # scsiTopology.adapter["key-vim.host.ScsiTopology.Interface-vmhba2"]... -> re-index just that adapter
+        if len(selectors) < 2 or selectors[0] != ("adapter", None) or selectors[1][1] is None:
+            clear_cached_entry(self.get_scsi_topology_index)
+            return None
+        index = self.get_scsi_topology_index()
+        vmhba = get_vmhba(selectors[1][1])
+        for key in [key for key in index if key[0] == vmhba]:
+            del index[key]
+        adapters = [adapter for adapter in self._get_properties()[SCSI_TOPOLOGY_PROPERTY_PATH].adapter
+                    if get_vmhba(adapter.key) == vmhba]
+        index.update(build_scsi_topology_index(adapters))
+        return vmhba
+
+    def apply_property_changes(self, changes):
+        """patches the properties of the host, as cached by the property collector, and the devices and indexes of
+        this model with WaitForUpdatesEx property changes, instead of rebuilding the model"""
+        properties = self._get_properties()
+        dropped_property_paths = set()
+        for change in changes:
+            lun_keys = None
+            if change.name.startswith(MULTIPATH_TOPOLOGY_PROPERTY_PATH) and \
+                    MULTIPATH_TOPOLOGY_PROPERTY_PATH in properties:
+                _, selectors = _split_property_change_name(change.name, [MULTIPATH_TOPOLOGY_PROPERTY_PATH])
+                lun_keys = self._get_lun_keys_of_logical_unit_change(selectors, change)
+            property_path, selectors = apply_property_change(properties, change)
+            if property_path is not None and selectors is None:
+                # later changes of this property are not applied, since it is not in the dict anymore
+                dropped_property_paths.add(property_path)
+                continue
+            logger.debug("applied property change {} {} of {}".format(change.op, change.name, self._moref))
+            if property_path == SCSI_LUNS_PROPERTY_PATH:
+                # devices whose scsiLun was replaced are re-created by _get_device; attributes of a scsiLun, e.g.
+                # scsiLun["key-vim..."].capacity, are patched in place, so the devices of these luns are dropped
+                lun_keys = set(lun.key for lun in properties[SCSI_LUNS_PROPERTY_PATH] or [])
+                changed_lun_keys = set(key for _, key in selectors if key is not None)
+                for lun_key in set(self._devices_by_lun_key).difference(lun_keys).union(changed_lun_keys):
+                    self._devices_by_lun_key.pop(lun_key, None)
+                for method in (self._filter_operating_luns, self.get_all_multipath_block_devices,
+                               self.get_all_multipath_storage_controller_devices):
+                    clear_cached_entry(method)
+            elif property_path == MULTIPATH_TOPOLOGY_PROPERTY_PATH:
+                clear_cached_entry(self.get_logical_unit_index)
+                self._clear_paths(lun_keys)
+            elif property_path == SCSI_TOPOLOGY_PROPERTY_PATH:
+                self._clear_hctls(self._patch_scsi_topology_index(selectors))
+            if property_path is not None:
+                # the path ownership and alias indexes are keyed by the devices, their paths and the HCTLs of the paths
+                self._clear_indexes()
+        if dropped_property_paths:
+            self._refetch_properties()
+
+    def _refetch_properties(self):
+        """drops the properties of the host from the cache of the property collector, and everything this model built
+        from them, so they are fetched again"""
+        logger.debug("fetching the properties of {} again".format(self._moref))
+        release_host_properties(self._client, self._moref)
+        clear_cache(self)
+        self._devices_by_lun_key.clear()
+
     def filter_non_multipath_scsi_block_devices(self, scsi_block_devices):
         """:returns: an empty list since there no non-multipath devices on VMware"""
         return list()
@@ -383,22 +681,203 @@ class VMwareNativeMultipathModel(multipath.NativeMultipathModel):
         return list()
 
 
+def get_approximate_size_in_bytes(obj, excluded_objects=(), max_depth=None):
+    """:returns: the approximate memory footprint of an object and everything it references, up to max_depth
+    references away, except modules, classes, functions, the excluded objects (e.g. a client shared with other
+    objects) and the WSDL types of suds objects"""
+    from sys import getsizeof
+    from types import ModuleType, FunctionType, MethodType
+    seen = set(id(item) for item in excluded_objects)
+    stack = [(obj, 0)]
+    size = 0
+    while stack:
+        item, depth = stack.pop()
+        if id(item) in seen or isinstance(item, (type, ModuleType, FunctionType, MethodType)):
+            continue
+        seen.add(id(item))
+        size += getsizeof(item, 0)
+        if max_depth is not None and depth >= max_depth:
+            continue
+        if isinstance(item, dict):
+            stack.extend((key, depth + 1) for key in item.keys())
+            stack.extend((value, depth + 1) for value in item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend((value, depth + 1) for value in item)
+        if hasattr(item, "__dict__"):
+            attributes = item.__dict__
+            size += getsizeof(attributes, 0)
+            seen.add(id(attributes))
+            stack.extend((key, depth + 1) for key in attributes.keys())
+            stack.extend((value, depth + 1) for key, value in attributes.items() if key != SUDS_METADATA_ATTRIBUTE)
+    return size
+
+
 class StorageModelFactory(object):
-    models_by_host_value = {}
+    # least recently used first
+    models_by_host_value = OrderedDict()
     models_by_greenlet = {}
+    hits_by_host_value = {}
+    # the approximate memory footprint of the models that were built, measured when they were built
+    memory_by_host_value = {}
+    max_models = 128
+    max_memory_in_bytes = None
+    max_concurrent_builds = 8
+    _refresh_worker = None
+    _refresh_stop_event = None
+    # hosts may be collected from several threads, see collect_from_hosts
+    _lock = RLock()
 
     @classmethod
     def clear(cls):
-        cls.models_by_greenlet.clear()
-        cls.models_by_host_value.clear()
+        with cls._lock:
+            cls.models_by_greenlet.clear()
+            cls.models_by_host_value.clear()
+            cls.hits_by_host_value.clear()
+            cls.memory_by_host_value.clear()
 
     @classmethod
     def create(cls, hostsystem):
         key = hostsystem.ref.value
-        if key not in cls.models_by_host_value:
-            value = VMwareHostStorageModel(hostsystem.core, "HostSystem:{}".format(key))
+        with cls._lock:
+            cls.hits_by_host_value[key] = cls.hits_by_host_value.get(key, 0) + 1
+            value = cls.models_by_host_value.pop(key, None)
+            if value is None:
+                value = VMwareHostStorageModel(hostsystem.core, "HostSystem:{}".format(key))
             cls.models_by_host_value[key] = value
-        return cls.models_by_host_value[key]
+            evicted_models = cls._evict()
+        cls._release(evicted_models)
+        return value
+
+    @classmethod
+    def _get_evictable_keys(cls):
+        # models that are in use by a greenlet stay, even if they are the least recently used
+        models_in_use = set(id(model) for model in cls.models_by_greenlet.values())
+        most_recently_used = next(reversed(cls.models_by_host_value))
+        return [key for key, model in cls.models_by_host_value.items()
+                if id(model) not in models_in_use and key != most_recently_used]
+
+    @classmethod
+    def _evict(cls):
+        """:returns: the evicted models"""
+        if not cls.models_by_host_value:
+            return []
+        evictable_keys = cls._get_evictable_keys()
+        evicted_models = []
+        while evictable_keys and len(cls.models_by_host_value) > cls.max_models:
+            evicted_models.append(cls._evict_key(evictable_keys.pop(0)))
+        if cls.max_memory_in_bytes is None:
+            return evicted_models
+        # models that were not built yet take no memory worth evicting them for
+        evictable_keys = [key for key in evictable_keys if key in cls.memory_by_host_value]
+        while evictable_keys and sum(cls.memory_by_host_value.values()) > cls.max_memory_in_bytes:
+            evicted_models.append(cls._evict_key(evictable_keys.pop(0)))
+        return evicted_models
+
+    @classmethod
+    def _evict_key(cls, key):
+        logger.debug("evicting the storage model of host {}".format(key))
+        cls.hits_by_host_value.pop(key, None)
+        cls.memory_by_host_value.pop(key, None)
+        return cls.models_by_host_value.pop(key)
+
+    @classmethod
+    def _release(cls, models):
+        # the property collector may go to the server, so this is done outside the lock
+        for model in models:
+            release_host_properties(model._client, model._moref)
+
+    @classmethod
+    def get_memory_usage(cls):
+        """:returns: a dict of host to the approximate memory footprint of its storage model and of the properties of
+        the host it was built from, in bytes, as measured when the model was (re-)built"""
+        with cls._lock:
+            return dict(cls.memory_by_host_value)
+
+    @classmethod
+    def measure_if_needed(cls, model):
+        """measures a model that was created by :meth:`create` (e.g. in :func:`with_host`) once its devices were
+        fetched; models that are (re-)built by :meth:`build` and :meth:`refresh_hot_models` are measured then"""
+        key = model._moref.split(":", 1)[-1]
+        with cls._lock:
+            if key in cls.memory_by_host_value or cls.models_by_host_value.get(key) is not model:
+                return
+        if model.get_native_multipath()._devices_by_lun_key:
+            cls._measure(model)
+
+    @classmethod
+    def _measure(cls, model):
+        # the client (and its property collector) is shared by all the hosts; the host's properties are measured
+        # through the cached properties of the native multipath model
+        size = get_approximate_size_in_bytes(model, excluded_objects=[model._client], max_depth=MEASURE_MAX_DEPTH)
+        key = model._moref.split(":", 1)[-1]
+        with cls._lock:
+            if cls.models_by_host_value.get(key) is model:
+                cls.memory_by_host_value[key] = size
+            evicted_models = cls._evict() if cls.max_memory_in_bytes is not None else []
+        cls._release(evicted_models)
+
+    @classmethod
+    def _build(cls, model):
+        native_multipath = model.get_native_multipath()
+        native_multipath.get_all_multipath_block_devices()
+        native_multipath.get_all_multipath_storage_controller_devices()
+        cls._measure(model)
+        return model
+
+    @classmethod
+    def _build_all(cls, models, concurrency):
+        pool = get_pool(concurrency)
+        try:
+            list(pool.imap_unordered(cls._build, models))
+        finally:
+            if hasattr(pool, "close"):
+                pool.close()
+
+    @classmethod
+    def build(cls, hostsystems, concurrency=None):
+        """creates the storage models of the hosts and fetches their devices, at most `concurrency` (by default,
+        `max_concurrent_builds`) hosts at a time.
+        :returns: a list of the models"""
+        models = [cls.create(hostsystem) for hostsystem in hostsystems]
+        cls._build_all(models, concurrency or cls.max_concurrent_builds)
+        return models
+
+    @classmethod
+    def refresh_hot_models(cls, count):
+        """refreshes and re-builds the models of the `count` hosts used the most since the previous call"""
+        with cls._lock:
+            hot_keys = sorted(cls.hits_by_host_value, key=cls.hits_by_host_value.get, reverse=True)[:count]
+            cls.hits_by_host_value.clear()
+            models = [cls.models_by_host_value[key] for key in hot_keys if key in cls.models_by_host_value]
+        for model in models:
+            model.refresh()
+        cls._build_all(models, cls.max_concurrent_builds)
+        return models
+
+    @classmethod
+    def start_background_refresh(cls, interval, count):
+        """refreshes the `count` hottest hosts every `interval` seconds, in a greenlet or a thread"""
+        if cls._refresh_worker is not None:
+            return
+        stop_event = get_event()
+
+        def refresh_loop():
+            while not stop_event.wait(interval):
+                try:
+                    cls.refresh_hot_models(count)
+                except Exception:
+                    logger.exception("background refresh of storage models failed")
+
+        cls._refresh_stop_event = stop_event
+        cls._refresh_worker = spawn(refresh_loop, name="StorageModelFactory")
+
+    @classmethod
+    def stop_background_refresh(cls):
+        if cls._refresh_worker is None:
+            return
+        cls._refresh_stop_event.set()
+        cls._refresh_worker.join()
+        cls._refresh_worker = None
 
     @classmethod
     def get_id(cls):
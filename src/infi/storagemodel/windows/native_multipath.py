@@ -106,6 +106,10 @@ class WindowsNativeMultipathBlockDevice(WindowsDiskDeviceMixin, WindowsDeviceMix
     def get_block_access_path(self):
         return self.get_pdo()
 
+    @cached_method
+    def get_block_access_path_aliases(self):
+        return [r"\\.\{}".format(self.get_display_name())]
+
     @cached_method
     def get_paths(self):
         return [WindowsPath(item, self._multipath_object) for item in self._multipath_object.PdoInformation]
@@ -0,0 +1,111 @@
+from unittest import TestCase
+from mock import patch
+from infi.dtypes.hctl import HCTL
+from infi.storagemodel.base.delta import build_device_snapshot, get_device_delta
+from infi.storagemodel.predicates import IncrementalDiskExists, IncrementalDiskNotExists
+
+
+class Path(object):
+    def __init__(self, path_id):
+        self.path_id = path_id
+
+    def get_path_id(self):
+        return self.path_id
+
+
+class Device(object):
+    def __init__(self, block_access_path, serial, hctl=None, path_ids=()):
+        self.block_access_path = block_access_path
+        self.serial = serial
+        self.hctl = hctl
+        self.paths = [Path(path_id) for path_id in path_ids]
+        self.wwid = "naa.{}".format(serial)
+        self.inquiries = 0
+
+    def get_cached_wwid(self):
+        return self.wwid
+
+    def get_hctl(self):
+        return self.hctl
+
+    def get_block_access_path(self):
+        return self.block_access_path
+
+    def get_paths(self):
+        return self.paths
+
+    def get_scsi_test_unit_ready(self):
+        pass
+
+    def get_scsi_serial_number(self):
+        self.inquiries += 1
+        return self.serial
+
+
+class FakeModel(object):
+    def __init__(self):
+        self.scsi_devices = [Device("/dev/sd{}".format(chr(ord("a") + index)), "scsi-{}".format(index),
+                                    HCTL(1, 0, 0, index)) for index in range(5)]
+        self.mp_devices = [Device("/dev/mapper/mpath{}".format(index), "mp-{}".format(index),
+                                  path_ids=["sdx{}".format(index), "sdy{}".format(index)]) for index in range(5)]
+
+    def get_device_snapshot(self):
+        return build_device_snapshot(self.scsi_devices, self.mp_devices)
+
+
+class DeviceDeltaTestCase(TestCase):
+    def setUp(self):
+        self.model = FakeModel()
+
+    def test_first_delta_has_everything(self):
+        delta = get_device_delta(None, self.model.get_device_snapshot())
+        self.assertEqual(len(delta.added), 10)
+        self.assertFalse(delta.removed or delta.changed)
+
+    def test_delta(self):
+        previous = self.model.get_device_snapshot()
+        self.assertTrue(get_device_delta(previous, self.model.get_device_snapshot()).is_empty())
+        removed = self.model.scsi_devices.pop(1)
+        self.model.scsi_devices[0] = Device("/dev/sdz", "scsi-0", HCTL(1, 0, 0, 0))
+        self.model.mp_devices[2].paths.pop()
+        added = Device("/dev/mapper/mpath9", "mp-9", path_ids=["sdq"])
+        self.model.mp_devices.append(added)
+        delta = get_device_delta(previous, self.model.get_device_snapshot())
+        self.assertEqual(delta.added.values(), [added])
+        self.assertEqual(delta.removed.values(), [removed])
+        self.assertEqual(sorted(device.block_access_path for device in delta.changed.values()),
+                         ["/dev/mapper/mpath2", "/dev/sdz"])
+
+
+class IncrementalPredicateTestCase(TestCase):
+    def setUp(self):
+        self.model = FakeModel()
+        patcher = patch("infi.storagemodel.get_storage_model")
+        patcher.start().return_value = self.model
+        self.addCleanup(patcher.stop)
+
+    def test_only_new_devices_are_queried(self):
+        predicate = IncrementalDiskExists("mp-7")
+        self.assertFalse(predicate())
+        self.assertFalse(predicate())
+        self.model.mp_devices.append(Device("/dev/mapper/mpath7", "mp-7", path_ids=["sdq"]))
+        self.assertTrue(predicate())
+        self.assertEqual([device.inquiries for device in self.model.scsi_devices + self.model.mp_devices],
+                         [1] * 10 + [1])
+
+    def test_disk_gone(self):
+        predicate = IncrementalDiskNotExists("scsi-3")
+        self.assertFalse(predicate())
+        del self.model.scsi_devices[3]
+        self.assertTrue(predicate())
+        predicate.reset()
+        self.assertTrue(predicate())
+
+    def test_volume_remapped_at_the_same_lun(self):
+        # the volume of scsi-2 is unmapped and a new volume is mapped at the same LUN number, keeping /dev/sdc
+        gone, new = IncrementalDiskNotExists("scsi-2"), IncrementalDiskExists("scsi-9")
+        self.assertFalse(gone())
+        self.assertFalse(new())
+        self.model.scsi_devices[2] = Device("/dev/sdc", "scsi-9", HCTL(1, 0, 0, 2))
+        self.assertTrue(gone())
+        self.assertTrue(new())
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import Mock, patch
+from infi.storagemodel.linux.device_mapper import SysfsMultipathProvider
+from infi.storagemodel.linux.native_multipath import LinuxNativeMultipathModel, MULTIPATH_PROVIDER_AUTO, \
+    MULTIPATH_PROVIDER_SYSFS
+
+# dm name, map name, uuid, devno, slaves
+DM_DEVICES = [("dm-0", "mpatha", "mpath-35742b0f006800000", "253:0", ["sdb", "sdc"]),
+              ("dm-1", "mpathb", "mpath-36000402001f45eb5", "253:1", ["sdd"]),
+              ("dm-2", "vg-root", "LVM-zQW8vB6TyVL3hYQ", "253:2", ["sda"])]
+
+# device name, devno, hctl, state
+SD_DEVICES = [("sda", "8:0", "0:0:0:0", "running"),
+              ("sdb", "8:16", "3:0:0:1", "running"),
+              ("sdc", "8:32", "2:0:0:1", "offline"),
+              ("sdd", "8:48", "2:0:1:0", "offline")]
+
+
+def _write(path, content):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fd:
+        fd.write(content + "\n")
+
+
+def create_fake_sysfs(root):
+    for dm_name, name, uuid, devno, slaves in DM_DEVICES:
+        _write(os.path.join(root, "block", dm_name, "dev"), devno)
+        _write(os.path.join(root, "block", dm_name, "dm", "name"), name)
+        _write(os.path.join(root, "block", dm_name, "dm", "uuid"), uuid)
+        os.makedirs(os.path.join(root, "block", dm_name, "slaves"))
+        for slave in slaves:
+            os.symlink(os.path.join("..", "..", slave), os.path.join(root, "block", dm_name, "slaves", slave))
+    for device_name, devno, hctl, state in SD_DEVICES:
+        _write(os.path.join(root, "block", device_name, "dev"), devno)
+        os.symlink(os.path.join("..", "..", "devices", "target", hctl), os.path.join(root, "block", device_name, "device"))
+        _write(os.path.join(root, "class", "scsi_device", hctl, "device", "state"), state)
+
+
+class SysfsMultipathProviderTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        create_fake_sysfs(self.root)
+
+    def _get_devices(self):
+        devices = SysfsMultipathProvider(self.root).get_list_of_multipath_devices()
+        return dict((device.device_name, device) for device in devices)
+
+    def _patch_sysfs_root(self):
+        provider = SysfsMultipathProvider(self.root)
+        return patch("infi.storagemodel.linux.device_mapper.SysfsMultipathProvider", lambda: provider)
+
+    def test_only_multipath_maps(self):
+        self.assertEqual(sorted(self._get_devices()), ["mpatha", "mpathb"])
+
+    def test_device(self):
+        mpatha = self._get_devices()["mpatha"]
+        self.assertEqual(mpatha.id, "35742b0f006800000")
+        self.assertEqual(mpatha.dm_name, "dm-0")
+        self.assertEqual(mpatha.major_minor, (253, 0))
+
+    def test_paths(self):
+        [group] = self._get_devices()["mpatha"].path_groups
+        self.assertEqual([(path.device_name, path.major_minor, path.hctl, path.state) for path in group.paths],
+                         [("sdb", (8, 16), (3, 0, 0, 1), "active"), ("sdc", (8, 32), (2, 0, 0, 1), "failed")])
+
+    def test_disappearing_path(self):
+        os.remove(os.path.join(self.root, "block", "sdc", "device"))
+        [group] = self._get_devices()["mpatha"].path_groups
+        self.assertEqual([path.device_name for path in group.paths], ["sdb"])
+
+    def test_model(self):
+        sysfs = Mock()
+        model = LinuxNativeMultipathModel(sysfs, Mock(), MULTIPATH_PROVIDER_SYSFS)
+        with self._patch_sysfs_root():
+            devices = model.get_all_multipath_block_devices()
+        # mpathb has no running paths
+        self.assertEqual([device.get_display_name() for device in devices], ["dm-0"])
+        self.assertFalse(model.multipath_client.is_running.called)
+
+    def test_fallback_when_multipathd_is_not_running(self):
+        client = Mock()
+        client.is_running.return_value = False
+        model = LinuxNativeMultipathModel(Mock(), client, MULTIPATH_PROVIDER_AUTO)
+        with self._patch_sysfs_root():
+            devices = model.get_all_multipath_block_devices()
+        self.assertEqual([device.get_display_name() for device in devices], ["dm-0"])
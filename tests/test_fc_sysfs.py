@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from infi.dtypes.wwn import WWN
+from infi.storagemodel.linux.fc import SysfsFCHCTLProvider
+from infi.storagemodel.connectivity import ConnectivityFactoryImpl, FCConnectivity
+
+# host, port name
+FC_HOSTS = [(3, "0x21000024ff3b1a2c"), (4, "0x21000024ff3b1a2d")]
+
+# rport name, port name, scsi target id
+FC_REMOTE_PORTS = [("rport-3:0-0", "0x5742b0f000753611", 0),
+                   ("rport-3:0-1", "0x5742b0f000753621", 1),
+                   ("rport-3:0-2", "0x200100051e0f5f2e", -1),
+                   ("rport-4:0-0", "0x5742b0f000753612", 0)]
+
+
+def _write(path, content):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fd:
+        fd.write(content + "\n")
+
+
+def create_fake_sysfs(root, hosts=FC_HOSTS, remote_ports=FC_REMOTE_PORTS):
+    for host, port_name in hosts:
+        _write(os.path.join(root, "class", "fc_host", "host{}".format(host), "port_name"), port_name)
+        _write(os.path.join(root, "class", "fc_host", "host{}".format(host), "node_name"), port_name)
+    for rport_name, port_name, target_id in remote_ports:
+        add_remote_port(root, rport_name, port_name, target_id)
+
+
+def add_remote_port(root, rport_name, port_name, target_id):
+    path = os.path.join(root, "class", "fc_remote_ports", rport_name)
+    _write(os.path.join(path, "port_name"), port_name)
+    _write(os.path.join(path, "node_name"), port_name)
+    _write(os.path.join(path, "scsi_target_id"), str(target_id))
+
+
+class SysfsFCHCTLProviderTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        create_fake_sysfs(self.root)
+        self.provider = SysfsFCHCTLProvider(self.root)
+
+    def test_mappings(self):
+        mappings = self.provider.get_fc_hctl_mappings()
+        self.assertEqual(sorted(mappings), [(3, 0, 0), (3, 0, 1), (4, 0, 0)])
+        local_port, remote_port = mappings[(3, 0, 1)]
+        self.assertEqual(local_port.port_wwn, WWN("21:00:00:24:ff:3b:1a:2c"))
+        self.assertEqual(remote_port.port_wwn, WWN("57:42:b0:f0:00:75:36:21"))
+        self.assertEqual(remote_port.hct, (3, 0, 1))
+        self.assertEqual(len(local_port.discovered_ports), 2)
+
+    def test_generation(self):
+        mappings = self.provider.get_fc_hctl_mappings()
+        self.assertIs(self.provider.get_fc_hctl_mappings(), mappings)
+        add_remote_port(self.root, "rport-4:0-1", "0x5742b0f000753622", 1)
+        self.assertEqual(sorted(self.provider.get_fc_hctl_mappings()), [(3, 0, 0), (3, 0, 1), (4, 0, 0), (4, 0, 1)])
+        shutil.rmtree(os.path.join(self.root, "class", "fc_remote_ports", "rport-3:0-0"))
+        self.assertNotIn((3, 0, 0), self.provider.get_fc_hctl_mappings())
+
+    def test_target_role_added(self):
+        # lpfc creates the remote port without a target id, and sets it when the port gets the target role
+        mappings = self.provider.get_fc_hctl_mappings()
+        self.assertNotIn((3, 0, 2), mappings)
+        self.assertIs(self.provider.get_fc_hctl_mappings(), mappings)
+        _write(os.path.join(self.root, "class", "fc_remote_ports", "rport-3:0-2", "scsi_target_id"), "2")
+        self.assertIn((3, 0, 2), self.provider.get_fc_hctl_mappings())
+
+    def test_unreadable_remote_port(self):
+        add_remote_port(self.root, "rport-4:0-1", "0x5742b0f000753622", 1)
+        port_name_path = os.path.join(self.root, "class", "fc_remote_ports", "rport-4:0-1", "port_name")
+        os.remove(port_name_path)
+        self.assertNotIn((4, 0, 1), self.provider.get_fc_hctl_mappings())
+        _write(port_name_path, "0x5742b0f000753622")
+        self.assertIn((4, 0, 1), self.provider.get_fc_hctl_mappings())
+
+    def test_unavailable(self):
+        self.assertFalse(SysfsFCHCTLProvider(os.path.join(self.root, "missing")).is_available())
+        self.assertEqual(SysfsFCHCTLProvider(os.path.join(self.root, "missing")).get_fc_hctl_mappings(), {})
+
+    def test_connectivity_factory(self):
+        from infi.dtypes.hctl import HCTL
+
+        class Device(object):
+            def get_hctl(self):
+                return HCTL(4, 0, 0, 7)
+
+        factory = ConnectivityFactoryImpl()
+        factory.set_fc_hctl_provider(self.provider)
+        connectivity = factory.get_by_device_with_hctl(Device())
+        self.assertIsInstance(connectivity, FCConnectivity)
+        self.assertEqual(connectivity.get_key(), ("21000024ff3b1a2d", "5742b0f000753612"))
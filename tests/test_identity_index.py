@@ -0,0 +1,137 @@
+from unittest import TestCase
+from mock import patch, Mock
+from infi.storagemodel.base.identity import DeviceIdentityIndex
+from infi.storagemodel.errors import RescanIsNeeded
+
+NAA = "6742b0f000004e2b000000000000018c"
+
+
+class Designator(object):
+    def __init__(self, designator_type, identifier):
+        self.designator_type = designator_type
+        self.identifier = identifier
+
+    def pack(self):
+        return bytearray("\x01" + chr(self.designator_type) + "\x00" + chr(len(self.identifier)) + self.identifier)
+
+
+class Page(object):
+    def __init__(self, designators_list):
+        self.designators_list = designators_list
+
+
+class Device(object):
+    def __init__(self, serial, naa=None):
+        self.serial = serial
+        self.naa = naa
+        self.inquiries = 0
+        self.error = None
+
+    def get_scsi_test_unit_ready(self):
+        if self.error is not None:
+            raise self.error
+
+    def get_scsi_serial_number(self):
+        self.inquiries += 1
+        return self.serial
+
+    def get_scsi_inquiry_pages(self):
+        self.inquiries += 1
+        if self.naa is None:
+            return {}
+        return {0x83: Page([Designator(8, "iqn.test"), Designator(3, self.naa.decode("hex"))])}
+
+
+class DeviceIdentityIndexTestCase(TestCase):
+    def setUp(self):
+        self.devices = [Device("serial-{}".format(index), "{:032x}".format(index)) for index in range(20)]
+        self.devices.append(Device("serial-3"))
+        self.index = DeviceIdentityIndex(self.devices, concurrency=4)
+
+    def test_serial_numbers(self):
+        self.assertEqual(self.index.find_devices_by_serial_number("serial-3"), [self.devices[3], self.devices[20]])
+        self.assertEqual(self.index.find_devices_by_serial_number("serial-1"), [self.devices[1]])
+        self.assertEqual(self.index.find_devices_by_serial_number("missing"), [])
+        self.assertEqual([device.inquiries for device in self.devices], [1] * 21)
+
+    def test_naa_and_wwid(self):
+        self.devices[5].naa = NAA
+        self.assertEqual(self.index.find_devices_by_naa("naa." + NAA.upper()), [self.devices[5]])
+        self.assertEqual(self.index.find_devices_by_wwid("3" + NAA), [self.devices[5]])
+        self.assertEqual(self.index.find_devices_by_naa("{:032x}".format(20)), [])
+        # serial numbers are not collected until they are looked up
+        self.assertEqual([device.inquiries for device in self.devices], [1] * 21)
+
+    def test_errors_are_raised_from_lookups(self):
+        self.devices[7].error = RescanIsNeeded()
+        self.assertRaises(RescanIsNeeded, self.index.find_devices_by_serial_number, "serial-1")
+        self.devices[7].error = None
+        self.assertEqual(self.index.find_devices_by_serial_number("serial-7"), [self.devices[7]])
+
+    def test_is_built_from(self):
+        self.assertTrue(self.index.is_built_from(list(self.devices)))
+        self.assertFalse(self.index.is_built_from(self.devices[1:]))
+        self.assertFalse(self.index.is_built_from([Device("serial-0")] + self.devices[1:]))
+
+
+class InfinidatNAA(object):
+    def __init__(self, system_serial, volume_id):
+        self.system_serial = system_serial
+        self.volume_id = volume_id
+
+    def get_system_serial(self):
+        return self.system_serial
+
+    def get_volume_id(self):
+        return self.volume_id
+
+
+class InfinidatDevice(Device):
+    def __init__(self, serial, system_serial, volume_id):
+        super(InfinidatDevice, self).__init__(serial)
+        self.vendor = Mock()
+        self.vendor.get_naa.return_value = InfinidatNAA(system_serial, volume_id)
+
+    def get_vendor(self):
+        return self.vendor
+
+
+class InfinidatVolumeExistsTestCase(TestCase):
+    def setUp(self):
+        from infi.storagemodel.base import StorageModel
+        self.model = StorageModel()
+        self.model.get_identity_index = Mock()
+        for name, value in (("infi.storagemodel.get_storage_model", lambda: self.model),
+                            ("infi.storagemodel.vendor.infinidat.shortcuts.get_infinidat_block_devices",
+                             lambda: self.devices)):
+            patcher = patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_volume_exists(self):
+        from infi.storagemodel.vendor.infinidat.predicates import InfinidatVolumeExists, InfinidatVolumeDoesNotExist
+        self.devices = [InfinidatDevice("serial-1", 0x4e2b, 0x18c), InfinidatDevice("serial-2", 0x4e2b, 0x18e)]
+        self.assertTrue(InfinidatVolumeExists(0x4e2b, 0x18c)())
+        self.assertFalse(InfinidatVolumeExists(0x4e2b, 0x18d)())
+        self.assertTrue(InfinidatVolumeDoesNotExist(0x4e2c, 0x18c)())
+        # a system serial wider than 32 bits
+        self.devices = self.devices + [InfinidatDevice("serial-3", 0x100004e2b, 0x18c)]
+        self.assertTrue(InfinidatVolumeExists(0x100004e2b, 0x18c)())
+        # only the Infinidat devices are queried
+        self.assertFalse(self.model.get_identity_index.called)
+
+    def test_index_is_shared(self):
+        from infi.storagemodel.vendor.infinidat.predicates import InfinidatVolumeExists, InfinidatVolumeDoesNotExist
+        self.devices = [InfinidatDevice("serial-1", 0x4e2b, 0x18c)]
+        predicates = [InfinidatVolumeExists(0x4e2b, volume_id) for volume_id in range(0x18c, 0x190)]
+        predicates.append(InfinidatVolumeDoesNotExist(0x4e2b, 0x18d))
+        self.assertEqual([predicate() for predicate in predicates], [True, False, False, False, True])
+        self.assertEqual([predicate() for predicate in predicates], [True, False, False, False, True])
+        self.assertEqual(self.devices[0].vendor.get_naa.call_count, 1)
+        self.devices = self.devices + [InfinidatDevice("serial-2", 0x4e2b, 0x18d)]
+        self.assertTrue(predicates[1]())
+        self.assertEqual(self.devices[0].vendor.get_naa.call_count, 2)
+        # the index is dropped on refresh, even if the model returns the same device objects
+        self.model.refresh()
+        self.assertFalse(predicates[-1]())
+        self.assertEqual(self.devices[0].vendor.get_naa.call_count, 3)
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from infi.storagemodel.linux.iscsi import SysfsISCSIProvider
+from infi.storagemodel.connectivity import ConnectivityFactoryImpl, ISCSIConnectivity, LocalConnectivity
+
+INITIATOR = "iqn.1994-05.com.redhat:host1"
+TARGET = "iqn.2009-11.com.infinidat:storage:infinibox-sn-1"
+
+
+def _write(path, content):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fd:
+        fd.write(content + "\n")
+
+
+def add_session(root, session, host, target, portal, session_initiator="(null)"):
+    device_path = os.path.join(root, "devices", "platform", "host{}".format(host), "session{}".format(session))
+    os.makedirs(os.path.join(device_path, "target{}:0:{}".format(host, target)))
+    session_path = os.path.join(root, "class", "iscsi_session", "session{}".format(session))
+    _write(os.path.join(session_path, "targetname"), TARGET)
+    _write(os.path.join(session_path, "tpgt"), "1")
+    _write(os.path.join(session_path, "initiatorname"), session_initiator)
+    os.symlink(device_path, os.path.join(session_path, "device"))
+    connection_path = os.path.join(root, "class", "iscsi_connection", "connection{}:0".format(session))
+    _write(os.path.join(connection_path, "persistent_address"), portal)
+    _write(os.path.join(connection_path, "persistent_port"), "3260")
+
+
+class SysfsISCSIProviderTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        _write(os.path.join(self.root, "class", "iscsi_host", "host5", "initiatorname"), INITIATOR)
+        add_session(self.root, 1, 5, 0, "10.0.0.1")
+        add_session(self.root, 2, 6, 0, "10.0.0.2", "iqn.1994-05.com.redhat:host2")
+        self.provider = SysfsISCSIProvider(self.root)
+
+    def test_mappings(self):
+        mappings = self.provider.get_iscsi_hctl_mappings()
+        self.assertEqual(sorted(mappings), [(5, 0, 0), (6, 0, 0)])
+        session = mappings[(5, 0, 0)]
+        self.assertEqual((session.initiator_iqn, session.target_iqn, session.target_portal, session.tpgt),
+                         (INITIATOR, TARGET, ("10.0.0.1", 3260), 1))
+        self.assertEqual(mappings[(6, 0, 0)].initiator_iqn, "iqn.1994-05.com.redhat:host2")
+
+    def test_generation(self):
+        mappings = self.provider.get_iscsi_hctl_mappings()
+        self.assertIs(self.provider.get_iscsi_hctl_mappings(), mappings)
+        add_session(self.root, 3, 5, 1, "10.0.0.3")
+        self.assertEqual(sorted(self.provider.get_iscsi_hctl_mappings()), [(5, 0, 0), (5, 0, 1), (6, 0, 0)])
+
+    def test_target_added_to_existing_session(self):
+        # the kernel removes the target of a session without luns, and adds it back when a lun is mapped
+        target_path = os.path.join(self.root, "devices", "platform", "host5", "session1", "target5:0:0")
+        os.rmdir(target_path)
+        self.assertEqual(sorted(self.provider.get_iscsi_hctl_mappings()), [(6, 0, 0)])
+        os.makedirs(target_path)
+        self.assertEqual(sorted(self.provider.get_iscsi_hctl_mappings()), [(5, 0, 0), (6, 0, 0)])
+
+    def test_connectivity_factory(self):
+        from infi.dtypes.hctl import HCTL
+
+        class Device(object):
+            def __init__(self, hctl):
+                self.hctl = hctl
+
+            def get_hctl(self):
+                return self.hctl
+
+        factory = ConnectivityFactoryImpl()
+        factory.set_iscsi_hctl_provider(self.provider)
+        factory.get_fc_hctl_mappings = lambda: {}
+        connectivity = factory.get_by_device_with_hctl(Device(HCTL(5, 0, 0, 3)))
+        self.assertIsInstance(connectivity, ISCSIConnectivity)
+        self.assertEqual(connectivity.get_key(), (INITIATOR, TARGET))
+        self.assertEqual(connectivity.get_target_portal(), ("10.0.0.1", 3260))
+        self.assertIsInstance(factory.get_by_device_with_hctl(Device(HCTL(7, 0, 0, 3))), LocalConnectivity)
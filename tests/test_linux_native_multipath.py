@@ -0,0 +1,66 @@
+from unittest import TestCase
+from mock import Mock
+from infi.dtypes.hctl import HCTL
+from infi.storagemodel.errors import DeviceDisappeared
+from infi.storagemodel.linux.native_multipath import LinuxNativeMultipathBlockDevice
+from infi.storagemodel.linux.device_mapper import DeviceMapperMultipathDevice, DeviceMapperPathGroup, DeviceMapperPath
+
+
+def create_path_group(states, first_index=0, state="active"):
+    path_group = DeviceMapperPathGroup([DeviceMapperPath("sd{}".format(chr(ord('b') + index)), (8, 16 * index),
+                                                         path_state, (index, 0, 0, 1))
+                                        for index, path_state in enumerate(states, first_index)])
+    path_group.state = state
+    return path_group
+
+
+def create_multipath_device(*states):
+    return DeviceMapperMultipathDevice("3600", "mpatha", "dm-0", (253, 0), [create_path_group(states)])
+
+
+class LazyPathTestCase(TestCase):
+    def setUp(self):
+        self.sysfs = Mock()
+
+    def test_liveness_does_not_build_paths(self):
+        device = LinuxNativeMultipathBlockDevice(self.sysfs, Mock(), create_multipath_device("failed", "active"))
+        self.assertTrue(device._is_there_atleast_one_path_up())
+        device = LinuxNativeMultipathBlockDevice(self.sysfs, Mock(), create_multipath_device("failed"))
+        self.assertFalse(device._is_there_atleast_one_path_up())
+        self.assertFalse(self.sysfs.find_scsi_disk_by_hctl.called)
+
+    def test_paths_are_bound_on_demand(self):
+        device = LinuxNativeMultipathBlockDevice(self.sysfs, Mock(), create_multipath_device("active", "failed"))
+        paths = device.get_paths()
+        self.assertEqual([(path.get_path_id(), path.get_state()) for path in paths], [("sdb", "up"), ("sdc", "down")])
+        self.assertEqual(paths[1].get_hctl(), HCTL(1, 0, 0, 1))
+        self.assertFalse(self.sysfs.find_scsi_disk_by_hctl.called)
+        self.assertEqual(paths[1].sysfs_device, self.sysfs.find_scsi_disk_by_hctl.return_value)
+        self.sysfs.find_scsi_disk_by_hctl.assert_called_once_with(HCTL(1, 0, 0, 1))
+
+    def test_disappeared_path(self):
+        self.sysfs.find_scsi_disk_by_hctl.side_effect = ValueError()
+        device = LinuxNativeMultipathBlockDevice(self.sysfs, Mock(), create_multipath_device("active"))
+        [path] = device.get_paths()
+        self.assertRaises(DeviceDisappeared, getattr, path, "sysfs_device")
+
+
+class ActivePathGroupTestCase(TestCase):
+    def _create_device(self, *path_groups):
+        return LinuxNativeMultipathBlockDevice(Mock(), Mock(),
+                                               DeviceMapperMultipathDevice("3600", "mpatha", "dm-0", (253, 0),
+                                                                           list(path_groups)))
+
+    def test_single_path_group(self):
+        self.assertIsNone(self._create_device(create_path_group(["active", "active"])).get_active_path_group_path_ids())
+
+    def test_active_path_group(self):
+        # with ALUA, the paths of the standby group are up but carry no I/O
+        device = self._create_device(create_path_group(["active", "active"]),
+                                     create_path_group(["active", "active"], 2, "enabled"))
+        self.assertEqual(device.get_active_path_group_path_ids(), set(["sdb", "sdc"]))
+
+    def test_unknown_active_path_group(self):
+        device = self._create_device(create_path_group(["active"], 0, "enabled"),
+                                     create_path_group(["active"], 1, "enabled"))
+        self.assertRaises(ValueError, device.get_active_path_group_path_ids)
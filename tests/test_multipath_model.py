@@ -0,0 +1,96 @@
+from unittest import TestCase
+from infi.dtypes.hctl import HCTL
+from infi.storagemodel.base import multipath
+
+
+class Device(object):
+    def __init__(self, hctl):
+        self.hctl = hctl
+
+    def get_hctl(self):
+        return self.hctl
+
+
+class MultipathDevice(object):
+    def __init__(self, *hctls):
+        self.paths = [Device(hctl) for hctl in hctls]
+
+    def get_paths(self):
+        return self.paths
+
+
+class MultipathModel(multipath.MultipathFrameworkModel):
+    def __init__(self, block_devices=(), controllers=()):
+        super(MultipathModel, self).__init__()
+        self.block_devices = list(block_devices)
+        self.controllers = list(controllers)
+
+    def get_all_multipath_block_devices(self):
+        return self.block_devices
+
+    def get_all_multipath_storage_controller_devices(self):
+        return self.controllers
+
+
+class PathOwnershipTestCase(TestCase):
+    def setUp(self):
+        self.disk = MultipathDevice(HCTL(1, 0, 0, 1), HCTL(2, 0, 0, 1))
+        self.controller = MultipathDevice(HCTL(1, 0, 0, 0), HCTL(2, 0, 0, 0))
+        self.model = MultipathModel([self.disk], [self.controller])
+
+    def test_filter_non_multipath_scsi_block_devices(self):
+        devices = [Device(HCTL(1, 0, 0, 1)), Device(HCTL(3, 0, 0, 1)), Device(HCTL(2, 0, 0, 1))]
+        self.assertEqual(self.model.filter_non_multipath_scsi_block_devices(devices), [devices[1]])
+
+    def test_filter_non_multipath_scsi_storage_controller_devices(self):
+        devices = [Device(HCTL(1, 0, 0, 0)), Device(HCTL(1, 0, 0, 1))]
+        self.assertEqual(self.model.filter_non_multipath_scsi_storage_controller_devices(devices), [devices[1]])
+
+    def test_get_owner(self):
+        self.assertIs(self.model.get_owner(Device(HCTL(2, 0, 0, 1))), self.disk)
+        self.assertIs(self.model.get_owner(Device(HCTL(2, 0, 0, 0))), self.controller)
+        self.assertIsNone(self.model.get_owner(Device(HCTL(5, 0, 0, 0))))
+
+    def test_index_is_cached(self):
+        self.assertIs(self.model.get_block_device_path_ownership_index(),
+                      self.model.get_block_device_path_ownership_index())
+
+
+class BlockDevice(multipath.MultipathBlockDevice):
+    def __init__(self, block_access_path, aliases):
+        super(BlockDevice, self).__init__()
+        self.block_access_path = block_access_path
+        self.aliases = aliases
+
+    def get_block_access_path(self):
+        return self.block_access_path
+
+    def get_block_access_path_aliases(self):
+        return self.aliases
+
+
+class AliasIndexTestCase(TestCase):
+    def setUp(self):
+        self.first = BlockDevice("/dev/mapper/mpatha", ["/dev/dm-0", "naa.6742b0f000004e2b000000000000018c"])
+        self.second = BlockDevice(r"\\?\mpio#disk&ven_nfinidat", [r"\\.\PHYSICALDRIVE1"])
+        self.model = MultipathModel([self.first, self.second])
+
+    def test_find_by_block_access_path(self):
+        self.assertIs(self.model.find_multipath_device_by_block_access_path("/dev/mapper/mpatha"), self.first)
+
+    def test_find_by_alias(self):
+        self.assertIs(self.model.find_multipath_device_by_block_access_path("/dev/dm-0"), self.first)
+        self.assertIs(self.model.find_multipath_device_by_block_access_path(r"\\.\PHYSICALDRIVE1"), self.second)
+
+    def test_find_case_insensitive(self):
+        self.assertIs(self.model.find_multipath_device_by_block_access_path("NAA.6742B0F000004E2B000000000000018C"),
+                      self.first)
+        self.assertIs(self.model.find_multipath_device_by_block_access_path(r"\\.\physicaldrive1"), self.second)
+
+    def test_find_missing(self):
+        self.assertRaises(KeyError, self.model.find_multipath_device_by_block_access_path, "/dev/dm-1")
+
+    def test_batch_resolve(self):
+        result = self.model.find_multipath_devices_by_block_access_paths(["/dev/dm-0", "/dev/dm-1",
+                                                                          r"\\.\PHYSICALDRIVE1"])
+        self.assertEqual(result, {"/dev/dm-0": self.first, r"\\.\PHYSICALDRIVE1": self.second})
@@ -0,0 +1,202 @@
+import os
+import socket
+import tempfile
+import threading
+from unittest import TestCase
+from mock import patch, mock_open
+from infi.multipathtools.connection import MessageLength, HEADER_SIZE
+from infi.multipathtools.errors import TimeoutExpired
+from infi.storagemodel.linux.multipathd import PersistentMultipathClient, SHOW_MAPS_COMMAND, SHOW_PATHS_FORMAT_COMMAND, \
+    SHOW_PATHS_SIGNATURE_COMMAND
+
+MAPS_HEADER = "name   sysfs uuid                              paths dm-st  path_faults switch_grp map_loads"
+
+TOPOLOGY = {
+    "mpatha": "mpatha (35742b0f006800000) dm-0 INFINID,Infinidat A01\n"
+              "size=10G features='0' hwhandler='0' wp=rw\n"
+              "|-+- policy='round-robin 0' prio=1 status=active\n"
+              "| `- 3:0:0:1 sdb 8:16 active ready running\n"
+              "`-+- policy='round-robin 0' prio=1 status=enabled\n"
+              "  `- 2:0:0:1 sdc 8:32 active ready running",
+    "mpathb": "mpathb (36000402001f45eb565889a4b00000000) dm-2 NEXSAN,SATABoy2\n"
+              "size=47G features='0' hwhandler='0' wp=rw\n"
+              "|-+- policy='round-robin 0' prio=1 status=active\n"
+              "| `- 2:0:1:0 sdd 8:48 active ready running\n"
+              "`-+- policy='round-robin 0' prio=1 status=enabled\n"
+              "  `- 3:0:1:1 sdf 8:80 active ready running",
+}
+
+PATHS = "hcil    dev dev_t pri dm_st  chk_st dev_st  next_check      \n" \
+        "3:0:0:1 sdb 8:16  1   active ready  running XXXXXXX... 14/20\n" \
+        "2:0:0:1 sdc 8:32  1   active ready  running XXXXXXXX.. 16/20\n" \
+        "2:0:1:0 sdd 8:48  1   active ready  running XXXXXXXX.. 16/20\n" \
+        "3:0:1:1 sdf 8:80  1   failed faulty running XXXXXX.... 13/20"
+
+
+def _write_message(connection, message):
+    length = MessageLength()
+    length.length = len(message)
+    connection.sendall(MessageLength.write_to_string(length) + message)
+
+
+def _read_exactly(connection, size):
+    data = ''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class FakeMultipathd(object):
+    def __init__(self, address):
+        self.maps = {"mpatha": "0 0 0", "mpathb": "0 0 0"}
+        self.path_priorities = {"3:0:0:1": 50, "2:0:0:1": 10, "2:0:1:0": 50, "3:0:1:1": 10}
+        self.supports_show_maps_format = True
+        self.respond = True
+        self.commands = []
+        self.connections = 0
+        self._connections = []
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(address)
+        self._socket.listen(5)
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            self._connections.append(connection)
+            thread = threading.Thread(target=self._serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, connection):
+        while True:
+            header = _read_exactly(connection, HEADER_SIZE)
+            if header is None:
+                return
+            command = _read_exactly(connection, MessageLength.create_from_string(header).length).strip('\x00\n')
+            self.commands.append(command)
+            if self.respond:
+                _write_message(connection, self._get_response(command) + '\n\x00')
+
+    def _get_response(self, command):
+        if command == SHOW_MAPS_COMMAND:
+            if not self.supports_show_maps_format:
+                return "fail"
+            return "\n".join([MAPS_HEADER] + ["{} dm-0 uuid 2 active {}".format(name, signature)
+                                              for name, signature in sorted(self.maps.items())])
+        if command == SHOW_PATHS_SIGNATURE_COMMAND:
+            paths = [("mpatha", "3:0:0:1", "active"), ("mpatha", "2:0:0:1", "active"),
+                     ("mpathb", "2:0:1:0", "active"), ("mpathb", "3:0:1:1", "failed")]
+            return "\n".join(["multipath hcil    pri dm_st"] +
+                             ["{} {} {} {}".format(name, hctl, self.path_priorities[hctl], dm_state)
+                              for name, hctl, dm_state in paths if name in self.maps])
+        if command == "show multipaths topology":
+            return "\n".join(TOPOLOGY[name] for name in sorted(self.maps))
+        if command.startswith("show map "):
+            return TOPOLOGY[command.split()[2]]
+        if command == "show paths":
+            return PATHS
+        if command == SHOW_PATHS_FORMAT_COMMAND:
+            return "uuid                              hcil    dev dm_st \n" \
+                   "35742b0f006800000                 3:0:0:1 sdb active\n" \
+                   "36000402001f45eb565889a4b00000000 3:0:1:1 sdf failed\n" \
+                   "36000402001f45eb565889a4b00000001 4:0:1:1 sdg undef"
+        return "fail"
+
+    def close(self):
+        self._socket.close()
+        for connection in self._connections:
+            connection.shutdown(socket.SHUT_RDWR)
+            connection.close()
+        del self._connections[:]
+
+
+class PersistentMultipathClientTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, "multipathd.sock")
+        self.server = FakeMultipathd(self.address)
+        self.client = PersistentMultipathClient(timeout=1, address=self.address)
+        patcher = patch("infi.multipathtools.dtypes.open", mock_open(read_data="253:0"), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        os.rmdir(self.directory)
+
+    def _get_topology_commands(self):
+        return [command for command in self.server.commands if "topology" in command]
+
+    def test_devices(self):
+        self.assertTrue(self.client.is_running())
+        devices = self.client.get_list_of_multipath_devices()
+        self.assertEqual(sorted(device.device_name for device in devices), ["mpatha", "mpathb"])
+        [mpathb] = [device for device in devices if device.device_name == "mpathb"]
+        self.assertEqual([path.state for group in mpathb.path_groups for path in group.paths], ["active", "failed"])
+
+    def test_connection_is_reused(self):
+        self.client.is_running()
+        self.client.get_list_of_multipath_devices()
+        self.client.get_list_of_multipath_devices()
+        self.assertEqual(self.server.connections, 1)
+
+    def test_daemon_stopped(self):
+        self.assertTrue(self.client.is_running())
+        self.client.get_list_of_multipath_devices()
+        self.assertTrue(self.client.is_running())
+        # multipathd exits: its connections are closed and its socket is removed
+        self.server.close()
+        os.remove(self.address)
+        self.assertFalse(self.client.is_running())
+        self.assertFalse(self.client.is_running())
+
+    def test_only_changed_maps_are_fetched(self):
+        self.client.get_list_of_multipath_devices()
+        self.assertEqual(sorted(self._get_topology_commands()), ["show map mpatha topology", "show map mpathb topology"])
+        del self.server.commands[:]
+        self.client.get_list_of_multipath_devices()
+        self.assertEqual(self._get_topology_commands(), [])
+        self.server.maps["mpathb"] = "1 0 1"
+        self.client.get_list_of_multipath_devices()
+        self.assertEqual(self._get_topology_commands(), ["show map mpathb topology"])
+
+    def test_maps_with_changed_path_priorities_are_fetched(self):
+        # an ALUA transition changes the priorities of the path groups without a group switch or a reload
+        self.client.get_list_of_multipath_devices()
+        del self.server.commands[:]
+        self.server.path_priorities.update({"3:0:0:1": 10, "2:0:0:1": 50})
+        self.client.get_list_of_multipath_devices()
+        self.assertEqual(self._get_topology_commands(), ["show map mpatha topology"])
+
+    def test_removed_map(self):
+        self.client.get_list_of_multipath_devices()
+        del self.server.maps["mpatha"]
+        devices = self.client.get_list_of_multipath_devices()
+        self.assertEqual([device.device_name for device in devices], ["mpathb"])
+
+    def test_fallback_to_full_topology(self):
+        self.server.supports_show_maps_format = False
+        devices = self.client.get_list_of_multipath_devices()
+        self.assertEqual(len(devices), 2)
+        self.assertIn("show multipaths topology", self.server.commands)
+
+    def test_timeout(self):
+        self.server.respond = False
+        self.assertRaises(TimeoutExpired, self.client.get_list_of_multipath_devices)
+
+    def test_path_states(self):
+        self.assertEqual(self.client.get_path_states(), [("35742b0f006800000", (3, 0, 0, 1), "sdb", "active"),
+                                                         ("36000402001f45eb565889a4b00000000", (3, 0, 1, 1), "sdf", "failed")])
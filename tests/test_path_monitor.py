@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import Mock
+from infi.storagemodel.linux.path_monitor import PathMonitor, PathState, PathUp, PathDown, LogicalUnitLostAllPaths
+from infi.storagemodel.linux.path_monitor import SysfsPathStateSource, MultipathdPathStateSource
+from test_device_mapper import create_fake_sysfs
+
+
+class FakeSource(object):
+    def __init__(self, states):
+        self.states = states  # (lu_id, path_id) -> state
+
+    def get_path_states(self):
+        return [PathState(lu_id, path_id, None, state, None) for (lu_id, path_id), state in self.states.items()]
+
+
+class PathMonitorTestCase(TestCase):
+    def setUp(self):
+        self.source = FakeSource({("lu1", "sdb"): "up", ("lu1", "sdc"): "up", ("lu2", "sdd"): "up"})
+        self.monitor = PathMonitor([self.source])
+        self.events = []
+        self.monitor.subscribe(self.events.append)
+
+    def test_first_tick_has_no_events(self):
+        self.assertEqual(self.monitor.tick(), [])
+        self.assertEqual(len(self.monitor.get_path_states()), 3)
+
+    def test_path_down_and_up(self):
+        self.monitor.tick()
+        self.source.states[("lu1", "sdb")] = "down"
+        self.assertEqual(self.monitor.tick(), [PathDown("lu1", "sdb")])
+        self.assertEqual(self.monitor.tick(), [])
+        self.source.states[("lu1", "sdb")] = "up"
+        self.assertEqual(self.monitor.tick(), [PathUp("lu1", "sdb")])
+        self.assertEqual(self.events, [PathDown("lu1", "sdb"), PathUp("lu1", "sdb")])
+
+    def test_lost_all_paths(self):
+        self.monitor.tick()
+        self.source.states[("lu2", "sdd")] = "down"
+        self.assertEqual(self.monitor.tick(), [PathDown("lu2", "sdd"), LogicalUnitLostAllPaths("lu2")])
+
+    def test_disappearing_path(self):
+        self.monitor.tick()
+        del self.source.states[("lu2", "sdd")]
+        self.assertEqual(self.monitor.tick(), [PathDown("lu2", "sdd"), LogicalUnitLostAllPaths("lu2")])
+
+    def test_sources_must_agree(self):
+        other = FakeSource({("lu1", "sdb"): "down"})
+        self.monitor.sources.append(other)
+        self.monitor.tick()
+        self.assertEqual(self.monitor.get_path_states()[("lu1", "sdb")].state, "down")
+
+    def test_failing_subscriber(self):
+        self.monitor.subscribe(Mock(side_effect=RuntimeError()))
+        self.monitor.tick()
+        self.source.states[("lu1", "sdb")] = "down"
+        self.monitor.tick()
+        self.assertEqual(self.events, [PathDown("lu1", "sdb")])
+
+    def test_start_and_stop(self):
+        self.monitor.interval = 0.01
+        self.monitor.start()
+        self.monitor.stop()
+        self.assertIsNotNone(self.monitor.get_path_states())
+
+
+class SourcesTestCase(TestCase):
+    def test_sysfs(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        create_fake_sysfs(root)
+        source = SysfsPathStateSource(root)
+        states = dict(((state.lu_id, state.path_id), state.state) for state in source.get_path_states())
+        self.assertEqual(states, {("35742b0f006800000", "sdb"): "up", ("35742b0f006800000", "sdc"): "down",
+                                  ("36000402001f45eb5", "sdd"): "down"})
+        with open(os.path.join(root, "class", "scsi_device", "2:0:0:1", "device", "state"), "w") as fd:
+            fd.write("running\n")
+        states = dict(((state.lu_id, state.path_id), state.state) for state in source.get_path_states())
+        self.assertEqual(states[("35742b0f006800000", "sdc")], "up")
+
+    def test_multipathd(self):
+        client = Mock()
+        client.get_path_states.return_value = [("3600", (3, 0, 0, 1), "sdb", "active"),
+                                               ("3600", (2, 0, 0, 1), "sdc", "failed")]
+        states = MultipathdPathStateSource(client).get_path_states()
+        self.assertEqual([(state.path_id, state.hctl, state.state) for state in states],
+                         [("sdb", (3, 0, 0, 1), "up"), ("sdc", (2, 0, 0, 1), "down")])
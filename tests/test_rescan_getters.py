@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import patch
+from infi.storagemodel.linux.rescan_scsi_bus import getters
+
+
+PROC_SCSI_SCSI = """Attached devices:
+Host: scsi1 Channel: 00 Id: 00 Lun: 00
+  Vendor: NFINIDAT Model: InfiniBox         Rev: 3.0
+  Type:   Storage Controller               ANSI  SCSI revision: 05
+Host: scsi1 Channel: 00 Id: 02 Lun: 11
+  Vendor: NFINIDAT Model: InfiniBox         Rev: 3.0
+  Type:   Direct-Access                    ANSI  SCSI revision: 05
+"""
+
+
+def create_fake_sysfs(root, device_names):
+    for device_name in device_names:
+        os.makedirs(os.path.join(root, device_name))
+
+
+def create_fake_scsi_generic(root, hctls):
+    for index, hctl in enumerate(hctls):
+        device_path = os.path.join(root, "devices", "host1", "target" + hctl.rsplit(":", 1)[0], hctl, "scsi_generic",
+                                   "sg{}".format(index))
+        os.makedirs(device_path)
+        if not os.path.exists(os.path.join(root, "scsi_generic")):
+            os.makedirs(os.path.join(root, "scsi_generic"))
+        os.symlink(device_path, os.path.join(root, "scsi_generic", "sg{}".format(index)))
+
+
+class ScsiTopologySnapshotTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        create_fake_sysfs(self.root, ["1:0:0:0", "1:0:0:1", "1:0:2:0", "1:1:0:0", "10:0:0:3"])
+        patcher = patch.object(getters, "SYSFS_CLASS_SCSI_DEVICE_PATH", self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _assert_topology(self):
+        self.assertEqual(getters.get_channels(1), set([0, 1]))
+        self.assertEqual(getters.get_targets(1, 0), set([0, 2]))
+        self.assertEqual(getters.get_luns(1, 0, 0), set([0, 1]))
+        self.assertEqual(getters.get_luns(10, 0, 0), set([3]))
+        self.assertEqual(getters.get_channels(2), set())
+        self.assertEqual(getters.get_luns(1, 0, 1), set())
+
+    def test_without_snapshot(self):
+        self._assert_topology()
+
+    def test_snapshot_lists_sysfs_once(self):
+        with patch.object(getters, "get_scsi_device_names_from_sysfs",
+                          wraps=getters.get_scsi_device_names_from_sysfs) as listing:
+            with getters.scsi_topology_snapshot():
+                self._assert_topology()
+                self._assert_topology()
+            self.assertEqual(listing.call_count, 1)
+
+    def test_refresh(self):
+        with getters.scsi_topology_snapshot():
+            self.assertEqual(getters.get_luns(1, 0, 2), set([0]))
+            create_fake_sysfs(self.root, ["1:0:2:5"])
+            self.assertEqual(getters.get_luns(1, 0, 2), set([0]))
+            getters.refresh_scsi_topology_snapshot()
+            self.assertEqual(getters.get_luns(1, 0, 2), set([0, 5]))
+
+
+class ProcScsiScsiAndScsiGenericTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        with open(os.path.join(self.root, "proc_scsi_scsi"), "w") as fd:
+            fd.write(PROC_SCSI_SCSI)
+        create_fake_scsi_generic(self.root, ["11:0:0:1", "1:0:0:1", "1:0:2:11"])
+        for name, value in (("PROC_SCSI_SCSI_PATH", os.path.join(self.root, "proc_scsi_scsi")),
+                            ("SYSFS_CLASS_SCSI_DEVICE_PATH", os.path.join(self.root, "scsi_device")),
+                            ("SYSFS_CLASS_SCSI_GENERIC_PATH", os.path.join(self.root, "scsi_generic"))):
+            patcher = patch.object(getters, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_parse_proc_scsi_scsi(self):
+        self.assertEqual(getters.parse_proc_scsi_scsi(PROC_SCSI_SCSI), set([(1, 0, 0, 0), (1, 0, 2, 11)]))
+
+    def _assert_devices(self):
+        self.assertTrue(getters.is_hctl_written_in_proc_scsi_scsi(1, 0, 2, 11))
+        self.assertFalse(getters.is_hctl_written_in_proc_scsi_scsi(1, 0, 2, 1))
+        self.assertEqual(getters.get_scsi_generic_device(1, 0, 0, 1), "sg1")
+        self.assertEqual(getters.get_scsi_generic_device(11, 0, 0, 1), "sg0")
+        self.assertEqual(getters.get_scsi_generic_device(1, 0, 2, 11), "sg2")
+        self.assertIsNone(getters.get_scsi_generic_device(1, 0, 2, 1))
+
+    def test_without_snapshot(self):
+        self._assert_devices()
+
+    def test_snapshot_reads_once(self):
+        with patch.object(getters, "get_proc_scsi_scsi", wraps=getters.get_proc_scsi_scsi) as proc_scsi_scsi, \
+             patch.object(getters, "build_scsi_generic_index", wraps=getters.build_scsi_generic_index) as index:
+            with getters.scsi_topology_snapshot():
+                self._assert_devices()
+                self._assert_devices()
+                getters.refresh_scsi_topology_snapshot()
+                self._assert_devices()
+            self.assertEqual((proc_scsi_scsi.call_count, index.call_count), (2, 2))
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from unittest import TestCase
+from mock import patch
+from contextlib import contextmanager
+from infi.storagemodel.linux.rescan_scsi_bus import scsi, workers
+from infi.storagemodel.linux.rescan_scsi_bus.utils import ScsiCommandFailed
+
+HUNG_SG_DEVICE = "sg-hung"
+FAILING_SG_DEVICE = "sg-failing"
+LOGGING_SG_DEVICE = "sg-logging"
+child_logger = logging.getLogger("test_rescan_workers.child")
+
+
+@contextmanager
+def fake_asi_context(sg_device):
+    if sg_device == FAILING_SG_DEVICE:
+        raise IOError("no such device")
+    yield sg_device
+
+
+def fake_sync_wait(command):
+    # cdb.execute(executer) is replaced by the tuple below, see FakeCommand
+    sg_device, name = command
+    if sg_device == HUNG_SG_DEVICE:
+        time.sleep(60)
+    if sg_device == LOGGING_SG_DEVICE:
+        child_logger.warning("{} on {}".format(name, sg_device))
+    return "{} on {}".format(name, sg_device)
+
+
+class FakeCommand(object):
+    def __init__(self, name):
+        self.name = name
+
+    def execute(self, executer):
+        return (executer, self.name)
+
+
+class DiscardingHandler(logging.Handler):
+    # unlike logging.NullHandler, it has a lock
+    def emit(self, record):
+        pass
+
+
+class ScsiCommandWorkerPoolTestCase(TestCase):
+    def setUp(self):
+        # the patches are inherited by the worker processes, since they are forked by the pool
+        for name, value in (("infi.storagemodel.linux.rescan_scsi_bus.scsi.asi_context", fake_asi_context),
+                            ("infi.asi.coroutines.sync_adapter.sync_wait", fake_sync_wait)):
+            patcher = patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_commands(self):
+        with workers.scsi_command_worker_pool(size=2) as pool:
+            self.assertIs(workers.get_current_pool(), pool)
+            results = [scsi.do_scsi_cdb("sg{}".format(index), FakeCommand("inquiry")) for index in range(5)]
+        self.assertEqual(results, ["inquiry on sg{}".format(index) for index in range(5)])
+        self.assertIsNone(workers.get_current_pool())
+        self.assertEqual(pool.replaced_worker_count, 0)
+
+    def test_failed_command(self):
+        with workers.scsi_command_worker_pool(size=1) as pool:
+            self.assertRaises(ScsiCommandFailed, scsi.do_scsi_cdb, FAILING_SG_DEVICE, FakeCommand("tur"))
+            self.assertEqual(scsi.do_scsi_cdb("sg1", FakeCommand("tur")), "tur on sg1")
+        self.assertEqual(pool.replaced_worker_count, 0)
+
+    def test_hung_worker_is_replaced(self):
+        with workers.scsi_command_worker_pool(size=1, timeout=0.5) as pool:
+            hung_worker = pool._idle_workers[0]
+            self.assertRaises(ScsiCommandFailed, scsi.do_scsi_cdb, HUNG_SG_DEVICE, FakeCommand("report luns"))
+            self.assertFalse(hung_worker.process.is_alive())
+            self.assertEqual(scsi.do_scsi_cdb("sg1", FakeCommand("report luns")), "report luns on sg1")
+        self.assertEqual(pool.replaced_worker_count, 1)
+
+    def test_replacement_does_not_inherit_held_logging_locks(self):
+        handler = DiscardingHandler()
+        child_logger.addHandler(handler)
+        self.addCleanup(child_logger.removeHandler, handler)
+        locked = threading.Event()
+
+        def log_slowly():
+            # a scanning thread that is in the middle of logging while the hung worker is replaced
+            handler.acquire()
+            try:
+                locked.set()
+                time.sleep(1)
+            finally:
+                handler.release()
+        thread = threading.Thread(target=log_slowly)
+        with workers.scsi_command_worker_pool(size=1, timeout=0.5) as pool:
+            thread.start()
+            locked.wait()
+            self.assertRaises(ScsiCommandFailed, scsi.do_scsi_cdb, HUNG_SG_DEVICE, FakeCommand("report luns"))
+            self.assertEqual(scsi.do_scsi_cdb(LOGGING_SG_DEVICE, FakeCommand("tur")), "tur on sg-logging")
+        thread.join()
+        self.assertEqual(pool.replaced_worker_count, 1)
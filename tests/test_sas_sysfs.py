@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from infi.storagemodel.linux.sas import SysfsSASTopology
+from infi.storagemodel.connectivity import ConnectivityFactoryImpl, SASConnectivity
+
+HOST_SAS_ADDRESS = "0x500605b0012345a0"
+EXPANDER_SAS_ADDRESS = "0x5003048001a2b3ff"
+
+
+def _write(path, content):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as fd:
+        fd.write(content + "\n")
+
+
+def _add_class_entry(root, class_name, name, device_path, **attributes):
+    path = os.path.join(root, "class", class_name, name)
+    os.makedirs(path)
+    os.symlink(device_path, os.path.join(path, "device"))
+    for key, value in attributes.items():
+        _write(os.path.join(path, key), value)
+
+
+def _add_phy(root, parent_path, name, sas_address, phy_identifier):
+    device_path = os.path.join(parent_path, name)
+    os.makedirs(device_path)
+    _add_class_entry(root, "sas_phy", name, device_path, sas_address=sas_address, phy_identifier=str(phy_identifier))
+    return device_path
+
+
+def _add_end_device(root, parent_path, name, hct, sas_address, bay_identifier):
+    device_path = os.path.join(parent_path, "port-" + name.split("-")[1], name)
+    os.makedirs(os.path.join(device_path, "target{}:{}:{}".format(*hct)))
+    _add_class_entry(root, "sas_device", name, device_path, sas_address=sas_address)
+    _write(os.path.join(root, "class", "sas_end_device", name, "bay_identifier"), str(bay_identifier))
+    _write(os.path.join(root, "class", "sas_end_device", name, "enclosure_identifier"), EXPANDER_SAS_ADDRESS)
+
+
+def create_fake_sysfs(root, end_devices_per_expander=3):
+    """host6 has a wide port of two phys to an expander, and a third phy attached directly to a disk"""
+    host_path = os.path.join(root, "devices", "pci0000:00", "host6")
+    port_path = os.path.join(host_path, "port-6:0")
+    os.makedirs(port_path)
+    for index in range(3):
+        phy_path = _add_phy(root, host_path, "phy-6:{}".format(index), HOST_SAS_ADDRESS, index)
+        if index < 2:
+            os.symlink(phy_path, os.path.join(port_path, "phy-6:{}".format(index)))
+    expander_path = os.path.join(port_path, "expander-6:0")
+    os.makedirs(expander_path)
+    _add_class_entry(root, "sas_device", "expander-6:0", expander_path, sas_address=EXPANDER_SAS_ADDRESS)
+    _add_class_entry(root, "sas_expander", "expander-6:0", expander_path)
+    for index in range(end_devices_per_expander):
+        _add_phy(root, expander_path, "phy-6:0:{}".format(index), EXPANDER_SAS_ADDRESS, index)
+        _add_end_device(root, expander_path, "end_device-6:0:{}".format(index), (6, 0, index),
+                        "0x5000c500{:08x}".format(index), index)
+    direct_port_path = os.path.join(host_path, "port-6:1")
+    os.makedirs(direct_port_path)
+    os.symlink(os.path.join(host_path, "phy-6:2"), os.path.join(direct_port_path, "phy-6:2"))
+    _add_end_device(root, host_path, "end_device-6:1", (6, 0, 100), "0x5000c500ffffffff", -1)
+
+
+class SysfsSASTopologyTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        create_fake_sysfs(self.root)
+        self.topology = SysfsSASTopology(self.root)
+
+    def test_end_devices(self):
+        mappings = self.topology.get_sas_hctl_mappings()
+        self.assertEqual(sorted(mappings), [(6, 0, 0), (6, 0, 1), (6, 0, 2), (6, 0, 100)])
+        end_device = mappings[(6, 0, 1)]
+        self.assertEqual(end_device.sas_address, "0x5000c50000000001")
+        self.assertEqual(end_device.bay_identifier, 1)
+        self.assertEqual(end_device.expander.sas_address, EXPANDER_SAS_ADDRESS)
+        self.assertEqual(len(end_device.expander.phys), 3)
+        self.assertEqual([phy.name for phy in end_device.host_phys], ["phy-6:0", "phy-6:1"])
+
+    def test_direct_attached(self):
+        end_device = self.topology.get_sas_hctl_mappings()[(6, 0, 100)]
+        self.assertIsNone(end_device.expander)
+        self.assertIsNone(end_device.bay_identifier)
+        self.assertEqual([phy.name for phy in end_device.host_phys], ["phy-6:2"])
+
+    def test_target_added_to_end_device(self):
+        # the target of an end device is added after its sas_device entry
+        _add_end_device(self.root, os.path.join(self.root, "devices", "pci0000:00", "host6"), "end_device-6:2",
+                        (6, 0, 101), "0x5000c500fffffffe", -1)
+        target_path = os.path.join(self.root, "devices", "pci0000:00", "host6", "port-6:2", "end_device-6:2",
+                                   "target6:0:101")
+        os.rmdir(target_path)
+        mappings = self.topology.get_sas_hctl_mappings()
+        self.assertNotIn((6, 0, 101), mappings)
+        self.assertIs(self.topology.get_sas_hctl_mappings(), mappings)
+        os.makedirs(target_path)
+        self.assertIn((6, 0, 101), self.topology.get_sas_hctl_mappings())
+
+    def test_unreadable_end_device(self):
+        os.remove(os.path.join(self.root, "class", "sas_device", "end_device-6:1", "device"))
+        self.assertNotIn((6, 0, 100), self.topology.get_sas_hctl_mappings())
+        os.symlink(os.path.join(self.root, "devices", "pci0000:00", "host6", "port-6:1", "end_device-6:1"),
+                   os.path.join(self.root, "class", "sas_device", "end_device-6:1", "device"))
+        self.assertIn((6, 0, 100), self.topology.get_sas_hctl_mappings())
+
+    def test_expanders(self):
+        expanders = self.topology.get_expanders()
+        self.assertEqual(list(expanders), [EXPANDER_SAS_ADDRESS])
+        self.assertEqual(len(expanders[EXPANDER_SAS_ADDRESS]), 3)
+
+    def test_connectivity_factory(self):
+        from infi.dtypes.hctl import HCTL
+
+        class Device(object):
+            def get_hctl(self):
+                return HCTL(6, 0, 2, 0)
+
+        factory = ConnectivityFactoryImpl()
+        factory.get_fc_hctl_mappings = lambda: {}
+        factory.set_sas_hctl_provider(self.topology)
+        connectivity = factory.get_by_device_with_hctl(Device())
+        self.assertIsInstance(connectivity, SASConnectivity)
+        self.assertEqual(connectivity.get_key(), ("500605b0012345a0", "5000c50000000002"))
+        self.assertEqual(connectivity.get_expander_sas_address(), EXPANDER_SAS_ADDRESS)
+        self.assertEqual(connectivity.get_bay_identifier(), 2)
@@ -0,0 +1,70 @@
+from unittest import TestCase
+from mock import Mock, patch
+from infi.asi.errors import AsiCheckConditionError, AsiRequestQueueFullError
+from infi.storagemodel.errors import check_for_scsi_errors, RescanIsNeeded
+from infi.storagemodel.errors import SCSIRetryPolicy, get_scsi_retry_policy, set_scsi_retry_policy
+
+
+def check_condition(sense_key, code_name):
+    sense_obj = Mock()
+    sense_obj.sense_key = sense_key
+    sense_obj.additional_sense_code.code_name = code_name
+    return AsiCheckConditionError('', sense_obj)
+
+
+class Device(object):
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    @check_for_scsi_errors
+    def get_scsi_test_unit_ready(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return True
+
+
+class SCSIRetryPolicyTestCase(TestCase):
+    def setUp(self):
+        self.previous = get_scsi_retry_policy()
+        set_scsi_retry_policy(SCSIRetryPolicy(backoff_in_seconds=0))
+
+    def tearDown(self):
+        set_scsi_retry_policy(self.previous)
+
+    def test_transient_unit_attention_is_retried(self):
+        device = Device([check_condition('UNIT_ATTENTION', 'ASYMMETRIC ACCESS STATE CHANGED')] * 2)
+        self.assertTrue(device.get_scsi_test_unit_ready())
+        self.assertEqual(device.calls, 3)
+
+    def test_queue_full_is_retried(self):
+        device = Device([AsiRequestQueueFullError()])
+        self.assertTrue(device.get_scsi_test_unit_ready())
+        self.assertEqual(device.calls, 2)
+
+    def test_retries_exhausted(self):
+        device = Device([check_condition('UNIT_ATTENTION', 'POWER ON OCCURRED')] * 10)
+        self.assertRaises(RescanIsNeeded, device.get_scsi_test_unit_ready)
+        self.assertEqual(device.calls, 4)
+
+    def test_invalidating_condition_is_not_retried(self):
+        device = Device([check_condition('UNIT_ATTENTION', 'REPORTED LUNS DATA HAS CHANGED')])
+        self.assertRaises(RescanIsNeeded, device.get_scsi_test_unit_ready)
+        self.assertEqual(device.calls, 1)
+
+    def test_unknown_condition_is_raised(self):
+        device = Device([check_condition('MEDIUM_ERROR', 'UNRECOVERED READ ERROR')])
+        self.assertRaises(AsiCheckConditionError, device.get_scsi_test_unit_ready)
+        self.assertEqual(device.calls, 1)
+
+    def test_backoff(self):
+        policy = SCSIRetryPolicy(backoff_in_seconds=0.1, backoff_multiplier=2, max_backoff_in_seconds=0.3)
+        self.assertEqual([policy.get_backoff_in_seconds(attempt) for attempt in (1, 2, 3)], [0.1, 0.2, 0.3])
+
+    @patch("infi.storagemodel.errors.sleep")
+    def test_sleeps_between_retries(self, sleep):
+        set_scsi_retry_policy(SCSIRetryPolicy(backoff_in_seconds=1, max_backoff_in_seconds=10))
+        device = Device([check_condition('UNIT_ATTENTION', 'POWER ON OCCURRED')] * 2)
+        device.get_scsi_test_unit_ready()
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2])
@@ -155,3 +155,6 @@ class SysfsTestCase(TestCase):
             self.assertEquals(disk_properties[block_dev]['queue_depth'], disk.get_queue_depth())
             self.assertEquals(disk_properties[block_dev]['sysfs_size'] * 512, disk.get_size_in_bytes())
             self.assertEquals(disk_properties[block_dev]['vendor'], disk.get_vendor())
+
+        self.assertEquals('sdf', sysfs.find_scsi_disk_by_hctl(HCTL.from_string('3:0:1:1')).get_block_device_name())
+        self.assertRaises(ValueError, sysfs.find_scsi_disk_by_hctl, HCTL.from_string('3:0:1:3'))
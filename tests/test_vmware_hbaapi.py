@@ -0,0 +1,36 @@
+from unittest import TestCase
+from mock import Mock, patch
+from infi.storagemodel.vmware.patches.hbaapi import HostSystemPortGenerator, PROPERTY_COLLECTOR_KEY, \
+    HBAAPI_PROPERTY_PATH, TOPOLOGY_PROPERTY_PATH
+from test_vmware_topology import DataObject, MOREF
+
+
+class HostFibreChannelHba(DataObject):
+    pass
+
+
+def create_properties(adapter_count, targets_per_adapter=2):
+    hbas, topologies = [], []
+    for index in range(adapter_count):
+        key = "key-vim.host.FibreChannelHba-vmhba{}".format(index)
+        hbas.append(HostFibreChannelHba(key=key, device="vmhba{}".format(index), portWorldWideName=0x2100000000000000L + index,
+                                        nodeWorldWideName=0x2000000000000000L + index, speed=8, portType="fabric",
+                                        status="online", model="model", driver="driver"))
+        targets = [DataObject(target=target, transport=DataObject(portWorldWideName=0x5742b0f000000000L + index * 16 + target,
+                                                                  nodeWorldWideName=0x5742b0f000000000L))
+                   for target in range(targets_per_adapter)]
+        targets.append(DataObject(target=targets_per_adapter, transport=DataObject(portWorldWideName=0)))
+        topologies.append(DataObject(adapter=key, target=targets))
+    return {HBAAPI_PROPERTY_PATH: hbas, TOPOLOGY_PROPERTY_PATH: list(reversed(topologies))}
+
+
+class HostSystemPortGeneratorTestCase(TestCase):
+    def test_remote_ports(self):
+        client = Mock()
+        client.facades = {PROPERTY_COLLECTOR_KEY: Mock()}
+        client.facades[PROPERTY_COLLECTOR_KEY].getProperties.return_value = {MOREF: create_properties(3)}
+        with patch.object(HostSystemPortGenerator, "_install_property_collector"):
+            ports = list(HostSystemPortGenerator(client, MOREF).iter_ports())
+        self.assertEqual([port.os_device_name for port in ports], ["vmhba0", "vmhba1", "vmhba2"])
+        self.assertEqual([remote_port.hct for remote_port in ports[2].discovered_ports], [("vmhba2", 0, 0), ("vmhba2", 0, 1)])
+        self.assertEqual(str(ports[1].discovered_ports[1].port_wwn), "5742b0f000000011")
@@ -0,0 +1,64 @@
+from unittest import TestCase
+from infi.storagemodel.vmware.patches.storagemodel import byte_array_to_string, number_to_ubint16_buffer, \
+    build_raw_vpd_pages, VMwareInquiryInformationMixin, VMwareInquiryPagesDict
+from test_vmware_topology import DataObject
+
+
+def instruct_byte_array_to_string(byte_array):
+    from infi.instruct import FixedSizeArray, Struct, SBInt8
+    class MyStruct(Struct):
+        _fields_ = [FixedSizeArray("byte_array", len(byte_array), SBInt8), ]
+    struct = MyStruct(byte_array=byte_array)
+    return struct.write_to_string(struct)
+
+
+def instruct_number_to_ubint16_buffer(number):
+    from infi.instruct import Struct, UBInt16
+    class MyStruct(Struct):
+        _fields_ = [UBInt16('number'), ]
+    struct = MyStruct(number=number)
+    return struct.write_to_string(struct)
+
+
+def to_signed_bytes(string):
+    return [ord(char) - 256 if ord(char) > 127 else ord(char) for char in string]
+
+
+def create_scsi_lun(serial="000004e2b0001"):
+    naa = "\x01\x03\x00\x10" + "\x67\x42\xb0\xf0\x00\x00\x4e\x2b\x00\x00\x00\x00\x00\x00\x00\x01"
+    alternate_names = [DataObject(namespace="GENERIC_VPD", namespaceId=5, data=to_signed_bytes("\x00\x00\x00\x03\x00\x80\x83")),
+                       DataObject(namespace="SERIALNUM", namespaceId=6, data=to_signed_bytes(serial + "\x00\x00")),
+                       DataObject(namespace="NAA", namespaceId=1, data=to_signed_bytes(naa))]
+    return DataObject(alternateName=alternate_names)
+
+
+class Device(VMwareInquiryInformationMixin):
+    def __init__(self, scsi_lun_data_object):
+        self._scsi_lun_data_object = scsi_lun_data_object
+
+
+class ByteConversionTestCase(TestCase):
+    def test_byte_array_to_string(self):
+        for byte_array in ([], [0], [-128, -1, 0, 1, 127], range(-128, 128)):
+            self.assertEqual(byte_array_to_string(byte_array), instruct_byte_array_to_string(byte_array))
+
+    def test_number_to_ubint16_buffer(self):
+        for number in (0, 1, 0x83, 0x100, 0xffff):
+            self.assertEqual(number_to_ubint16_buffer(number), instruct_number_to_ubint16_buffer(number))
+
+
+class RawVPDPagesTestCase(TestCase):
+    def setUp(self):
+        self.device = Device(create_scsi_lun())
+
+    def test_raw_pages(self):
+        pages = build_raw_vpd_pages(self.device._scsi_lun_data_object)
+        self.assertEqual(sorted(pages.keys()), [0x00, 0x80, 0x83])
+        self.assertEqual(pages[0x80], "\x00\x80\x00\x0d000004e2b0001")
+        self.assertEqual(pages[0x83][:4], "\x00\x83\x00\x14")
+        self.assertEqual(len(pages[0x83]), 4 + 0x14)
+
+    def test_raw_pages_are_built_once(self):
+        self.assertIs(self.device._get_raw_vpd_pages(), self.device._get_raw_vpd_pages())
+        pages = VMwareInquiryPagesDict({0x80: None}, self.device._scsi_lun_data_object, self.device._get_raw_vpd_pages())
+        self.assertIs(pages._get_dict_of_vpd_pages_and_their_raw_buffer(), self.device._get_raw_vpd_pages())
@@ -0,0 +1,151 @@
+from copy import deepcopy
+from unittest import TestCase
+from mock import patch, Mock
+from infi.dtypes.hctl import HCTL
+from infi.storagemodel.vmware.patches.storagemodel import VMwareHostStorageModel, SCSI_TOPOLOGY_PROPERTY_PATH, \
+    SCSI_LUNS_PROPERTY_PATH, MULTIPATH_TOPOLOGY_PROPERTY_PATH, PROPERTY_COLLECTOR_KEY
+from test_vmware_topology import DataObject, MOREF, create_properties, create_client
+
+
+class FakePropertyCollector(object):
+    """replays recorded WaitForUpdatesEx update sets on a model"""
+    def __init__(self, model):
+        self.model = model
+        self.version = 0
+
+    def replay(self, *change_sets):
+        for changes in change_sets:
+            self.version += 1
+            object_update = DataObject(kind="modify", obj=DataObject(_type="HostSystem", value=MOREF.split(":")[1]),
+                                       changeSet=changes)
+            update_set = DataObject(version=str(self.version), filterSet=[DataObject(objectSet=[object_update])])
+            self.model.apply_property_updates(update_set)
+
+
+def change(name, op, val=None):
+    return DataObject(name=name, op=op, val=val)
+
+
+class PropertyUpdatesTestCase(TestCase):
+    def setUp(self):
+        self.properties = create_properties(3)
+        # the fourth LUN is mapped later on
+        self.recorded = create_properties(4)
+        for adapter in self.properties[SCSI_TOPOLOGY_PROPERTY_PATH].adapter:
+            for target in adapter.target:
+                del target.lun[3:]
+        with patch.object(VMwareHostStorageModel, "_install_property_collector"):
+            self.model = VMwareHostStorageModel(create_client(self.properties), MOREF)
+        self.collector = FakePropertyCollector(self.model)
+        self.multipath = self.model.get_native_multipath()
+
+    def _get_paths(self, device):
+        return [(path.get_path_id(), path.get_hctl()) for path in device.get_paths()]
+
+    def test_new_lun(self):
+        devices = self.multipath.get_all_multipath_block_devices()
+        paths = devices[0].get_paths()
+        scsi_lun = self.recorded[SCSI_LUNS_PROPERTY_PATH][3]
+        logical_unit = self.recorded[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[3]
+        adapter = self.recorded[SCSI_TOPOLOGY_PROPERTY_PATH].adapter[0]
+        self.collector.replay([change('{}["{}"]'.format(SCSI_LUNS_PROPERTY_PATH, scsi_lun.key), "add", scsi_lun),
+                               change('{}.lun["{}"]'.format(MULTIPATH_TOPOLOGY_PROPERTY_PATH, logical_unit.key), "add",
+                                      logical_unit),
+                               change('{}.adapter["{}"]'.format(SCSI_TOPOLOGY_PROPERTY_PATH, adapter.key), "assign",
+                                      adapter)])
+        updated_devices = self.multipath.get_all_multipath_block_devices()
+        self.assertEqual(len(updated_devices), 4)
+        self.assertEqual(updated_devices[:3], devices)
+        self.assertIs(updated_devices[0].get_paths()[0], paths[0])
+        # only vmhba2 was updated so far
+        self.assertEqual(updated_devices[3].get_paths()[0].get_hctl(), HCTL("vmhba2", 0, 0, 4))
+        self.assertEqual(len(self.multipath.get_scsi_topology_index()), 28)
+
+    def test_path_removed(self):
+        devices = self.multipath.get_all_multipath_block_devices()
+        paths = devices[0].get_paths()
+        logical_unit = deepcopy(self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[1])
+        del logical_unit.path[0]
+        self.collector.replay([change('{}.lun["{}"]'.format(MULTIPATH_TOPOLOGY_PROPERTY_PATH, logical_unit.key),
+                                      "assign", logical_unit)])
+        self.assertEqual(self.multipath.get_all_multipath_block_devices(), devices)
+        self.assertEqual([path.get_hctl() for path in devices[1].get_paths()],
+                         [HCTL("vmhba2", 0, 1, 2), HCTL("vmhba3", 0, 0, 2), HCTL("vmhba3", 0, 1, 2)])
+        self.assertIs(devices[0].get_paths()[0], paths[0])
+
+    def test_path_removed_from_indexes(self):
+        device = self.multipath.get_all_multipath_block_devices()[1]
+        scsi_device = Mock()
+        scsi_device.get_hctl.return_value = HCTL("vmhba2", 0, 0, 2)
+        self.assertIs(self.multipath.get_owner(scsi_device), device)
+        logical_unit = deepcopy(self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[1])
+        del logical_unit.path[0]
+        self.collector.replay([change('{}.lun["{}"]'.format(MULTIPATH_TOPOLOGY_PROPERTY_PATH, logical_unit.key),
+                                      "assign", logical_unit)])
+        self.assertIs(self.multipath.get_owner(scsi_device), None)
+        self.assertEqual(self.multipath.filter_non_multipath_scsi_block_devices([scsi_device]), [])
+
+    def test_lun_capacity(self):
+        for scsi_lun in self.properties[SCSI_LUNS_PROPERTY_PATH]:
+            scsi_lun.capacity = DataObject(block=2048, blockSize=512)
+        devices = self.multipath.get_all_multipath_block_devices()
+        self.assertEqual(devices[1].get_size_in_bytes(), 1024 * 1024)
+        block_access_path = devices[1].get_block_access_path()
+        self.assertIs(self.multipath.find_multipath_device_by_block_access_path(block_access_path), devices[1])
+        scsi_lun = self.properties[SCSI_LUNS_PROPERTY_PATH][1]
+        self.collector.replay([change('{}["{}"].capacity'.format(SCSI_LUNS_PROPERTY_PATH, scsi_lun.key), "assign",
+                                      DataObject(block=4096, blockSize=512))])
+        updated_devices = self.multipath.get_all_multipath_block_devices()
+        self.assertIs(updated_devices[0], devices[0])
+        self.assertIsNot(updated_devices[1], devices[1])
+        self.assertEqual(updated_devices[1].get_size_in_bytes(), 2 * 1024 * 1024)
+        self.assertIs(self.multipath.find_multipath_device_by_block_access_path(block_access_path), updated_devices[1])
+
+    def test_path_state(self):
+        device = self.multipath.get_all_multipath_block_devices()[2]
+        self.assertEqual(device.get_paths()[1].get_state(), "active")
+        name = '{}.lun["{}"].path["{}"]'.format(MULTIPATH_TOPOLOGY_PROPERTY_PATH,
+                                                self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[2].key,
+                                                self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[2].path[1].key)
+        path = deepcopy(self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[2].path[1])
+        path.state = "dead"
+        self.collector.replay([change(name, "assign", path)])
+        self.assertEqual(device.get_paths()[1].get_state(), "dead")
+
+    def test_lun_removed(self):
+        devices = self.multipath.get_all_multipath_block_devices()
+        scsi_lun = self.properties[SCSI_LUNS_PROPERTY_PATH][1]
+        self.collector.replay([change('{}["{}"]'.format(SCSI_LUNS_PROPERTY_PATH, scsi_lun.key), "remove")])
+        self.assertEqual(self.multipath.get_all_multipath_block_devices(), [devices[0], devices[2]])
+
+    def test_other_host(self):
+        devices = self.multipath.get_all_multipath_block_devices()
+        object_update = DataObject(obj="HostSystem:host-2", changeSet=[change(SCSI_LUNS_PROPERTY_PATH, "assign", [])])
+        self.model.apply_property_updates(DataObject(filterSet=[DataObject(objectSet=[object_update])]))
+        self.assertEqual(self.multipath.get_all_multipath_block_devices(), devices)
+
+    def test_missing_element(self):
+        devices = self.multipath.get_all_multipath_block_devices()
+        # the property collector fetches the properties of a host that is not in its cache
+        cached_properties = self.model._client.facades[PROPERTY_COLLECTOR_KEY].getProperties.return_value
+        fetched_properties = deepcopy(self.properties)
+        fetched_properties[SCSI_LUNS_PROPERTY_PATH][1].capacity = DataObject(block=4096, blockSize=512)
+
+        def get_properties():
+            cached_properties.setdefault(MOREF, fetched_properties)
+            return cached_properties
+        self.model._client.facades[PROPERTY_COLLECTOR_KEY].getProperties.side_effect = get_properties
+        logical_unit_key = self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[1].key
+        scsi_lun = self.properties[SCSI_LUNS_PROPERTY_PATH][1]
+        self.collector.replay([change('{}.lun["missing"].path["missing"]'.format(MULTIPATH_TOPOLOGY_PROPERTY_PATH),
+                                      "assign", DataObject(key="missing")),
+                               change('{}.lun["{}"].path["missing"]'.format(MULTIPATH_TOPOLOGY_PROPERTY_PATH,
+                                                                            logical_unit_key), "remove"),
+                               change('{}["{}"].capacity'.format(SCSI_LUNS_PROPERTY_PATH, scsi_lun.key), "assign",
+                                      DataObject(block=4096, blockSize=512))])
+        updated_devices = self.multipath.get_all_multipath_block_devices()
+        self.assertEqual(len(updated_devices), 3)
+        self.assertIsNot(updated_devices[0], devices[0])
+        self.assertIs(updated_devices[1]._scsi_lun_data_object, fetched_properties[SCSI_LUNS_PROPERTY_PATH][1])
+        self.assertEqual([path.get_hctl() for path in updated_devices[1].get_paths()],
+                         [path.get_hctl() for path in devices[1].get_paths()])
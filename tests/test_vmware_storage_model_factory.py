@@ -0,0 +1,169 @@
+import threading
+import time
+from unittest import TestCase
+from mock import patch
+from infi.storagemodel.vmware.patches.storagemodel import StorageModelFactory, VMwareHostStorageModel, \
+    collect_from_hosts, get_approximate_size_in_bytes
+from test_vmware_topology import DataObject, create_properties, create_client
+
+
+def create_hostsystem(value, lun_count=2):
+    client = create_client(create_properties(lun_count))
+    properties = client.facades.values()[0].getProperties.return_value.values()[0]
+    client.facades.values()[0].getProperties.return_value = {"HostSystem:{}".format(value): properties}
+    return DataObject(ref=DataObject(value=value), core=client)
+
+
+def get_cached_properties(hostsystem):
+    return hostsystem.core.facades.values()[0].getProperties.return_value
+
+
+class StorageModelFactoryTestCase(TestCase):
+    def setUp(self):
+        patcher = patch.object(VMwareHostStorageModel, "_install_property_collector")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(StorageModelFactory.clear)
+        for attribute in ("max_models", "max_memory_in_bytes", "max_concurrent_builds"):
+            self.addCleanup(setattr, StorageModelFactory, attribute, getattr(StorageModelFactory, attribute))
+        StorageModelFactory.clear()
+        self.hosts = dict((value, create_hostsystem(value)) for value in ("host-1", "host-2", "host-3", "host-4"))
+
+    def test_same_model_for_host(self):
+        self.assertIs(StorageModelFactory.create(self.hosts["host-1"]), StorageModelFactory.create(self.hosts["host-1"]))
+
+    def test_lru_eviction(self):
+        StorageModelFactory.max_models = 2
+        StorageModelFactory.create(self.hosts["host-1"])
+        StorageModelFactory.create(self.hosts["host-2"])
+        StorageModelFactory.create(self.hosts["host-1"])
+        StorageModelFactory.create(self.hosts["host-3"])
+        self.assertEqual(list(StorageModelFactory.models_by_host_value), ["host-1", "host-3"])
+
+    def test_models_in_use_are_not_evicted(self):
+        StorageModelFactory.max_models = 1
+        StorageModelFactory.set(StorageModelFactory.create(self.hosts["host-1"]))
+        try:
+            StorageModelFactory.create(self.hosts["host-2"])
+            self.assertEqual(sorted(StorageModelFactory.models_by_host_value), ["host-1", "host-2"])
+        finally:
+            StorageModelFactory.set(None)
+
+    def test_memory_limit(self):
+        StorageModelFactory.create(self.hosts["host-3"])
+        StorageModelFactory.build([self.hosts["host-1"], self.hosts["host-2"]])
+        memory_usage = StorageModelFactory.get_memory_usage()
+        # only the models that were built are measured, and the host's properties are part of the footprint
+        self.assertEqual(sorted(memory_usage), ["host-1", "host-2"])
+        properties = get_cached_properties(self.hosts["host-1"])["HostSystem:host-1"]
+        self.assertTrue(memory_usage["host-1"] > get_approximate_size_in_bytes(properties))
+        StorageModelFactory.max_memory_in_bytes = memory_usage["host-1"] + memory_usage["host-2"] - 1
+        with patch("infi.storagemodel.vmware.patches.storagemodel.get_approximate_size_in_bytes") as measure:
+            StorageModelFactory.create(self.hosts["host-2"])
+        self.assertFalse(measure.called)
+        self.assertEqual(list(StorageModelFactory.models_by_host_value), ["host-3", "host-2"])
+        self.assertEqual(sorted(StorageModelFactory.get_memory_usage()), ["host-2"])
+        # the properties of the evicted host are released from the cache of the property collector
+        self.assertEqual(get_cached_properties(self.hosts["host-1"]), {})
+        self.assertIn("HostSystem:host-2", get_cached_properties(self.hosts["host-2"]))
+
+    def test_suds_types_are_not_measured(self):
+        schema = dict((index, "type-{}".format(index)) for index in range(1000))
+        data_objects = [DataObject(key="key-{}".format(index), __metadata__=DataObject(sxtype=schema))
+                        for index in range(2)]
+        self.assertTrue(get_approximate_size_in_bytes(data_objects) < get_approximate_size_in_bytes(schema))
+
+    def test_max_depth(self):
+        nested = [[[["leaf" * 1000]]]]
+        self.assertTrue(get_approximate_size_in_bytes(nested, max_depth=2) < 4000)
+        self.assertTrue(get_approximate_size_in_bytes(nested) > 4000)
+
+    def test_build_concurrency(self):
+        state = dict(running=0, max_running=0)
+        lock = threading.Lock()
+
+        def build(model):
+            with lock:
+                state["running"] += 1
+                state["max_running"] = max(state["max_running"], state["running"])
+            time.sleep(0.05)
+            with lock:
+                state["running"] -= 1
+            return model
+
+        with patch.object(StorageModelFactory, "_build", staticmethod(build)):
+            models = StorageModelFactory.build(self.hosts.values(), concurrency=2)
+        self.assertEqual(len(models), 4)
+        self.assertEqual(state["max_running"], 2)
+
+    def test_refresh_hot_models(self):
+        models = StorageModelFactory.build(self.hosts.values())
+        StorageModelFactory.hits_by_host_value.clear()
+        StorageModelFactory.create(self.hosts["host-3"])
+        StorageModelFactory.create(self.hosts["host-3"])
+        StorageModelFactory.create(self.hosts["host-2"])
+        devices = [model.get_native_multipath().get_all_multipath_block_devices() for model in models]
+        refreshed = StorageModelFactory.refresh_hot_models(1)
+        self.assertEqual(refreshed, [StorageModelFactory.models_by_host_value["host-3"]])
+        for model, model_devices in zip(models, devices):
+            changed = model.get_native_multipath().get_all_multipath_block_devices() is not model_devices
+            self.assertEqual(changed, model is refreshed[0])
+
+
+def set_latency(hostsystem, latency):
+    facade = hostsystem.core.facades.values()[0]
+    properties = facade.getProperties.return_value
+
+    def get_properties():
+        time.sleep(latency)
+        return properties
+    facade.getProperties.side_effect = get_properties
+
+
+def get_device_count(model):
+    return len(model.get_native_multipath().get_all_multipath_block_devices())
+
+
+class CollectFromHostsTestCase(TestCase):
+    def setUp(self):
+        import infi.storagemodel
+        from infi.pyutils.patch import unmonkey_patch
+        patcher = patch.object(VMwareHostStorageModel, "_install_property_collector")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(unmonkey_patch, infi.storagemodel, "get_storage_model")
+        self.addCleanup(StorageModelFactory.clear)
+        StorageModelFactory.clear()
+        self.hosts = [create_hostsystem("host-{}".format(index), lun_count=index + 1) for index in range(4)]
+
+    def test_results(self):
+        results = list(collect_from_hosts(self.hosts, get_device_count, concurrency=2))
+        self.assertEqual(sorted((result.hostsystem.ref.value, result.value, result.error) for result in results),
+                         [("host-0", 1, None), ("host-1", 2, None), ("host-2", 3, None), ("host-3", 4, None)])
+
+    def test_slow_host_does_not_block_the_others(self):
+        set_latency(self.hosts[0], 0.3)
+        for hostsystem in self.hosts[1:]:
+            set_latency(hostsystem, 0.01)
+        results = collect_from_hosts(self.hosts, get_device_count, concurrency=2)
+        self.assertEqual([result.hostsystem.ref.value for result in results], ["host-1", "host-2", "host-3", "host-0"])
+
+    def test_models_are_measured(self):
+        self.addCleanup(setattr, StorageModelFactory, "max_memory_in_bytes", StorageModelFactory.max_memory_in_bytes)
+        list(collect_from_hosts(self.hosts[:2], get_device_count))
+        list(collect_from_hosts(self.hosts[2:], lambda model: None))
+        # models whose devices were not fetched are not measured
+        self.assertEqual(sorted(StorageModelFactory.get_memory_usage()), ["host-0", "host-1"])
+        properties = get_cached_properties(self.hosts[1])["HostSystem:host-1"]
+        self.assertTrue(StorageModelFactory.get_memory_usage()["host-1"] > get_approximate_size_in_bytes(properties))
+        StorageModelFactory.max_memory_in_bytes = 1
+        list(collect_from_hosts(self.hosts[2:3], get_device_count))
+        self.assertEqual(list(StorageModelFactory.models_by_host_value), ["host-3", "host-2"])
+        self.assertEqual(sorted(StorageModelFactory.get_memory_usage()), ["host-2"])
+
+    def test_failing_host(self):
+        self.hosts[1].core.facades.values()[0].getProperties.side_effect = RuntimeError()
+        results = dict((result.hostsystem.ref.value, result) for result in
+                       collect_from_hosts(self.hosts, get_device_count))
+        self.assertIsInstance(results["host-1"].error, RuntimeError)
+        self.assertEqual(results["host-3"].value, 4)
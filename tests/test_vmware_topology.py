@@ -0,0 +1,139 @@
+from unittest import TestCase
+from mock import Mock
+from infi.dtypes.hctl import HCTL
+from infi.storagemodel.errors import RescanIsNeeded
+from infi.storagemodel.vmware.patches.storagemodel import VMwareNativeMultipathModel, VMwarePath, \
+    PROPERTY_COLLECTOR_KEY, SCSI_TOPOLOGY_PROPERTY_PATH, SCSI_LUNS_PROPERTY_PATH, MULTIPATH_TOPOLOGY_PROPERTY_PATH
+
+MOREF = "HostSystem:host-1"
+
+
+class DataObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def get_lun_key(index):
+    return "02000200006742b0f000004e2b{:016x}496e66696e69".format(index)
+
+
+def create_properties(lun_count, vmhbas=("vmhba2", "vmhba3"), targets_per_adapter=2):
+    """:returns: a synthetic property collector payload, with a path to every LUN through every target"""
+    adapters = []
+    paths = dict((index, []) for index in range(lun_count))
+    for vmhba in vmhbas:
+        targets = []
+        for target_index in range(targets_per_adapter):
+            port_wwn = 0x5742b0f000004e00 + len(adapters) * 16 + target_index
+            luns = [DataObject(lun=index + 1, scsiLun="key-vim.host.ScsiLun-{}".format(get_lun_key(index)))
+                    for index in range(lun_count)]
+            targets.append(DataObject(target=target_index, transport=DataObject(portWorldWideName=port_wwn), lun=luns))
+            for index in range(lun_count):
+                paths[index].append(DataObject(name="{}:C0:T{}:L{}".format(vmhba, target_index, index + 1),
+                                               adapter="key-vim.host.FibreChannelHba-{}".format(vmhba),
+                                               transport=DataObject(portWorldWideName=port_wwn), state="active",
+                                               key="key-vim.host.MultipathInfo.Path-{}-{}-{}".format(vmhba, target_index, index)))
+        adapters.append(DataObject(key="key-vim.host.ScsiTopology.Interface-{}".format(vmhba), target=targets))
+    scsi_luns = [DataObject(key="key-vim.host.ScsiDisk-{}".format(get_lun_key(index)), deviceType="disk",
+                            operationalState=["ok"], alternateName=[Mock()], displayName="LUN {}".format(index),
+                            devicePath="/vmfs/devices/disks/naa.6742b0f000004e2b{:016x}".format(index))
+                 for index in range(lun_count)]
+    multipath_luns = [DataObject(key="key-vim.host.MultipathInfo.LogicalUnit-{}".format(get_lun_key(index)),
+                                 lun=scsi_lun.key, path=paths[index]) for index, scsi_lun in enumerate(scsi_luns)]
+    return {SCSI_TOPOLOGY_PROPERTY_PATH: DataObject(adapter=adapters),
+            SCSI_LUNS_PROPERTY_PATH: scsi_luns,
+            MULTIPATH_TOPOLOGY_PROPERTY_PATH: DataObject(lun=multipath_luns)}
+
+
+def create_client(properties):
+    client = Mock()
+    client.facades = {PROPERTY_COLLECTOR_KEY: Mock()}
+    client.facades[PROPERTY_COLLECTOR_KEY].getProperties.return_value = {MOREF: properties}
+    return client
+
+
+class ScsiTopologyIndexTestCase(TestCase):
+    def setUp(self):
+        self.properties = create_properties(3)
+        self.model = VMwareNativeMultipathModel(create_client(self.properties), MOREF)
+
+    def test_hctls(self):
+        [first, _, third] = self.model.get_all_multipath_block_devices()
+        self.assertEqual([path.get_hctl() for path in third.get_paths()],
+                         [HCTL("vmhba2", 0, 0, 3), HCTL("vmhba2", 0, 1, 3), HCTL("vmhba3", 0, 0, 3), HCTL("vmhba3", 0, 1, 3)])
+        self.assertEqual(first.get_paths()[0].get_hctl(), HCTL("vmhba2", 0, 0, 1))
+
+    def test_index_is_built_once(self):
+        for device in self.model.get_all_multipath_block_devices():
+            [path.get_hctl() for path in device.get_paths()]
+        # an entry by the transport key and an entry by the target number for each of the 12 paths
+        self.assertEqual(len(self.model.get_scsi_topology_index()), 24)
+        self.assertIs(self.model.get_scsi_topology_index(), self.model.get_scsi_topology_index())
+
+    def test_path_without_model(self):
+        device = self.model.get_all_multipath_block_devices()[1]
+        path_data_object = self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[1].path[3]
+        path = VMwarePath(self.model._client, MOREF, device._scsi_lun_data_object.key, path_data_object)
+        self.assertEqual(path.get_hctl(), HCTL("vmhba3", 0, 1, 2))
+
+    def test_missing_target(self):
+        path_data_object = self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[0].path[0]
+        path_data_object.transport = DataObject(portWorldWideName=0)
+        device = self.model.get_all_multipath_block_devices()[0]
+        self.assertRaises(RescanIsNeeded, device.get_paths()[0].get_hctl)
+
+
+class NonFibreChannelTopologyTestCase(TestCase):
+    def _create_model(self, target_transports, path_transports, path_names):
+        properties = create_properties(1, vmhbas=("vmhba33",), targets_per_adapter=2)
+        [adapter] = properties[SCSI_TOPOLOGY_PROPERTY_PATH].adapter
+        for target, transport in zip(adapter.target, target_transports):
+            target.transport = transport
+        [logical_unit] = properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun
+        for path, transport, name in zip(logical_unit.path, path_transports, path_names):
+            path.adapter = "key-vim.host.InternetScsiHba-vmhba33"
+            path.transport = transport
+            path.name = name
+        return VMwareNativeMultipathModel(create_client(properties), MOREF)
+
+    def _get_hctls(self, model):
+        [device] = model.get_all_multipath_block_devices()
+        return [path.get_hctl() for path in device.get_paths()]
+
+    def test_iscsi_targets(self):
+        transports = [DataObject(iScsiName="iqn.2009-11.com.infinidat:storage:infinibox-sn-1-{}".format(index),
+                                 address=["10.0.0.{}:3260".format(index)]) for index in range(2)]
+        names = ["iqn.1998-01.com.vmware:esx-1,{},t,1-naa.6742b0f".format(transport.iScsiName)
+                 for transport in transports]
+        model = self._create_model(transports, transports, names)
+        self.assertEqual(self._get_hctls(model), [HCTL("vmhba33", 0, 0, 1), HCTL("vmhba33", 0, 1, 1)])
+
+    def test_iscsi_targets_with_the_same_name(self):
+        # the same iSCSI target through two portals is two targets of the adapter
+        transports = [DataObject(iScsiName="iqn.2009-11.com.infinidat:storage:infinibox-sn-1",
+                                 address=["10.0.0.{}:3260".format(index)]) for index in range(2)]
+        model = self._create_model(transports, transports, ["vmhba33:C0:T0:L1", "vmhba33:C0:T1:L1"])
+        self.assertEqual(self._get_hctls(model), [HCTL("vmhba33", 0, 0, 1), HCTL("vmhba33", 0, 1, 1)])
+
+    def test_transports_without_identity(self):
+        transports = [DataObject(), DataObject()]
+        model = self._create_model(transports, transports, ["vmhba33:C0:T0:L1", "vmhba33:C0:T1:L1"])
+        self.assertEqual(self._get_hctls(model), [HCTL("vmhba33", 0, 0, 1), HCTL("vmhba33", 0, 1, 1)])
+        model = self._create_model(transports, transports, ["sas.5000-sas.5001-naa.6742", "sas.5000-sas.5002-naa.6742"])
+        self.assertRaises(RescanIsNeeded, self._get_hctls, model)
+
+
+class LogicalUnitIndexTestCase(TestCase):
+    def setUp(self):
+        self.properties = create_properties(3)
+        self.model = VMwareNativeMultipathModel(create_client(self.properties), MOREF)
+
+    def test_logical_units(self):
+        logical_units = self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun
+        devices = self.model.get_all_multipath_block_devices()
+        self.assertEqual([device._get_multipath_logical_unit() for device in devices], logical_units)
+        self.assertIs(self.model.get_logical_unit_index(), self.model.get_logical_unit_index())
+
+    def test_device_without_paths(self):
+        del self.properties[MULTIPATH_TOPOLOGY_PROPERTY_PATH].lun[1]
+        self.assertEqual(self.model.get_all_multipath_block_devices()[1].get_paths(), [])